@@ -1,19 +1,32 @@
 #include <WiFi.h>
 #include <HTTPClient.h>
-#include <ArduinoJson.h>
 
 const char* ssid = "Wokwi-GUEST";
 const char* password = "";
 
-const char* serverUrl = "http://192.****/get_device_states";
+const char* serverUrl = "http://192.****/device_states/changes";
 
 #define LED_KITCHEN  2
 #define LED_BATHROOM 4
 #define LED_ROOM1    5
 #define LED_ROOM2    18
 
-unsigned long lastTime = 0;
-const long timerDelay = 5000;
+// Binary state format (state_codec.py); GET /device_states/schema lists every bit and offset.
+const char* stateMimetype = "application/vnd.jarvis.state";
+const uint8_t stateMagic = 0x4A;
+const uint8_t stateSchemaVersion = 1;
+const uint16_t stateLayoutId = 27199;  // layout_id from /device_states/schema; changes when devices are added
+const int stateHeaderSize = 8;
+// State bits of the lamps, in layout order.
+const int BIT_KITCHEN = 0;
+const int BIT_BATHROOM = 1;
+const int BIT_ROOM1 = 2;
+const int BIT_ROOM2 = 3;
+
+// Last state version received; -1 means we have nothing yet and need the full state.
+long lastVersion = -1;
+const long retryDelay = 2000;
+const int longPollTimeoutS = 25;
 void setup() {
   Serial.begin(115200);
 
@@ -33,48 +46,65 @@ void setup() {
   Serial.println(WiFi.localIP());
 }
 
+bool stateBit(const uint8_t* packet, int bit) {
+  return packet[stateHeaderSize + bit / 8] & (1 << (bit % 8));
+}
+
 void loop() {
-  if ((millis() - lastTime) > timerDelay) {
-    if (WiFi.status() == WL_CONNECTED) {
-      HTTPClient http;
-
-      Serial.println("Requesting device states from server...");
-      http.begin(serverUrl);
-      int httpResponseCode = http.GET();
-
-      if (httpResponseCode > 0) {
-        Serial.printf("HTTP Response code: %d\n", httpResponseCode);
-        String payload = http.getString();
-        Serial.println(payload);
-
-        DynamicJsonDocument doc(1024);
-        DeserializationError error = deserializeJson(doc, payload);
-
-        if (error) {
-          Serial.print("deserializeJson() failed: ");
-          Serial.println(error.c_str());
-          return;
-        }
-
-        const char* kitchen_light = doc["lights"]["kitchen"]; // "on" or "off"
-        const char* bathroom_light = doc["lights"]["bathroom"];
-        const char* room1_light = doc["lights"]["room1"];
-        const char* room2_light = doc["lights"]["room2"];
-
-        digitalWrite(LED_KITCHEN,  strcmp(kitchen_light, "on") == 0 ? HIGH : LOW);
-        digitalWrite(LED_BATHROOM, strcmp(bathroom_light, "on") == 0 ? HIGH : LOW);
-        digitalWrite(LED_ROOM1,    strcmp(room1_light, "on") == 0 ? HIGH : LOW);
-        digitalWrite(LED_ROOM2,    strcmp(room2_light, "on") == 0 ? HIGH : LOW);
-
-        Serial.println("LEDs updated successfully!");
-
-      } else {
-        Serial.printf("Error code: %d\n", httpResponseCode);
-      }
-      http.end();
-    } else {
-      Serial.println("WiFi Disconnected");
-    }
-    lastTime = millis();
+  if (WiFi.status() != WL_CONNECTED) {
+    Serial.println("WiFi Disconnected");
+    delay(retryDelay);
+    return;
+  }
+
+  HTTPClient http;
+  String url = String(serverUrl) + "?timeout=" + longPollTimeoutS;
+  if (lastVersion >= 0) {
+    url += "&since=" + String(lastVersion);
   }
-}
\ No newline at end of file
+
+  // The server holds the request until something changes, so allow a bit more than its timeout.
+  http.setTimeout((longPollTimeoutS + 5) * 1000);
+  http.begin(url);
+  http.addHeader("Accept", stateMimetype);
+  int httpResponseCode = http.GET();
+
+  if (httpResponseCode == 304) {
+    // Nothing changed during the poll window; ask again straight away.
+    http.end();
+    return;
+  }
+
+  if (httpResponseCode != 200) {
+    Serial.printf("Error code: %d\n", httpResponseCode);
+    http.end();
+    delay(retryDelay);
+    return;
+  }
+
+  // The whole house fits in a few bytes, so the packet is read into a fixed buffer: no JSON
+  // document to allocate and nothing to parse.
+  uint8_t packet[64];
+  int length = http.getStream().readBytes(packet, min(http.getSize(), (int) sizeof(packet)));
+  http.end();
+
+  if (length < stateHeaderSize + 1 || packet[0] != stateMagic || packet[1] != stateSchemaVersion) {
+    Serial.println("Unexpected state packet");
+    delay(retryDelay);
+    return;
+  }
+  uint16_t layoutId = packet[6] | (packet[7] << 8);
+  if (layoutId != stateLayoutId) {
+    Serial.printf("Device layout changed on the server (id %u); update the state bits in this sketch\n", layoutId);
+    delay(retryDelay);
+    return;
+  }
+
+  digitalWrite(LED_KITCHEN, stateBit(packet, BIT_KITCHEN) ? HIGH : LOW);
+  digitalWrite(LED_BATHROOM, stateBit(packet, BIT_BATHROOM) ? HIGH : LOW);
+  digitalWrite(LED_ROOM1, stateBit(packet, BIT_ROOM1) ? HIGH : LOW);
+  digitalWrite(LED_ROOM2, stateBit(packet, BIT_ROOM2) ? HIGH : LOW);
+
+  lastVersion = packet[2] | (packet[3] << 8) | ((long) packet[4] << 16) | ((long) packet[5] << 24);
+  Serial.printf("LEDs updated to state version %ld (%d bytes)\n", lastVersion, length);
+}
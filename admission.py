@@ -0,0 +1,223 @@
+"""Admission control for the calls that cost Groq quota: the agent's LLM calls and Whisper.
+
+Without it every request starts its own LLM call. Past the provider's rate limit all of them fail or
+stall together, so throughput collapses instead of levelling off. Two layers keep it steady:
+
+- RateLimiter: a token bucket per client (its address), refilled at `rate` per second up to
+  `burst`. A client over its budget gets Overloaded right away, before it takes a slot or a place in
+  the queue. Fast-path commands and cached answers never pass through it.
+- AdmissionQueue: at most `limit` calls run at once; the rest wait in a bounded priority queue.
+  Device commands go before general questions, and those go before weather/news chatter. A request
+  is refused immediately (Overloaded, HTTP 429) when:
+  - the queue is full and nothing queued has a lower priority (otherwise that one is shed instead);
+  - the expected wait, from the average call time and the queue ahead of it, is longer than the
+    time left before its deadline. It would time out anyway, so it is refused before it waits.
+  A request still waiting at its deadline gives up with Overloaded as well.
+
+The limits are per process: with serve.py, each worker has its own (see README.md).
+"""
+import asyncio
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+PRIORITY_DEVICE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+RATE_LIMIT = float(os.getenv("JARVIS_RATE_LIMIT", 1))  # LLM/Whisper requests per second per client
+RATE_BURST = float(os.getenv("JARVIS_RATE_BURST", 10))
+LLM_CONCURRENCY = int(os.getenv("JARVIS_LLM_CONCURRENCY", 4))
+WHISPER_CONCURRENCY = int(os.getenv("JARVIS_WHISPER_CONCURRENCY", 2))
+QUEUE_SIZE = int(os.getenv("JARVIS_ADMISSION_QUEUE", 32))
+QUEUE_TIMEOUT = float(os.getenv("JARVIS_ADMISSION_TIMEOUT", 10))
+
+
+class Overloaded(Exception):
+    """The request cannot be served in time; answered with 429 and a Retry-After of `retry_after` seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class RateLimiter:
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()  # client -> [tokens, last refill], least recently seen first
+        self._lock = threading.Lock()
+        self._stats = {"allowed": 0, "limited": 0}
+
+    def take(self, client, cost=1.0):
+        """Spends `cost` tokens of the client's bucket; raises Overloaded when there are not enough."""
+        if self.rate <= 0:
+            return
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.pop(client, None)
+            if bucket is None:
+                bucket = [self.burst, now]
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets.popitem(last=False)  # forgotten clients start over with a full bucket
+            self._buckets[client] = bucket
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < cost:
+                self._stats["limited"] += 1
+                raise Overloaded(f"Too many requests from {client}", (cost - bucket[0]) / self.rate)
+            bucket[0] -= cost
+            self._stats["allowed"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, clients=len(self._buckets))
+
+
+class _Waiter:
+    __slots__ = ("priority", "deadline", "wake", "granted", "dropped")
+
+    def __init__(self, priority, deadline, wake):
+        self.priority = priority
+        self.deadline = deadline
+        self.wake = wake
+        self.granted = False
+        self.dropped = False  # shed for a higher priority request, or gave up waiting
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionQueue:
+    def __init__(self, name, limit, max_queue=QUEUE_SIZE, timeout=QUEUE_TIMEOUT, clock=time.monotonic):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.clock = clock
+        self._active = 0
+        self._waiters = []  # (priority, sequence, _Waiter); dropped waiters stay until popped
+        self._queued = 0
+        self._sequence = 0
+        self._service_time = None  # moving average of how long a call holds its slot
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "shed": 0, "timed_out": 0}
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_NORMAL, timeout=None):
+        """Holds one of the `limit` slots for the duration of the block (for threads)."""
+        event = threading.Event()
+        waiter = self._enter(priority, timeout, event.set)
+        if waiter is not None:
+            event.wait(max(0.0, waiter.deadline - self.clock()))
+            self._check(waiter)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._release(self.clock() - start)
+
+    @asynccontextmanager
+    async def aslot(self, priority=PRIORITY_NORMAL, timeout=None):
+        """Like slot(), for coroutines: waiting does not block the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enter(priority, timeout, lambda: loop.call_soon_threadsafe(_resolve, future))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(future, max(0.0, waiter.deadline - self.clock()))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:  # the client went away while waiting
+                self._abandon(waiter)
+                raise
+            self._check(waiter)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._release(self.clock() - start)
+
+    def _enter(self, priority, timeout, wake):
+        # Returns None when a slot was free, else the queued _Waiter; raises Overloaded when refused.
+        now = self.clock()
+        deadline = now + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            if self._active < self.limit and not self._queued:
+                self._active += 1
+                self._stats["admitted"] += 1
+                return None
+            ahead = sum(1 for p, _, w in self._waiters if p <= priority and not w.dropped)
+            expected = (ahead + 1) * (self._service_time or 0.0) / self.limit
+            if now + expected > deadline:
+                self._stats["rejected"] += 1
+                raise Overloaded(f"{self.name} is busy (expected wait {expected:.1f}s)", expected)
+            if self._queued >= self.max_queue:
+                worst = max((entry for entry in self._waiters if not entry[2].dropped), key=lambda e: (e[0], e[1]))
+                if worst[0] <= priority:
+                    self._stats["rejected"] += 1
+                    raise Overloaded(f"{self.name} queue is full", expected)
+                worst[2].dropped = True
+                self._queued -= 1
+                self._stats["shed"] += 1
+                worst[2].wake()
+            waiter = _Waiter(priority, deadline, wake)
+            self._sequence += 1
+            heapq.heappush(self._waiters, (priority, self._sequence, waiter))
+            self._queued += 1
+            self._stats["queued"] += 1
+            return waiter
+
+    def _check(self, waiter):
+        # After waking up or timing out: either the slot was handed over, or the request is refused.
+        with self._lock:
+            if waiter.granted:
+                return
+            if not waiter.dropped:
+                waiter.dropped = True
+                self._queued -= 1
+                self._stats["timed_out"] += 1
+                raise Overloaded(f"Timed out waiting for {self.name}", self._service_time or 1.0)
+        raise Overloaded(f"Shed from the {self.name} queue for a more urgent request", self._service_time or 1.0)
+
+    def _abandon(self, waiter):
+        with self._lock:
+            granted = waiter.granted
+            if not granted and not waiter.dropped:
+                waiter.dropped = True
+                self._queued -= 1
+        if granted:
+            self._release()  # the slot was never used, so it says nothing about the service time
+
+    def _release(self, elapsed=None):
+        with self._lock:
+            if elapsed is not None:
+                self._service_time = (elapsed if self._service_time is None
+                                      else 0.8 * self._service_time + 0.2 * elapsed)
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.dropped:
+                    # The slot passes straight to the next waiter; _active stays the same.
+                    waiter.granted = True
+                    self._queued -= 1
+                    self._stats["admitted"] += 1
+                    waiter.wake()
+                    return
+            self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, active=self._active, waiting=self._queued, limit=self.limit,
+                        service_time=round(self._service_time or 0.0, 3))
+
+
+rate_limiter = RateLimiter()
+llm_slots = AdmissionQueue("llm", LLM_CONCURRENCY)
+whisper_slots = AdmissionQueue("whisper", WHISPER_CONCURRENCY)
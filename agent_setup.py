@@ -1,22 +1,39 @@
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents import create_tool_calling_agent, AgentExecutor
+from langchain.agents import create_tool_calling_agent
 import os
+from functools import lru_cache
 
+from model_router import LARGE_MODEL, MODEL_ROUTING, SMALL_MODEL, TieredModel, needs_large, tier_stats
+from parallel_executor import ParallelAgentExecutor
 from prompts import system_prompt
+from telemetry import AGENT_VERBOSE
+from telemetry_callbacks import timing_callbacks
+from tool_selector import ToolSelector
 from tools import (
     toggle_light, set_ac_temperature, get_device_status, get_weather,
     get_latest_news, get_current_datetime, turn_on_ac, turn_off_ac,
     turn_on_tv, turn_off_tv, change_tv_channel, set_tv_volume,
     activate_guest_mode, stop_coffee_machine, start_coffee_machine,
     turn_off_all_lights, close_blinds, open_blinds, unlock_door, lock_door,
-    turn_on_all_lights,
+    turn_on_all_lights, set_group_state, schedule_tool_call, add_state_automation,
+    list_automations, delete_automation,
 )
 
-# Configure the LLM via LangChain
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"))  # best - limited
-# llm = ChatGroq(model="llama3-70b-8192", temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"))          # powerful
-# llm = ChatGroq(model="llama3-8b-8192", temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"))           # fast
+
+def groq_model(name):
+    return ChatGroq(model=name, temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"))
+
+
+def tiered(small, large):
+    """(model for most requests, model for multi-step ones); see model_router.py."""
+    if not MODEL_ROUTING:
+        return large, large
+    return TieredModel(small, large), TieredModel(small, large, small_first=False)
+
+
+# The fast model answers first and hands over to the large one when its answer looks wrong.
+llm, large_llm = tiered(groq_model(SMALL_MODEL), groq_model(LARGE_MODEL))
 
 
 tools = [
@@ -25,7 +42,8 @@ tools = [
     turn_on_tv, turn_off_tv, change_tv_channel, set_tv_volume,
     activate_guest_mode, stop_coffee_machine, start_coffee_machine,
     turn_off_all_lights, close_blinds, open_blinds, unlock_door, lock_door,
-    turn_on_all_lights,
+    turn_on_all_lights, set_group_state, schedule_tool_call, add_state_automation,
+    list_automations, delete_automation,
 ]
 
 prompt = ChatPromptTemplate.from_messages([
@@ -35,12 +53,54 @@ prompt = ChatPromptTemplate.from_messages([
     ("placeholder", "{agent_scratchpad}")
 ])
 
-agent = create_tool_calling_agent(llm, tools, prompt)
+def build_agent_executor(chat_model, tool_subset):
+    # Independent tool calls from one LLM step run concurrently; see parallel_executor.py.
+    return ParallelAgentExecutor(
+        agent=create_tool_calling_agent(chat_model, tool_subset, prompt),
+        tools=tool_subset,
+        verbose=AGENT_VERBOSE,
+        handle_parsing_errors=True,
+        # core.py reads the tool calls to decide whether the reply may be cached.
+        return_intermediate_steps=True
+    )
+
+
+agent_executor = build_agent_executor(llm, tools)
+large_executor = build_agent_executor(large_llm, tools)
+
+# Binds only the tools relevant to a message; see tool_selector.py. Set JARVIS_TOOL_PRUNING=0 to bind all.
+TOOL_PRUNING = os.getenv("JARVIS_TOOL_PRUNING", "1") == "1"
+tool_selector = ToolSelector(tools)
+
+
+@lru_cache(maxsize=64)
+def _executor_for_tools(tool_names, large=False):
+    return build_agent_executor(large_llm if large else llm, [t for t in tools if t.name in tool_names])
+
+
+def executor_for(user_input):
+    """Agent executor for this message: only the tools it needs, on the model tier it needs."""
+    selection = tool_selector.select(user_input)
+    large = MODEL_ROUTING and needs_large(user_input, selection)
+    if MODEL_ROUTING:
+        tier_stats.record_request(not large)
+    if not TOOL_PRUNING or not selection.pruned:
+        return large_executor if large else agent_executor
+    return _executor_for_tools(tuple(t.name for t in selection.tools), large)
+
+
+def priority_for(user_input):
+    """Admission priority of a message for the LLM queue (see admission.py)."""
+    return tool_selector.priority(user_input)
+
+
+def use_llm(large, small=None):
+    """Rebuilds every executor around other chat models (the offline benchmarks plug in fakes).
 
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True,
-    return_intermediate_steps=False
-)
\ No newline at end of file
+    Without `small`, both tiers use `large`.
+    """
+    global llm, large_llm, agent_executor, large_executor
+    llm, large_llm = tiered(small or large, large)
+    agent_executor = build_agent_executor(llm, tools)
+    large_executor = build_agent_executor(large_llm, tools)
+    _executor_for_tools.cache_clear()
@@ -1,23 +1,42 @@
-import os
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
-from groq import Groq
-import io
-import traceback
-from langchain_core.messages import HumanMessage, AIMessage
+"""HTTP transport: the web UI, the JSON API and the device gateway in one Flask app.
+
+The answering itself lives in core.py. The ESP32 routes of device_gateway.py are mounted here too,
+so one process serves the browser and the boards: /get_device_states and /device_states/* at the
+paths the firmware uses, and the boards' /chat and /transcribe under /device.
+"""
+import json
+import uuid
 
-load_dotenv()
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("Error: GROQ_API_KEY not found in .env file.")
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
+from flask_cors import CORS
 
-from agent_setup import agent_executor
+import core
+from admission import Overloaded, llm_slots, rate_limiter, whisper_slots
+from core import agent_setup, answer, fast_router, groq_client, response_cache, tools_module, transcription_streams
+from device_gateway import command_routes, state_routes
+from speech import MAX_SAMPLE_RATE, MIN_SAMPLE_RATE, SAMPLE_RATE
+from telemetry import log, metrics, request_trace, span
 
 app = Flask(__name__)
+# Device clients parse every byte; skip the indentation Flask adds in debug mode.
+app.json.compact = True
 CORS(app)
-groq_client = Groq(api_key=GROQ_API_KEY)
-chat_history = []
+app.register_blueprint(state_routes)
+app.register_blueprint(command_routes, url_prefix="/device")
+SESSION_COOKIE = "jarvis_session"
+MAX_BATCH_OPERATIONS = 200
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+core.start()
+
+
+@app.errorhandler(Overloaded)
+def too_many_requests(e):
+    log.warning("🚦 %s (retry after %ss)", e, e.retry_after)
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
 
 
 @app.route('/')
@@ -25,38 +44,206 @@ def index():
     return render_template('index.html')
 
 
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
-    global chat_history
-    user_input = request.json.get('message')
-    print(f"\nUser text message received: {user_input}")
+    with request_trace("/chat"):
+        with span("parse"):
+            payload = request.get_json(silent=True) or {}
+            user_input = payload.get('message')
+            session_id = payload.get('session_id') or request.cookies.get(SESSION_COOKIE) or uuid.uuid4().hex
+        log.info("\nUser text message received: %s", user_input)
 
-    if not user_input:
-        print("No message provided by user.")
-        return jsonify({"error": "No message provided"}), 400
+        if not user_input:
+            log.info("No message provided by user.")
+            return jsonify({"error": "No message provided"}), 400
 
-    try:
-        response = agent_executor.invoke({
-            "input": user_input,
-            "chat_history": chat_history
-        })
+        try:
+            bot_reply, path = answer(user_input, session_id, client=request.remote_addr)
+            with span("serialize"):
+                response = jsonify({"reply": bot_reply, "path": path, "session_id": session_id})
+                response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+            return response
 
-        bot_reply = response.get('output', "I'm sorry, I couldn't process that.")
-        print(f"🤖 Jarvis reply: {bot_reply}")
+        except Overloaded as e:
+            return too_many_requests(e)
+        except Exception as e:
+            log.exception("Error during agent execution: %s", e)
+            return jsonify({"error": "An internal error occurred."}), 500
 
-        chat_history.extend([
-            HumanMessage(content=user_input),
-            AIMessage(content=bot_reply)
-        ])
-        chat_history = chat_history[-100:]
 
-        return jsonify({"reply": bot_reply})
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness, and which lazy resources are built (jarvis.py probes this before attaching)."""
+    resources = (fast_router, response_cache, agent_setup, groq_client)
+    return jsonify({"status": "ok", "warm": {resource.name: resource.ready for resource in resources}})
+
+
+@app.route('/router_stats', methods=['GET'])
+def router_stats():
+    return jsonify(fast_router.get().route_stats.snapshot())
+
+
+@app.route('/model_stats', methods=['GET'])
+def model_stats():
+    return jsonify(agent_setup.get().tier_stats.snapshot())
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    tools = tools_module.get()
+    caches = (tools.weather_cache, tools.news_cache, response_cache.get().response_cache)
+    return jsonify({cache.name: cache.stats() for cache in caches})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _cache_metrics():
+    # Only caches that are already loaded; scraping must not pull in LangChain.
+    caches = []
+    if tools_module.ready:
+        caches += [tools_module.get().weather_cache, tools_module.get().news_cache]
+    if response_cache.ready:
+        caches.append(response_cache.get().response_cache)
+    lines = ["# HELP jarvis_cache_events_total Cache lookups by outcome.", "# TYPE jarvis_cache_events_total counter"]
+    for cache in caches:
+        for event, value in cache.stats().items():
+            if event not in ("entries", "hit_ratio", "similarity"):
+                lines.append(f'jarvis_cache_events_total{{cache="{cache.name}",event="{event}"}} {value}')
+    return lines
+
+
+metrics.add_collector(_cache_metrics)
+
+
+def _event_metrics():
+    if not tools_module.ready:
+        return []
+    stats = tools_module.get().device_events.stats()
+    return [
+        "# HELP jarvis_event_subscribers Connected device event subscribers (asgi.py).",
+        "# TYPE jarvis_event_subscribers gauge",
+        f"jarvis_event_subscribers {stats['subscribers']}",
+        "# HELP jarvis_device_events_total Device events published, subscribers evicted and rejected.",
+        "# TYPE jarvis_device_events_total counter",
+    ] + [f'jarvis_device_events_total{{event="{event}"}} {stats[event]}' for event in ("published", "evicted", "rejected")]
+
+
+metrics.add_collector(_event_metrics)
+
+
+def _admission_metrics():
+    queues = [(queue.name, queue.stats()) for queue in (llm_slots, whisper_slots)]
+    return [
+        "# HELP jarvis_admission_total LLM and Whisper calls by queue and outcome (admission.py).",
+        "# TYPE jarvis_admission_total counter",
+    ] + [f'jarvis_admission_total{{queue="{name}",outcome="{outcome}"}} {stats[outcome]}'
+         for name, stats in queues for outcome in ("admitted", "queued", "rejected", "shed", "timed_out")] + [
+        "# HELP jarvis_admission_waiting Calls waiting for an LLM or Whisper slot.",
+        "# TYPE jarvis_admission_waiting gauge",
+    ] + [f'jarvis_admission_waiting{{queue="{name}"}} {stats["waiting"]}' for name, stats in queues] + [
+        "# HELP jarvis_rate_limited_total Requests refused by the per-client rate limit.",
+        "# TYPE jarvis_rate_limited_total counter",
+        f"jarvis_rate_limited_total {rate_limiter.stats()['limited']}",
+    ]
+
+
+metrics.add_collector(_admission_metrics)
+
+
+def _model_metrics():
+    if not agent_setup.ready:
+        return []
+    stats = agent_setup.get().tier_stats.snapshot()
+    return [
+        "# HELP jarvis_model_calls_total LLM calls by model tier (model_router.py).",
+        "# TYPE jarvis_model_calls_total counter",
+    ] + [f'jarvis_model_calls_total{{tier="{tier}"}} {values["calls"]}' for tier, values in stats["tiers"].items()] + [
+        "# HELP jarvis_model_cost_usd_total Estimated LLM spend by model tier.",
+        "# TYPE jarvis_model_cost_usd_total counter",
+    ] + [f'jarvis_model_cost_usd_total{{tier="{tier}"}} {values["cost_usd"]}' for tier, values in stats["tiers"].items()] + [
+        "# HELP jarvis_model_escalations_total Steps handed from the small to the large model, by reason.",
+        "# TYPE jarvis_model_escalations_total counter",
+    ] + [f'jarvis_model_escalations_total{{reason="{reason}"}} {count}' for reason, count in stats["escalations"].items()]
+
+
+metrics.add_collector(_model_metrics)
 
-    except Exception as e:
-        error_message = f"Error during agent execution: {str(e)}"
-        print(error_message)
-        traceback.print_exc()
-        return jsonify({"error": "An internal error occurred."}), 500
+
+@app.route('/devices/batch', methods=['POST'])
+def devices_batch():
+    """
+    Applies many device writes atomically under one state version. Body:
+    {"operations": [{"device": "lamps", "location": "kitchen", "set": {"state": "on"}}, ...]}
+    Every operation is validated first; if any is invalid nothing is written and the response
+    (400) lists the error for each operation.
+    """
+    operations = (request.get_json(silent=True) or {}).get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "'operations' must be a non-empty list"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+
+    device_states = tools_module.get().device_states
+    resolved, results = [], []
+    for operation in operations:
+        if not isinstance(operation, dict) or not isinstance(operation.get("set"), dict):
+            results.append({"status": "error", "error": "Each operation needs 'device', 'location' and a 'set' object."})
+            continue
+        device, location = operation.get("device"), operation.get("location")
+        if isinstance(device, str) and isinstance(location, str):
+            location = device_states.resolve(device, location) or location
+        fields = {name: value.lower() if name == "state" and isinstance(value, str) else value
+                  for name, value in operation["set"].items()}
+        error = device_states.validate(device, location, fields)
+        resolved.append((device, location, fields))
+        results.append({"status": "error", "error": error} if error else {"status": "valid"})
+
+    if any(result["status"] == "error" for result in results):
+        return jsonify({"applied": False, "version": device_states.version, "results": results}), 400
+
+    changes = device_states.apply(resolved)
+    version = max(change.version for change in changes)
+    results = [{
+        "device": change.kind,
+        "location": change.location,
+        "status": "changed" if change.new != change.old else "unchanged",
+        "state": change.new.to_json(),
+    } for change in changes]
+    log.info("📦 Batch of %d operations applied at state version %d", len(changes), version)
+    return jsonify({"applied": True, "version": version, "results": results})
+
+
+@app.route('/automations', methods=['GET'])
+def list_automations():
+    automations = tools_module.get().automations
+    return jsonify({"rules": automations.rules(), "stats": automations.stats()})
+
+
+@app.route('/automations', methods=['POST'])
+def add_automation():
+    """
+    Adds a rule (see automations.py). Body:
+    {"trigger": {"type": "time", "at": "07:00"}, "actions": [{"tool": "turn_on_ac", "args": {"location": "room 1"}}]}
+    """
+    try:
+        rule = tools_module.get().automations.add(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(rule.to_json()), 201
+
+
+@app.route('/automations/<rule_id>', methods=['DELETE'])
+def delete_automation(rule_id):
+    if not tools_module.get().automations.remove(rule_id):
+        return jsonify({"error": "Unknown automation"}), 404
+    return jsonify({"deleted": rule_id})
 
 
 @app.route('/transcribe', methods=['POST'])
@@ -65,28 +252,146 @@ def transcribe():
         return jsonify({"error": "No audio file found"}), 400
 
     audio_file = request.files['audio']
-    print(f"\nAudio file received: {audio_file.filename}")
+    log.info("\nAudio file received: %s", audio_file.filename)
+    rate_limiter.take(request.remote_addr)
 
     try:
-        audio_io = io.BytesIO(audio_file.read())
-        audio_io.name = audio_file.filename
+        with span("transcribe", core.WHISPER_MODEL):
+            transcribed_text = core.transcribe(audio_file.filename, audio_file.stream)
+        log.info("Groq STT result: %s", transcribed_text)
+        return jsonify({"text": transcribed_text})
+
+    except Overloaded as e:
+        return too_many_requests(e)
+    except Exception as e:
+        log.exception("Error during Groq transcription: %s", e)
+        return jsonify({"error": "Failed to transcribe audio."}), 500
 
-        transcription = groq_client.audio.transcriptions.create(
-            model="whisper-large-v3",
-            file=audio_io,
-        )
 
-        transcribed_text = transcription.text
-        print(f"Groq STT result: {transcribed_text}")
-        return jsonify({"text": transcribed_text})
+@app.route('/transcribe/stream', methods=['POST'])
+def transcribe_stream_open():
+    """
+    Starts a recording of raw 16-bit mono PCM at ?rate= Hz (16000 by default, 8000 to 48000) and
+    returns its `stream_id`. Chunks go to /transcribe/stream/<stream_id>; the recording ends at
+    /transcribe/stream/<stream_id>/end or /voice/stream/<stream_id>/end.
+    """
+    rate = request.args.get("rate", SAMPLE_RATE, type=int)
+    if not MIN_SAMPLE_RATE <= rate <= MAX_SAMPLE_RATE:
+        return jsonify({"error": f"'rate' must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE} Hz"}), 400
+    # Charged once per recording; its chunks share its Whisper calls.
+    rate_limiter.take(request.remote_addr)
+    stream_id = transcription_streams.open(rate)
+    if stream_id is None:
+        return jsonify({"error": "Too many open transcription streams"}), 429
+    return jsonify({"stream_id": stream_id}), 201
+
 
+@app.route('/transcribe/stream/<stream_id>', methods=['POST'])
+def transcribe_stream_chunk(stream_id):
+    """
+    Receives the next chunk of a recording. Utterances are transcribed in the background as soon
+    as the speaker pauses; the response carries the text recognised so far.
+    """
+    stream = transcription_streams.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown transcription stream"}), 404
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        stream.feed(chunk)
+    return jsonify({"partial": stream.partial_text(), "segments": stream.segment_count})
+
+
+@app.route('/transcribe/stream/<stream_id>/end', methods=['POST'])
+def transcribe_stream_end(stream_id):
+    """Ends a recording and returns its full transcript once every utterance is transcribed."""
+    stream = transcription_streams.close(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown transcription stream"}), 404
+    try:
+        with span("transcribe", "stream"):
+            text = stream.finish(timeout=30)
+        log.info("Streamed STT result: %s", text)
+        return jsonify({"text": text})
+    except Overloaded as e:
+        return too_many_requests(e)
     except Exception as e:
-        error_message = f"Error during Groq transcription: {str(e)}"
-        print(error_message)
-        traceback.print_exc()
+        log.exception("Error during streamed transcription: %s", e)
         return jsonify({"error": "Failed to transcribe audio."}), 500
 
 
+def _overloaded_event(e):
+    log.warning("🚦 %s (retry after %ss)", e, e.retry_after)
+    return sse("error", {"error": str(e), "status": 429, "retry_after": e.retry_after})
+
+
+def _voice_events(transcribe, session_id, endpoint):
+    """Server-sent events for a voice command: the transcript as soon as it is known, then the reply."""
+    with request_trace(endpoint):
+        try:
+            with span("transcribe", endpoint):
+                text = transcribe()
+        except Overloaded as e:
+            yield _overloaded_event(e)
+            return
+        except Exception as e:
+            log.exception("Error during voice transcription: %s", e)
+            yield sse("error", {"error": "Failed to transcribe audio."})
+            return
+        log.info("\n🎙️ Voice command: %s", text)
+        yield sse("transcript", {"text": text, "session_id": session_id})
+        if not text:
+            yield sse("done", {"reply": "", "path": "none"})
+            return
+        try:
+            # No client: _voice_response already charged the rate limiter for the whole request.
+            bot_reply, path = answer(text, session_id, endpoint)
+            yield sse("done", {"reply": bot_reply, "path": path})
+        except Overloaded as e:
+            yield _overloaded_event(e)
+        except Exception as e:
+            log.exception("Error during agent execution: %s", e)
+            yield sse("error", {"error": "An internal error occurred."})
+
+
+def _voice_response(transcribe, endpoint):
+    payload = request.get_json(silent=True) or {}
+    session_id = (payload.get("session_id") or request.form.get("session_id")
+                  or request.cookies.get(SESSION_COOKIE) or uuid.uuid4().hex)
+    # Rate limited before the response starts, so a client over its budget gets a plain 429.
+    rate_limiter.take(request.remote_addr)
+    response = Response(stream_with_context(_voice_events(transcribe, session_id, endpoint)),
+                        mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+
+@app.route('/voice', methods=['POST'])
+def voice():
+    """
+    Transcribes an uploaded recording and answers it in one round trip. The response is an event
+    stream: `transcript` with the recognised text, then `done` with the reply (or `error`).
+    """
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file found"}), 400
+    audio_file = request.files['audio']
+
+    return _voice_response(lambda: core.transcribe(audio_file.filename, audio_file.stream).strip(), "/voice")
+
+
+@app.route('/voice/stream/<stream_id>/end', methods=['POST'])
+def voice_stream_end(stream_id):
+    """
+    Like /voice, for audio already streamed to /transcribe/stream/<stream_id>. Most of the
+    recording has been transcribed while the user was speaking, so the reply starts right away.
+    """
+    stream = transcription_streams.close(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown transcription stream"}), 404
+    return _voice_response(lambda: stream.finish(timeout=30), "/voice/stream")
+
+
 if __name__ == '__main__':
-    print("🚀 Jarvis Smart Home Assistant is running on http://127.0.0.1:5001")
+    print("🚀 Jarvis Smart Home Assistant is running on http://127.0.0.1:5001 (web UI and ESP32 gateway)")
     app.run(debug=True, port=5001)
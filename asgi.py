@@ -0,0 +1,297 @@
+"""ASGI entry point: streams /chat/stream and the device events natively, every other route through Flask.
+
+Run with:  uvicorn asgi:application --port 5001
+"""
+import asyncio
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from admission import Overloaded
+from core import stream_answer, tools_module
+from state_events import HubFull, SlowConsumer, encode
+from telemetry import log, request_trace
+
+from app import app, sse, SESSION_COOKIE
+
+# Flask requests block a thread each; the ESP32's long-polls hold theirs for up to 25 s.
+WSGI_THREADS = int(os.getenv("JARVIS_WSGI_THREADS", 64))
+_wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="jarvis-wsgi")
+
+
+class _ConcurrentWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI call on one shared thread by default, so a single long-poll would
+    # hold up every other Flask route. Here each request gets a thread from the pool.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func, thread_sensitive=False, executor=_wsgi_pool)
+
+
+class ConcurrentWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _ConcurrentWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+flask_app = ConcurrentWsgiToAsgi(app)
+
+# An idle event stream sends a comment this often, so proxies keep it open and dead clients show up.
+HEARTBEAT_SECONDS = 15
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+    (b"access-control-allow-origin", b"*"),
+]
+PREFLIGHT_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"POST, OPTIONS"),
+    (b"access-control-allow-headers", b"content-type"),
+]
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def session_from_cookie(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                key, _, cookie_value = part.strip().partition("=")
+                if key == SESSION_COOKIE:
+                    return cookie_value
+    return None
+
+
+async def send_json(send, status, payload, headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"access-control-allow-origin", b"*"), *headers]})
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode("utf-8")})
+
+
+async def stream_chat(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        payload = {}
+    user_input = payload.get("message")
+    if not user_input:
+        await send_json(send, 400, {"error": "No message provided"})
+        return
+    session_id = payload.get("session_id") or session_from_cookie(scope) or uuid.uuid4().hex
+    log.info("\nUser text message received (stream): %s", user_input)
+
+    cookie = f"{SESSION_COOKIE}={session_id}; HttpOnly; SameSite=Lax; Path=/".encode("latin-1")
+    client = (scope.get("client") or ("unknown",))[0]
+    started = False
+
+    async def emit(event, data):
+        # The response starts with the first event, so admission control can still answer 429.
+        nonlocal started
+        if not started:
+            started = True
+            await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS + [(b"set-cookie", cookie)]})
+        await send({"type": "http.response.body", "body": sse(event, data), "more_body": True})
+
+    with request_trace("/chat/stream"):
+        try:
+            await stream_answer(user_input, session_id, emit, client)
+        except Overloaded as e:
+            log.warning("🚦 %s (retry after %ss)", e, e.retry_after)
+            await send_json(send, 429, {"error": str(e), "retry_after": e.retry_after},
+                            [(b"retry-after", str(e.retry_after).encode("latin-1"))])
+            return
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _event_params(scope, device_states):
+    """(topics or None, since or None, error) from ?topics=lamps,tv&since=<version>."""
+    params = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    topics = None
+    if params.get("topics"):
+        topics = {topic.strip() for topic in params["topics"][0].split(",") if topic.strip()}
+        unknown = topics - set(device_states.kinds())
+        if unknown:
+            return None, None, f"Unknown device type(s): {', '.join(sorted(unknown))}"
+    since = params.get("since", [None])[0]
+    for name, value in scope.get("headers", []):
+        if name == b"last-event-id" and since is None:  # sent by EventSource when it reconnects
+            since = value.decode("latin-1")
+    try:
+        since = int(since) if since not in (None, "") else None
+    except ValueError:
+        return None, None, "since must be a state version"
+    return topics, since, None
+
+
+def _initial_state(device_states, topics, since):
+    """The `state` event: every device (or every device changed after `since`) of the topics."""
+    version, changes = device_states.changes_since(-1 if since is None else since)
+    if topics is not None:
+        changes = {kind: locations for kind, locations in changes.items() if kind in topics}
+    return encode("state", version, {"changes": changes})
+
+
+async def _until_disconnected(receive, disconnect_type):
+    while (await receive())["type"] != disconnect_type:
+        pass
+
+
+async def _pump_events(subscription, receive, disconnect_type, deliver, idle):
+    """Hands events to `deliver` until the client leaves; calls `idle` after a quiet heartbeat period.
+
+    Raises SlowConsumer when the client cannot keep up.
+    """
+    disconnected = asyncio.ensure_future(_until_disconnected(receive, disconnect_type))
+    try:
+        while True:
+            waiting = asyncio.ensure_future(subscription.next(timeout=HEARTBEAT_SECONDS))
+            await asyncio.wait((waiting, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                waiting.cancel()
+                return
+            events = waiting.result()
+            if events:
+                await deliver(events)
+            else:
+                await idle()
+    finally:
+        disconnected.cancel()
+
+
+async def device_events(scope, receive, send):
+    """GET /devices/events: device state changes as server-sent events.
+
+    Starts with a `state` event (the whole house, or what changed after ?since / Last-Event-ID),
+    then sends one `change` event per device type and commit. ?topics=lamps,tv limits the device
+    types. A client that falls too far behind gets an `evicted` event and the stream ends;
+    EventSource reconnects by itself and catches up from its last event id.
+    """
+    # Loading the tools (first request of a worker) or syncing with a shared store blocks, so it
+    # happens in a worker thread; likewise for the state reads below.
+    tools = await asyncio.to_thread(tools_module.get)
+    topics, since, error = _event_params(scope, tools.device_states)
+    if error:
+        await send_json(send, 400, {"error": error})
+        return
+    hub = tools.device_events
+    try:
+        # Subscribe before reading the state, so no change falls between the two.
+        subscription = hub.subscribe(topics)
+    except HubFull as e:
+        await send_json(send, 503, {"error": str(e)})
+        return
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+        state = await asyncio.to_thread(_initial_state, tools.device_states, topics, since)
+        await send({"type": "http.response.body", "body": state[1], "more_body": True})
+
+        async def deliver(events):
+            await send({"type": "http.response.body", "body": b"".join(event.sse for event in events),
+                        "more_body": True})
+
+        async def idle():
+            await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+
+        try:
+            await _pump_events(subscription, receive, "http.disconnect", deliver, idle)
+        except SlowConsumer as e:
+            log.warning("🐌 Evicting a slow device event subscriber: %s", e)
+            version = await asyncio.to_thread(lambda: tools.device_states.version)
+            await send({"type": "http.response.body", "body": encode("evicted", version, {})[1], "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        subscription.close()
+
+
+async def device_events_ws(scope, receive, send):
+    """WebSocket /devices/ws: the same events as /devices/events, as JSON text messages
+    ({"type": "state" | "change" | "evicted", "version": ...}). An evicted client is closed with 4000."""
+    if (await receive())["type"] != "websocket.connect":
+        return
+    tools = await asyncio.to_thread(tools_module.get)
+    topics, since, error = _event_params(scope, tools.device_states)
+    if error:
+        await send({"type": "websocket.close", "code": 1008, "reason": error})
+        return
+    try:
+        subscription = tools.device_events.subscribe(topics)
+    except HubFull as e:
+        await send({"type": "websocket.close", "code": 1013, "reason": str(e)})
+        return
+    try:
+        await send({"type": "websocket.accept"})
+        state = await asyncio.to_thread(_initial_state, tools.device_states, topics, since)
+        await send({"type": "websocket.send", "text": state[0]})
+
+        async def deliver(events):
+            for event in events:
+                await send({"type": "websocket.send", "text": event.json})
+
+        async def idle():
+            pass  # the server's own WebSocket pings keep the connection alive
+
+        try:
+            await _pump_events(subscription, receive, "websocket.disconnect", deliver, idle)
+        except SlowConsumer as e:
+            log.warning("🐌 Evicting a slow device event subscriber: %s", e)
+            version = await asyncio.to_thread(lambda: tools.device_states.version)
+            await send({"type": "websocket.send", "text": encode("evicted", version, {})[0]})
+            await send({"type": "websocket.close", "code": 4000})
+    finally:
+        subscription.close()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] == "websocket":
+        if scope["path"] == "/devices/ws":
+            await device_events_ws(scope, receive, send)
+        else:
+            await send({"type": "websocket.close", "code": 1000})
+        return
+    if scope["type"] == "http" and scope["path"] == "/devices/events" and scope["method"] == "GET":
+        await device_events(scope, receive, send)
+        return
+    if scope["type"] == "http" and scope["path"] == "/chat/stream":
+        if scope["method"] == "OPTIONS":
+            await send({"type": "http.response.start", "status": 204, "headers": PREFLIGHT_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if scope["method"] == "POST":
+            await stream_chat(scope, receive, send)
+            return
+    await flask_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Jarvis Smart Home Assistant (streaming) is running on http://127.0.0.1:5001")
+    uvicorn.run("asgi:application", port=5001)
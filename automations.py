@@ -0,0 +1,393 @@
+"""Local automations: run tool calls at a time of day, after a delay, or when a device changes.
+
+A rule has one trigger and a list of actions, each action being a tool call from tools.py
+({"tool": "lock_door", "args": {"location": "front"}}). Triggers:
+
+- time: {"type": "time", "at": "07:00", "daily": true}, or a one-shot {"type": "time", "at_ts": <epoch>}.
+- state: {"type": "state", "device": "doors", "location": "front", "field": "state",
+  "equals": "unlocked", "for": 600}. It fires when the device starts matching, or once it has
+  matched for `for` seconds without interruption.
+
+State triggers are evaluated incrementally. The engine listens to DeviceStateEngine, and each
+change only looks at the rules indexed under the devices it touched, so the cost per change does
+not depend on how many rules exist. A rule remembers whether it matched, so it fires on the
+transition and not on every write. Time triggers and `for` delays live in one heap ordered by due
+time. Cancelled entries are not removed from the heap; they are skipped when they come up, by
+comparing a per-rule generation number. A single thread pops due entries and runs the actions, so
+the state listener itself (which runs under the state engine's write lock) never waits for a tool.
+
+Rules are saved to JARVIS_AUTOMATIONS (default `automations.json`; `off` keeps them in memory only).
+Only one process runs the rules: the one holding `<file>.lock` (both Flask apps and every serve.py
+worker load tools.py). With a shared storage backend (JARVIS_STORAGE, see storage.py) the rules live
+there instead of in the file, so every worker can list, add and delete them; the runner picks up
+other workers' changes within JARVIS_AUTOMATIONS_SYNC_INTERVAL seconds. Without one, only the runner
+accepts changes. Workers on several hosts each run their own copy of the rules, so set
+JARVIS_AUTOMATIONS=off on all hosts but one.
+"""
+import heapq
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from journal import JournalLockedError, lock_file
+from telemetry import log
+
+AUTOMATIONS_FILE = os.getenv("JARVIS_AUTOMATIONS", "automations.json")
+SYNC_INTERVAL = float(os.getenv("JARVIS_AUTOMATIONS_SYNC_INTERVAL", 1))
+
+
+def next_daily(at, now):
+    """Epoch seconds of the next local `at` ("HH:MM") strictly after `now`."""
+    hour, minute = (int(part) for part in at.split(":"))
+    due = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due.timestamp() <= now:
+        due += timedelta(days=1)
+    return due.timestamp()
+
+
+def parse_time(text, now=None):
+    """Parses '07:00', '7am', '7:30 pm' (-> ("daily", "HH:MM")) or '+10m', '+30s', '+2h', '+10'
+    (minutes; -> ("once", epoch seconds)). Raises ValueError otherwise."""
+    text = text.strip().lower().replace(" ", "")
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"\+(\d+(?:\.\d+)?)([smh]?)", text)
+    if match:
+        seconds = float(match.group(1)) * {"s": 1, "m": 60, "": 60, "h": 3600}[match.group(2)]
+        return "once", now + seconds
+    match = re.fullmatch(r"(\d{1,2})(?::(\d{2}))?(am|pm)?", text)
+    if match:
+        hour, minute, half = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+        if half:
+            if not 1 <= hour <= 12:
+                raise ValueError(f"Invalid time '{text}'.")
+            hour = hour % 12 + (12 if half == "pm" else 0)
+        if hour < 24 and minute < 60 and (half or match.group(2)):
+            return "daily", f"{hour:02d}:{minute:02d}"
+    raise ValueError(f"Invalid time '{text}'. Use HH:MM, 7am or +10m.")
+
+
+class Rule:
+    __slots__ = ("id", "trigger", "actions", "description", "matching", "generation", "fired")
+
+    def __init__(self, id, trigger, actions, description=""):
+        self.id = id
+        self.trigger = trigger
+        self.actions = actions
+        self.description = description
+        self.matching = False  # state rules: whether the device matched at the last change
+        self.generation = 0  # bumped to cancel the rule's pending heap entries
+        self.fired = 0
+
+    def matches(self, value):
+        trigger = self.trigger
+        current = value.get(trigger["field"]) if isinstance(value, dict) else (
+            value if trigger["field"] == "state" else None)
+        return current == trigger["equals"]
+
+    def to_json(self):
+        return {"id": self.id, "trigger": self.trigger, "actions": self.actions,
+                "description": self.description, "fired": self.fired}
+
+
+def _same(rule, spec):
+    # Whether a loaded rule already is `spec`; the fire count alone does not make it a new rule.
+    return rule is not None and (rule.trigger, rule.actions, rule.description) == (
+        spec["trigger"], spec["actions"], spec.get("description", ""))
+
+
+class AutomationEngine:
+    def __init__(self, engine, tools, path=AUTOMATIONS_FILE, clock=time.time, backend=None):
+        """`tools` maps tool names to LangChain tools (or anything with .invoke(args)); `backend`
+        is a shared store from storage.py (ignored when the rules are kept in memory only)."""
+        self.engine = engine
+        self.tools = tools
+        self.path = None if not path or path == "off" else path
+        self.backend = backend if self.path is not None else None
+        self.clock = clock
+        self._rules = {}
+        self._by_device = {}  # (kind, location) -> {rule id: Rule}
+        self._heap = []  # (due, sequence, rule id, generation)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._stats = {"changes": 0, "evaluated": 0, "fired": 0, "failed": 0}
+        self._revision = 0  # bumped whenever the rules or their fire counts change
+        self._synced_revision = None  # backend revision the local rules reflect
+        self._lock_file = None
+        self.active = True  # whether this process runs the rules
+        engine.add_listener(self.on_change)
+
+    @property
+    def revision(self):
+        """Changes whenever the rules or their fire counts change (keys the response cache)."""
+        if self.backend is not None:
+            return self.backend.automations_revision()
+        return self._revision
+
+    def load(self):
+        """Reads the saved rules; one-shot timers that came due while we were down fire right away."""
+        if self.path is None:
+            return self
+        try:
+            self._lock_file = lock_file(self.path + ".lock")
+        except JournalLockedError as e:
+            log.warning("⚠️ Automations run in another process: %s", e)
+            self.active = False
+            return self
+        if self.backend is not None:
+            self._sync()
+            self._start()
+            log.info("⏰ Loaded %d automation(s) from the shared store", len(self._rules))
+            return self
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, encoding="utf-8") as f:
+            saved = json.load(f)
+        for spec in saved:
+            try:
+                self.add(spec, save=False)
+            except ValueError as e:
+                log.warning("⚠️ Skipping automation %s: %s", spec.get("id"), e)
+        log.info("⏰ Loaded %d automation(s)", len(self._rules))
+        return self
+
+    def _sync(self):
+        """Runner with a shared backend: applies the rules other workers added, changed or deleted."""
+        if self.backend.automations_revision() == self._synced_revision:
+            return
+        revision, specs = self.backend.load_automations()
+        stored = {spec["id"]: spec for spec in specs}
+        with self._lock:
+            for rule in [rule for rule_id, rule in self._rules.items() if rule_id not in stored]:
+                del self._rules[rule.id]
+                self._forget(rule)
+                self._revision += 1
+            changed = [spec for spec in specs if not _same(self._rules.get(spec["id"]), spec)]
+            self._synced_revision = revision
+        for spec in changed:
+            try:
+                self.add(spec, save=False)
+            except ValueError as e:
+                log.warning("⚠️ Skipping automation %s: %s", spec.get("id"), e)
+
+    def _save(self, rule=None, deleted=False):
+        """Persists a change: the one rule to the shared backend, or every rule to the file."""
+        if self.backend is not None:
+            if deleted:
+                self.backend.delete_automation(rule.id)
+            else:
+                self.backend.save_automation(rule.id, rule.to_json())
+            return
+        if self.path is None:
+            return
+        with self._lock:
+            rules = [rule.to_json() for rule in self._rules.values()]
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(rules, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("⚠️ Could not save automations to %s: %s", self.path, e)
+
+    def _validate(self, spec):
+        if not self.active and self.backend is None:
+            raise ValueError("Automations are run by another process; change them there, or set JARVIS_STORAGE "
+                             "to share them between processes.")
+        if not isinstance(spec, dict):
+            raise ValueError("An automation must be an object with a trigger and actions.")
+        if not isinstance(spec.get("id") or "", str) or not isinstance(spec.get("description") or "", str):
+            raise ValueError("The id and description of an automation must be strings.")
+        trigger, actions = spec.get("trigger") or {}, spec.get("actions") or []
+        if not isinstance(trigger, dict):
+            raise ValueError("The trigger must be an object.")
+        trigger = dict(trigger)
+        if not isinstance(actions, list) or not actions:
+            raise ValueError("An automation needs a list of at least one action.")
+        for action in actions:
+            if not isinstance(action, dict):
+                raise ValueError('Each action must be an object like {"tool": "lock_door", "args": {...}}.')
+            if not isinstance(action.get("tool"), str) or action["tool"] not in self.tools:
+                raise ValueError(f"Unknown tool '{action.get('tool')}'.")
+            if not isinstance(action.get("args", {}), dict):
+                raise ValueError("Action arguments must be an object.")
+            schema = getattr(self.tools[action["tool"]], "args_schema", None)
+            if isinstance(schema, type):
+                schema.model_validate(action.get("args", {}))  # pydantic's ValidationError is a ValueError
+        if trigger.get("type") == "time":
+            if "at_ts" in trigger:
+                if not isinstance(trigger["at_ts"], (int, float)) or isinstance(trigger["at_ts"], bool):
+                    raise ValueError("'at_ts' must be epoch seconds.")
+            else:
+                if not isinstance(trigger.get("at", ""), str):
+                    raise ValueError("'at' must be a time like 07:00, 7am or +10m.")
+                kind, value = parse_time(trigger.get("at", ""), self.clock())
+                if kind == "once":
+                    trigger = {"type": "time", "at_ts": value}
+                else:
+                    trigger = {"type": "time", "at": value, "daily": bool(trigger.get("daily", True))}
+        elif trigger.get("type") == "state":
+            trigger.setdefault("field", "state")
+            if not isinstance(trigger["field"], str):
+                raise ValueError("'field' must be a field name.")
+            if "equals" not in trigger:
+                raise ValueError("A state trigger needs the value to wait for ('equals').")
+            # A value the device could never be set to would never fire, so it is checked like a write.
+            error = self.engine.validate(trigger.get("device"), trigger.get("location"),
+                                         {trigger["field"]: trigger["equals"]})
+            if error:
+                raise ValueError(error)
+            delay = trigger.get("for", 0)
+            if not isinstance(delay, (int, float)) or isinstance(delay, bool) or delay < 0:
+                raise ValueError("'for' must be a number of seconds, 0 or more.")
+            trigger["for"] = float(delay)
+        else:
+            raise ValueError("The trigger type must be 'time' or 'state'.")
+        return trigger, [{"tool": a["tool"], "args": a.get("args", {})} for a in actions]
+
+    def add(self, spec, save=True):
+        """Adds a rule from its JSON spec (see the module docstring); returns the Rule."""
+        trigger, actions = self._validate(spec)
+        rule = Rule(spec.get("id"), trigger, actions, spec.get("description", ""))
+        rule.fired = spec.get("fired", 0)
+        if not self.active:
+            # Another worker runs the rules; it picks this one up from the shared store.
+            rule.id = rule.id or uuid.uuid4().hex[:8]
+            self._save(rule)
+            return rule
+        record = None
+        if trigger["type"] == "state":
+            # Read before taking our lock: with a shared backend, reading may deliver changes to on_change.
+            record = self.engine.get(trigger["device"], trigger["location"])
+        with self._lock:
+            while rule.id is None or (rule.id in self._rules and not spec.get("id")):
+                rule.id = uuid.uuid4().hex[:8]
+            if rule.id in self._rules:
+                self._forget(self._rules[rule.id])
+            self._rules[rule.id] = rule
+            self._revision += 1
+            now = self.clock()
+            if trigger["type"] == "time":
+                due = trigger.get("at_ts") or next_daily(trigger["at"], now)
+                self._schedule(rule, due)
+            else:
+                self._by_device.setdefault((trigger["device"], trigger["location"]), {})[rule.id] = rule
+                # A device that already matches counts as matching from now: "unlocked for 10
+                # minutes" starts counting when the rule is created.
+                rule.matching = rule.matches(record.to_json())
+                if rule.matching and trigger["for"]:
+                    self._schedule(rule, now + trigger["for"])
+        self._start()
+        if save:
+            self._save(rule)
+        return rule
+
+    def remove(self, rule_id):
+        with self._lock:
+            rule = self._rules.pop(rule_id, None)
+            if rule is not None:
+                self._forget(rule)
+                self._revision += 1
+        if self.backend is not None:
+            # The runner may not have seen the rule yet, so the store decides whether it existed.
+            return self.backend.delete_automation(rule_id)
+        if rule is not None:
+            self._save()
+        return rule is not None
+
+    def _forget(self, rule):
+        rule.generation += 1
+        if rule.trigger["type"] == "state":
+            key = (rule.trigger["device"], rule.trigger["location"])
+            self._by_device.get(key, {}).pop(rule.id, None)
+
+    def rules(self):
+        if self.backend is not None:
+            return self.backend.load_automations()[1]
+        with self._lock:
+            return [rule.to_json() for rule in self._rules.values()]
+
+    def _schedule(self, rule, due):
+        # Caller holds the lock.
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, self._sequence, rule.id, rule.generation))
+        if self._heap[0][1] == self._sequence:
+            self._wakeup.notify()
+
+    def on_change(self, version, changes):
+        """State engine listener: re-evaluates only the rules of the devices that changed."""
+        with self._lock:
+            self._stats["changes"] += 1
+            now = None
+            for kind, locations in changes.items():
+                for location, value in locations.items():
+                    rules = self._by_device.get((kind, location))
+                    if not rules:
+                        continue
+                    for rule in rules.values():
+                        self._stats["evaluated"] += 1
+                        matching = rule.matches(value)
+                        if matching == rule.matching:
+                            continue
+                        rule.matching = matching
+                        rule.generation += 1  # cancels a pending "for" timer either way
+                        if matching:
+                            now = self.clock() if now is None else now
+                            self._schedule(rule, now + rule.trigger["for"])
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="jarvis-automations", daemon=True)
+            self._thread.start()
+            self.engine.watch()
+
+    def _run(self):
+        while True:
+            if self.backend is not None:
+                try:
+                    self._sync()
+                except Exception as e:
+                    log.warning("⚠️ Could not read automations from the shared store: %s", e)
+            with self._lock:
+                timeout = self._heap[0][0] - self.clock() if self._heap else None
+                if timeout is None or timeout > 0:
+                    if self.backend is not None:
+                        timeout = SYNC_INTERVAL if timeout is None else min(timeout, SYNC_INTERVAL)
+                    self._wakeup.wait(timeout)
+                    continue
+                due, _, rule_id, generation = heapq.heappop(self._heap)
+                rule = self._rules.get(rule_id)
+                if rule is None or rule.generation != generation:
+                    continue  # removed, or its condition stopped matching
+                if rule.trigger["type"] == "time" and rule.trigger.get("daily"):
+                    self._schedule(rule, next_daily(rule.trigger["at"], max(due, self.clock())))
+                elif rule.trigger["type"] == "time":
+                    self._rules.pop(rule_id)
+                rule.fired += 1
+                self._revision += 1
+            self._fire(rule)
+            if rule.trigger["type"] == "time":
+                self._save(rule, deleted=not rule.trigger.get("daily"))
+
+    def _fire(self, rule):
+        for action in rule.actions:
+            try:
+                result = self.tools[action["tool"]].invoke(action["args"])
+                log.info("⏰ Automation %s: %s(%s) -> %s", rule.id, action["tool"], action["args"], result)
+                outcome = "fired"
+            except Exception as e:
+                log.warning("⚠️ Automation %s: %s failed: %s", rule.id, action["tool"], e)
+                outcome = "failed"
+            with self._lock:
+                self._stats[outcome] += 1
+
+    def stats(self):
+        """Counters of this process; `rules` counts every rule, wherever it runs."""
+        rules = len(self.rules())
+        with self._lock:
+            return dict(self._stats, rules=rules, pending_timers=len(self._heap))
@@ -0,0 +1,121 @@
+"""Throughput and latency of LLM calls at saturation, with and without admission control.
+
+    python -m benchmarks.bench_admission [--clients 32] [--seconds 5] [--capacity 4] [--latency 0.1]
+
+The model API is simulated: it serves `--capacity` calls at `--latency` each. Past that, every call
+in flight slows down in proportion to the overload, and once it is more than twice over, new calls
+fail after the same wait (the provider's own 429). This is how a rate-limited provider behaves
+when too many calls pile up.
+
+`--clients` threads send requests back to back for `--seconds`. One in four is a device command,
+the rest are weather/news chatter.
+- `unlimited`: every request calls the model right away (app.py before admission.py).
+- `admission`: requests go through an AdmissionQueue with `--capacity` slots. Requests it turns
+  away get a 429 and retry after a short pause, like the web UI does.
+
+The report shows successful calls per second, failures from the provider, fast 429s, and p50/p95
+latency of the successful calls by priority.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from admission import PRIORITY_DEVICE, PRIORITY_LOW, AdmissionQueue, Overloaded
+
+
+class ProviderError(Exception):
+    pass
+
+
+class SimulatedProvider:
+    def __init__(self, capacity, latency):
+        self.capacity = capacity
+        self.latency = latency
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self._in_flight += 1
+            load = self._in_flight / self.capacity
+        try:
+            time.sleep(self.latency * max(1.0, load))
+            if load > 2:
+                raise ProviderError("rate limited")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def run(mode, args):
+    provider = SimulatedProvider(args.capacity, args.latency)
+    queue = AdmissionQueue("llm", args.capacity, max_queue=args.clients, timeout=args.timeout)
+    results = {"ok": 0, "failed": 0, "rejected": 0}
+    latencies = {PRIORITY_DEVICE: [], PRIORITY_LOW: []}
+    lock = threading.Lock()
+    stop = time.perf_counter() + args.seconds
+
+    def client(index):
+        i = 0
+        while time.perf_counter() < stop:
+            priority = PRIORITY_DEVICE if (index + i) % 4 == 0 else PRIORITY_LOW
+            i += 1
+            start = time.perf_counter()
+            try:
+                if mode == "admission":
+                    with queue.slot(priority):
+                        provider.call()
+                else:
+                    provider.call()
+            except Overloaded:
+                with lock:
+                    results["rejected"] += 1
+                time.sleep(args.latency)
+                continue
+            except ProviderError:
+                with lock:
+                    results["failed"] += 1
+                continue
+            with lock:
+                results["ok"] += 1
+                latencies[priority].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, latencies, time.perf_counter() - started
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100)[p - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=2.0, help="admission deadline per request")
+    args = parser.parse_args()
+
+    for mode in ("unlimited", "admission"):
+        results, latencies, elapsed = run(mode, args)
+        print(f"{mode:<10} {results['ok'] / elapsed:7.1f} ok/s  {results['failed']:6d} provider errors  "
+              f"{results['rejected']:6d} fast 429s")
+        for priority, name in ((PRIORITY_DEVICE, "device"), (PRIORITY_LOW, "chatter")):
+            values = latencies[priority]
+            print(f"           {name:<8} p50 {percentile(values, 50) * 1000:8.1f} ms  "
+                  f"p95 {percentile(values, 95) * 1000:8.1f} ms  ({len(values)} ok)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Cost of automations: state changes with thousands of rules, and the timer heap.
+
+    python -m benchmarks.bench_automations [--rules 1000,10000] [--changes 20000] [--timers 100000]
+
+- `indexed`: automations.py, which only evaluates the rules of the devices a change touched.
+- `rescan`: every rule evaluated on every change (the naive approach).
+- `timers`: scheduling --timers one-shot rules and firing them all, to show the heap's cost per
+  timer. Actions are no-ops here, so this measures the engine and not the tools.
+
+The house has one lamp per 10 rules, so each device has about ten rules watching it.
+"""
+import argparse
+import time
+
+from automations import AutomationEngine
+from device_state import DeviceStateEngine
+from telemetry import log
+
+
+class NoOp:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, args):
+        self.calls += 1
+
+
+class RescanEngine(AutomationEngine):
+    """Evaluates every state rule against the current state on every change."""
+
+    def on_change(self, version, changes):
+        with self._lock:
+            self._stats["changes"] += 1
+            for rule in self._rules.values():
+                if rule.trigger["type"] != "state":
+                    continue
+                self._stats["evaluated"] += 1
+                record = changes.get(rule.trigger["device"], {}).get(rule.trigger["location"])
+                if record is None:
+                    record = self.engine._view.devices[rule.trigger["device"]][rule.trigger["location"]].to_json()
+                matching = rule.matches(record)
+                if matching != rule.matching:
+                    rule.matching = matching
+                    rule.generation += 1
+
+
+def build(cls, rules):
+    lamps = max(1, rules // 10)
+    engine = DeviceStateEngine({"lamps": {f"lamp {i}": "off" for i in range(lamps)}})
+    automations = cls(engine, {"noop": NoOp()}, path="off")
+    for i in range(rules):
+        automations.add({"trigger": {"type": "state", "device": "lamps", "location": f"lamp {i % lamps}",
+                                     "equals": "on", "for": 3600},
+                         "actions": [{"tool": "noop"}]}, save=False)
+    return engine, automations
+
+
+def run_changes(engine, changes):
+    locations = list(engine.locations("lamps"))
+    start = time.perf_counter()
+    for i in range(changes):
+        engine.update("lamps", locations[i % len(locations)], state="on" if (i // len(locations)) % 2 == 0 else "off")
+    return changes / (time.perf_counter() - start)
+
+
+def run_timers(count):
+    """(timers scheduled per second, timers fired per second), on a clock that jumps past them all."""
+    now = [0.0]
+    noop = NoOp()
+    automations = AutomationEngine(DeviceStateEngine({"lamps": {"lamp": "off"}}), {"noop": noop},
+                                   path="off", clock=lambda: now[0])
+    start = time.perf_counter()
+    for i in range(count):
+        automations.add({"trigger": {"type": "time", "at_ts": 1.0 + i}, "actions": [{"tool": "noop"}]}, save=False)
+    scheduled = time.perf_counter() - start
+    start = time.perf_counter()
+    with automations._wakeup:
+        now[0] = float(count + 1)
+        automations._wakeup.notify()
+    while noop.calls < count:
+        time.sleep(0.001)
+    return count / scheduled, count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", default="1000,10000")
+    parser.add_argument("--changes", type=int, default=20000)
+    parser.add_argument("--timers", type=int, default=100000)
+    args = parser.parse_args()
+    log.disabled = True  # otherwise the "⏰" line of each fired action is most of what gets measured
+
+    for rules in [int(n) for n in args.rules.split(",")]:
+        for name, cls in (("indexed", AutomationEngine), ("rescan", RescanEngine)):
+            engine, automations = build(cls, rules)
+            # The rescan gets fewer changes so it finishes; the rate is per change either way.
+            changes = args.changes if cls is AutomationEngine else max(100, args.changes * 100 // rules)
+            rate = run_changes(engine, changes)
+            stats = automations.stats()
+            print(f"{name:<8} {rules:>6} rules  {rate:10.0f} changes/s  "
+                  f"{stats['evaluated'] / stats['changes']:8.1f} rules evaluated per change")
+
+    scheduled, fired = run_timers(args.timers)
+    print(f"timers   {args.timers:>6} one-shots  {scheduled:10.0f} scheduled/s  {fired:10.0f} fired/s")
+
+
+if __name__ == "__main__":
+    main()
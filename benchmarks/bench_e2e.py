@@ -0,0 +1,264 @@
+"""End-to-end latency, throughput and allocations of app.py, appForESP32.py and the agent, fully offline.
+
+    python -m benchmarks.bench_e2e [--requests 200] [--concurrency 8]
+                                   [--llm-latency 0.05] [--whisper-latency 0.1] [--api-latency 0.02]
+                                   [--scenarios chat_fast,chat_agent,...] [--json out.json]
+                                   [--baseline out.json] [--tolerance 0.25]
+
+Both Flask apps are served by threaded werkzeug servers on localhost. The Groq chat model and
+Whisper client are replaced by the fakes in benchmarks/fakes.py, and OpenWeatherMap/NewsAPI by
+benchmarks/stubs.py, each sleeping the configured latency. The tool and response caches are
+disabled so every request does the full amount of work.
+
+For every scenario the report shows p50/p95/p99 latency and requests per second with
+`--concurrency` clients, plus the peak memory allocated per request (tracemalloc, measured in a
+separate sequential pass so it does not skew the timings). With --baseline the run exits with
+status 1 when a scenario's p95 grew or its throughput dropped by more than --tolerance.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.fakes import FakeChatModel, FakeWhisperClient
+from benchmarks.stubs import StubServer
+
+FAST_QUERIES = [
+    "turn on the kitchen light",
+    "turn off the kitchen light",
+    "set the ac in room 1 to 22 degrees",
+    "چراغ آشپزخانه را روشن کن",
+]
+AGENT_QUERIES = [
+    "what's the weather like",
+    "give me the latest news",
+    "what time is it",
+    "what is the status of all devices",
+    "how is the weather, and what are the headlines",
+]
+ESP32_QUERIES = ["turn on the kitchen light", "set the cooler in room 1 to 22"]
+
+SCENARIOS = ["agent", "chat_fast", "chat_agent", "transcribe", "voice", "esp32_states", "esp32_chat", "esp32_transcribe"]
+
+
+def silent_wav(seconds=1.0, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def configure_environment(stub_url):
+    """Points the tools at the stubs and turns off caching; must run before the apps are imported."""
+    os.environ.update({
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "benchmark"),
+        "OPENWEATHER_API_KEY": "benchmark",
+        "NEWS_API_KEY": "benchmark",
+        "OPENWEATHER_BASE_URL": stub_url,
+        "NEWSAPI_BASE_URL": stub_url,
+        "WEATHER_CACHE_TTL": "0", "WEATHER_CACHE_STALE_TTL": "0",
+        "NEWS_CACHE_TTL": "0", "NEWS_CACHE_STALE_TTL": "0",
+        "JARVIS_RESPONSE_CACHE_TTL": "0",
+        "JARVIS_STATE_DIR": tempfile.mkdtemp(prefix="jarvis-bench-state-"),
+        "JARVIS_WARM_UP": "0",
+        "JARVIS_AUTOMATIONS": "off",
+        "JARVIS_RATE_LIMIT": "0",  # every simulated client comes from 127.0.0.1
+        "JARVIS_LOG_LEVEL": os.getenv("JARVIS_LOG_LEVEL", "WARNING"),
+    })
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Server:
+    """Serves a WSGI app on a random local port in a background thread."""
+
+    def __init__(self, wsgi_app):
+        self._server = make_server("127.0.0.1", 0, wsgi_app, threaded=True, request_handler=_QuietHandler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+
+
+def build_scenarios(main_url, esp32_url, agent_executor, main_client, esp32_client, audio):
+    """name -> (call over HTTP, same call in-process for tracemalloc), each taking the request number."""
+    _sessions = threading.local()
+
+    def http(method, url, **kwargs):
+        session = getattr(_sessions, "session", None)
+        if session is None:
+            session = _sessions.session = requests.Session()
+        response = session.request(method, url, timeout=60, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+
+    def in_process(client, method, path, **kwargs):
+        response = client.open(path, method=method, **kwargs)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+
+    def invoke_agent(i):
+        agent_executor.invoke({"input": AGENT_QUERIES[i % len(AGENT_QUERIES)], "chat_history": []})
+
+    def chat(queries):
+        return lambda i: {"json": {"message": queries[i % len(queries)], "session_id": f"bench-{i % 16}"}}
+
+    def upload(i):
+        return {"data": {"audio": (io.BytesIO(audio), "clip.wav")}}
+
+    def http_upload(i):
+        return {"files": {"audio": ("clip.wav", audio, "audio/wav")}}
+
+    endpoints = {
+        "chat_fast": (main_url, main_client, "POST", "/chat", chat(FAST_QUERIES), chat(FAST_QUERIES)),
+        "chat_agent": (main_url, main_client, "POST", "/chat", chat(AGENT_QUERIES), chat(AGENT_QUERIES)),
+        "transcribe": (main_url, main_client, "POST", "/transcribe", http_upload, upload),
+        "voice": (main_url, main_client, "POST", "/voice", http_upload, upload),
+        "esp32_states": (esp32_url, esp32_client, "GET", "/get_device_states", lambda i: {}, lambda i: {}),
+        "esp32_chat": (esp32_url, esp32_client, "POST", "/chat", chat(ESP32_QUERIES), chat(ESP32_QUERIES)),
+        "esp32_transcribe": (esp32_url, esp32_client, "POST", "/transcribe", http_upload, upload),
+    }
+    scenarios = {"agent": (invoke_agent, invoke_agent)}
+    for name, (url, client, method, path, http_kwargs, client_kwargs) in endpoints.items():
+        scenarios[name] = (
+            lambda i, url=url, method=method, path=path, make=http_kwargs: http(method, url + path, **make(i)),
+            lambda i, client=client, method=method, path=path, make=client_kwargs: in_process(
+                client, method, path, **make(i)),
+        )
+    return scenarios
+
+
+def measure_latency(call, count, concurrency):
+    def timed(i):
+        start = time.perf_counter()
+        call(i)
+        return time.perf_counter() - start
+
+    call(0)  # warm-up: builds lazy resources and opens connections
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = list(pool.map(timed, range(count)))
+    return timings, count / (time.perf_counter() - start)
+
+
+def measure_allocations(call, count):
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        peaks = []
+        for i in range(count):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            call(i)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return statistics.mean(peaks), retained / count
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['rps']:.1f} -> {result['rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--alloc-requests", type=int, default=20, help="sequential requests traced by tracemalloc")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--whisper-latency", type=float, default=0.1, help="seconds per fake transcription")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds per weather/news stub response")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.api_latency).start()
+    configure_environment(stub.url)
+
+    import agent_setup
+    import app
+    import appForESP32
+    import core
+
+    # Both apps answer through core.py, so one fake model and one fake Whisper client serve them.
+    agent_setup.use_llm(FakeChatModel(latency=args.llm_latency))
+    core.groq_client.set(FakeWhisperClient(latency=args.whisper_latency))
+
+    main_server, esp32_server = Server(app.app), Server(appForESP32.app)
+    scenarios = build_scenarios(main_server.url, esp32_server.url, agent_setup.agent_executor,
+                                app.app.test_client(), appForESP32.app.test_client(), silent_wav())
+
+    results = {}
+    for name in args.scenarios.split(","):
+        over_http, in_process = scenarios[name]
+        # The apps print every request; keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            timings, rps = measure_latency(over_http, args.requests, args.concurrency)
+            alloc_peak, retained = measure_allocations(in_process, args.alloc_requests)
+        timings.sort()
+        results[name] = {
+            "p50_ms": percentile(timings, 50) * 1000,
+            "p95_ms": percentile(timings, 95) * 1000,
+            "p99_ms": percentile(timings, 99) * 1000,
+            "rps": rps,
+            "alloc_kib_per_request": alloc_peak / 1024,
+            "retained_bytes_per_request": retained,
+        }
+        r = results[name]
+        print(f"{name:<17} p50 {r['p50_ms']:8.1f} ms  p95 {r['p95_ms']:8.1f} ms  p99 {r['p99_ms']:8.1f} ms  "
+              f"{r['rps']:8.1f} req/s  {r['alloc_kib_per_request']:8.1f} KiB/req  "
+              f"{r['retained_bytes_per_request']:8.0f} B retained/req")
+
+    main_server.stop()
+    esp32_server.stop()
+    stub.stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Cold vs warm connection latency for outbound tool calls.
+
+    python -m benchmarks.bench_http_pool [--requests 200] [--handshake-delay 0.02]
+
+"cold" opens a new connection for every request (what a bare requests.get does);
+"warm" goes through the shared keep-alive pool in http_client.py.
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+import http_client
+from benchmarks.stubs import StubServer
+
+
+def measure(fetch, url, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fetch(url).raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings, connections):
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    print(f"{name:<5} mean {statistics.mean(timings) * 1000:7.2f} ms   p50 {p50:7.2f} ms   "
+          f"p99 {p99:7.2f} ms   connections opened: {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--handshake-delay", type=float, default=0.02,
+                        help="seconds added to every new connection to mimic TCP+TLS setup")
+    args = parser.parse_args()
+
+    with StubServer(handshake_delay=args.handshake_delay) as server:
+        url = f"{server.url}/data/2.5/weather?q=tehran&appid=stub&units=metric"
+
+        cold = measure(lambda u: requests.get(u, timeout=5), url, args.requests)
+        cold_connections = server.connections
+        report("cold", cold, cold_connections)
+
+        warm = measure(http_client.get, url, args.requests)
+        report("warm", warm, server.connections - cold_connections)
+
+
+if __name__ == "__main__":
+    main()
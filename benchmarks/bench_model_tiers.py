@@ -0,0 +1,92 @@
+"""Latency, cost and answer quality of tiered model routing vs. always using the large model, offline.
+
+    python -m benchmarks.bench_model_tiers [--requests 200] [--small-latency 0.15] [--large-latency 0.6]
+                                           [--mistake-every 5]
+
+Both tiers are FakeChatModels (benchmarks/fakes.py). The small one is faster and gets every
+`--mistake-every`-th tool call wrong (a call that does not parse, or a location that does not
+exist); the large one never does. Modes:
+- `large-only`: every request on the large model (JARVIS_MODEL_ROUTING=0).
+- `tiered`: model_router.py picks the tier and escalates.
+
+A reply counts as correct when it matches what the large model answers for the same message, with
+the devices reset to the same state before each mode (clock times are ignored). Cost
+uses the per-tier prices in model_router.PRICES and the fakes' estimated token counts.
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+
+from benchmarks.bench_e2e import AGENT_QUERIES, configure_environment
+from benchmarks.stubs import StubServer
+
+QUERIES = AGENT_QUERIES + [
+    "please turn on the kitchen light",
+    "could you set the cooler in room 1 to 22",
+    "start the coffee machine, my guests are coming",
+]
+
+_CLOCK = re.compile(r"\d{2}:\d{2}:\d{2}")
+
+
+def restore(device_states, snapshot):
+    device_states.apply([(kind, location, value if isinstance(value, dict) else {"state": value})
+                         for kind, locations in snapshot.items() for location, value in locations.items()])
+
+
+def run(agent_setup, model_router, queries, large_only, devices):
+    from tools import device_states
+    restore(device_states, devices)
+    agent_setup.needs_large = (lambda user_input, selection: True) if large_only else model_router.needs_large
+    before = model_router.tier_stats.snapshot()
+    latencies, replies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        reply = agent_setup.executor_for(query).invoke({"input": query, "chat_history": []})["output"]
+        latencies.append(time.perf_counter() - start)
+        replies.append(_CLOCK.sub("hh:mm:ss", reply))
+    after = model_router.tier_stats.snapshot()
+    cost = sum(after["tiers"][tier]["cost_usd"] - before["tiers"][tier]["cost_usd"] for tier in after["tiers"])
+    calls = {tier: after["tiers"][tier]["calls"] - before["tiers"][tier]["calls"] for tier in after["tiers"]}
+    escalations = sum(after["escalations"].values()) - sum(before["escalations"].values())
+    return latencies, replies, cost, calls, escalations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--small-latency", type=float, default=0.15)
+    parser.add_argument("--large-latency", type=float, default=0.6)
+    parser.add_argument("--mistake-every", type=int, default=5)
+    args = parser.parse_args()
+
+    stub = StubServer(latency=0).start()
+    configure_environment(stub.url)
+    os.environ["JARVIS_MODEL_ROUTING"] = "1"
+    from benchmarks.fakes import FakeChatModel
+    import agent_setup
+    import model_router
+
+    from tools import device_states
+    devices = device_states.snapshot()
+    agent_setup.use_llm(FakeChatModel(latency=args.large_latency, model_name="large"),
+                        FakeChatModel(latency=args.small_latency, mistake_every=args.mistake_every, model_name="small"))
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.requests)]
+    try:
+        results = {mode: run(agent_setup, model_router, queries, mode == "large-only", devices) for mode in ("large-only", "tiered")}
+    finally:
+        stub.stop()
+
+    reference = results["large-only"][1]
+    for mode, (latencies, replies, cost, calls, escalations) in results.items():
+        correct = sum(reply == expected for reply, expected in zip(replies, reference))
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{mode:<10} p50 {quantiles[49] * 1000:7.1f} ms  p95 {quantiles[94] * 1000:7.1f} ms  "
+              f"${cost / len(queries) * 1000:.4f} per 1k requests  correct {correct}/{len(queries)}  "
+              f"calls small {calls['small']} large {calls['large']}  escalations {escalations}")
+
+
+if __name__ == "__main__":
+    main()
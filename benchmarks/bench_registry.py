@@ -0,0 +1,67 @@
+"""Lookup cost of the device registry as the house grows.
+
+    python -m benchmarks.bench_registry [--sizes 100,1000,10000] [--floors 10] [--rooms-per-floor 20]
+
+Builds houses of `--sizes` lamps spread over the floors and rooms (plus a TV and an AC per room),
+then times:
+- resolving a device name exactly, by alias and by a misspelling (fuzzy), and
+- "all lights in one room" and "all lights on one floor" through the indexes, against filtering
+  every device, which is what a per-tool location list amounts to.
+"""
+import argparse
+import time
+
+from device_registry import DeviceRegistry
+
+
+def build_house(lamps, floors, rooms_per_floor):
+    rooms = {f"room {f}-{r}": {"floor": f} for f in range(floors) for r in range(rooms_per_floor)}
+    names = list(rooms)
+    devices = [{"type": "lamps", "location": f"lamp {i}", "room": names[i % len(names)], "aliases": [f"light number {i}"]}
+               for i in range(lamps)]
+    for room in names:
+        devices.append({"type": "tv", "location": f"{room} tv", "room": room})
+        devices.append({"type": "ac_units", "location": f"{room} ac", "room": room})
+    return DeviceRegistry(devices, rooms)
+
+
+def timed(call, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = call()
+    return (time.perf_counter() - start) / repeat * 1e6, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--floors", type=int, default=10)
+    parser.add_argument("--rooms-per-floor", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for size in [int(n) for n in args.sizes.split(",")]:
+        start = time.perf_counter()
+        registry = build_house(size, args.floors, args.rooms_per_floor)
+        build_ms = (time.perf_counter() - start) * 1000
+        everything = [registry.get(kind, location) for kind in registry.kinds() for location in registry.locations(kind)]
+        target = size // 2
+        room = registry.get("lamps", f"lamp {target}").room
+        cases = {
+            "resolve exact": lambda: registry.resolve("lamps", f"lamp {target}"),
+            "resolve alias": lambda: registry.resolve("lamps", f"Light Number {target}"),
+            "resolve fuzzy": lambda: registry.resolve("lamps", f"lampp {target}"),
+            "room lights (index)": lambda: registry.select(kind="lamps", room=room),
+            "room lights (scan)": lambda: [d for d in everything if d.kind == "lamps" and d.room == room],
+            "floor lights (index)": lambda: registry.select(kind="lamps", floor=3),
+            "floor lights (scan)": lambda: [d for d in everything if d.kind == "lamps" and d.floor == 3],
+        }
+        print(f"{size} lamps, {len(everything)} devices (built in {build_ms:.0f} ms)")
+        for name, call in cases.items():
+            micros, result = timed(call, args.repeat)
+            matches = len(result) if isinstance(result, list) else result
+            print(f"  {name:<22} {micros:10.1f} us  -> {matches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Cold-start benchmark for the web app.
+
+    python -m benchmarks.bench_startup [--runs 5]
+
+Every run starts a fresh interpreter and reports:
+  import        time to `import app` (what a new worker pays before it can accept requests)
+  first_fast    time from import to the first fast-path /chat response, with warm-up disabled
+  agent_build   time to import LangChain/Groq and build the agent executor
+  warm_ready    time from import until the background warm-up has built everything
+No network calls are made; GROQ_API_KEY is set to a dummy value.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.post("/chat", json={"message": "turn on the kitchen light", "session_id": "bench"})
+first_fast = time.perf_counter()
+app.agent_setup.get()
+built = time.perf_counter()
+print("RESULT " + json.dumps({"import": imported - start, "first_fast": first_fast - imported,
+                              "agent_build": built - first_fast}))
+"""
+
+WARM_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+while not (app.fast_router.ready and app.agent_setup.ready and app.groq_client.ready):
+    time.sleep(0.005)
+print("RESULT " + json.dumps({"warm_ready": time.perf_counter() - imported}))
+"""
+
+
+def run(script, warm_up):
+    env = dict(os.environ, GROQ_API_KEY=os.getenv("GROQ_API_KEY", "benchmark"),
+               JARVIS_WARM_UP="1" if warm_up else "0")
+    output = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    # The warm-up thread may print on the same line, so look for the marker anywhere.
+    line = next(line for line in output.splitlines() if "RESULT " in line)
+    return json.loads(line[line.index("RESULT ") + len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = {}
+    for _ in range(args.runs):
+        for result in (run(COLD_SCRIPT, warm_up=False), run(WARM_SCRIPT, warm_up=True)):
+            for name, seconds in result.items():
+                samples.setdefault(name, []).append(seconds)
+
+    for name in ("import", "first_fast", "agent_build", "warm_ready"):
+        values = samples[name]
+        print(f"{name:<12} median {statistics.median(values) * 1000:8.1f} ms   "
+              f"min {min(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Throughput of serve.py with 1, 2, 4... workers, and a check that every worker sees the same house.
+
+    python -m benchmarks.bench_workers [--workers 1,2,4] [--requests 400] [--concurrency 16]
+                                       [--storage sqlite|redis]
+
+Each run starts the main app and the ESP32 app with the given number of workers on one shared
+store: a temporary SQLite file, or resp_server.py for `redis`. Fast-path /chat commands (no LLM
+call) measure throughput. Then a device is changed through the main app and /get_device_states is
+read from the ESP32 app over fresh connections, which land on different workers; every read must
+show the change.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_e2e import FAST_QUERIES, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start(app, workers, env):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--app", app, "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url + "/", timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{app} did not start on {url}")
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def measure_chat(url, count, concurrency):
+    session = requests.Session()
+    session.post(url + "/chat", json={"message": FAST_QUERIES[0]}, timeout=30)  # warm-up
+
+    def call(i):
+        start = time.perf_counter()
+        response = requests.post(url + "/chat", json={"message": FAST_QUERIES[i % len(FAST_QUERIES)],
+                                                      "session_id": f"bench-{i % 16}"}, timeout=30)
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    # Warm every worker before timing.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(concurrency * 2)))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = sorted(pool.map(call, range(count)))
+    return timings, count / (time.perf_counter() - start)
+
+
+def check_consistency(main_url, esp32_url, reads):
+    """Flips the kitchen light through the main app; returns how many ESP32 reads saw the new state."""
+    current = requests.get(esp32_url + "/get_device_states", timeout=10).json()["lamps"]["kitchen"]
+    target = "off" if current == "on" else "on"
+    requests.post(main_url + "/chat", json={"message": f"turn {target} the kitchen light"}, timeout=30)
+    # A new connection per read, so the reads are spread over the workers.
+    seen = [requests.get(esp32_url + "/get_device_states", timeout=10).json()["lamps"]["kitchen"]
+            for _ in range(reads)]
+    return sum(state == target for state in seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--storage", choices=("sqlite", "redis"), default="sqlite")
+    parser.add_argument("--reads", type=int, default=40, help="ESP32 reads in the consistency check")
+    args = parser.parse_args()
+
+    resp = None
+    if args.storage == "redis":
+        from resp_server import RespServer
+        resp = RespServer(port=0).start()
+
+    for workers in [int(n) for n in args.workers.split(",")]:
+        if resp is not None:
+            storage_url = resp.url
+            with resp.store.lock:
+                resp.store.cmd_flushdb()  # every run starts from the default state
+        else:
+            storage_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'jarvis.db')}"
+        env = dict(os.environ, JARVIS_STORAGE=storage_url, GROQ_API_KEY=os.getenv("GROQ_API_KEY", "benchmark"),
+                   JARVIS_LOG_LEVEL="WARNING", JARVIS_WARM_UP="0", JARVIS_STT_BACKEND="stub",
+                   JARVIS_AUTOMATIONS="off", JARVIS_RATE_LIMIT="0")
+        main_process, main_url = start("main", workers, env)
+        esp32_process, esp32_url = start("esp32", workers, env)
+        try:
+            timings, rps = measure_chat(main_url, args.requests, args.concurrency)
+            consistent = check_consistency(main_url, esp32_url, args.reads)
+        finally:
+            stop(main_process)
+            stop(esp32_process)
+        print(f"{workers} worker(s) [{args.storage}]  p50 {percentile(timings, 50) * 1000:7.1f} ms  "
+              f"p95 {percentile(timings, 95) * 1000:7.1f} ms  {rps:8.1f} req/s  "
+              f"consistent reads {consistent}/{args.reads}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Deterministic stand-ins for the Groq chat model and the Groq Whisper client.
+
+FakeChatModel answers like a tool-calling LLM: for a new user message it calls the tools the
+message asks for (chosen by keyword, and only among the tools bound to it), and once the tool
+results are in it replies with a sentence built from them. `latency` is slept on every call, so
+benchmark numbers include a realistic model round trip without any network access.
+
+`mistake_every=n` makes every n-th tool-calling reply wrong the way small models get it wrong, in
+turn: a tool call that does not parse, then a location that does not exist (for tools that take
+one). It stands in for the small tier when testing model_router.py offline.
+"""
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.tool import invalid_tool_call
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# (words in the user message, tool to call, arguments)
+PLANS = [
+    (("weather", "هوا"), "get_weather", {}),
+    (("news", "headline", "اخبار", "خبر"), "get_latest_news", {"country": "us"}),
+    (("time", "date", "ساعت", "تاریخ"), "get_current_datetime", {}),
+    (("status", "وضعیت"), "get_device_status", {"device_type": "all"}),
+    (("guest", "مهمان"), "activate_guest_mode", {"confirm": True}),
+    (("coffee", "قهوه"), "start_coffee_machine", {"confirm": True}),
+    (("kitchen light", "چراغ آشپزخانه"), "toggle_light", {"location": "kitchen", "state": "on"}),
+    (("cooler", "ac ", "کولر"), "set_ac_temperature", {"location": "room 1", "temperature": 22}),
+]
+
+_call_ids = itertools.count(1)
+
+
+def plan_tool_calls(text, bound_tools=None):
+    text = f" {text.lower()} "
+    calls = []
+    for words, tool_name, args in PLANS:
+        if bound_tools is not None and tool_name not in bound_tools:
+            continue
+        if any(word in text for word in words):
+            calls.append({"name": tool_name, "args": dict(args), "id": f"call_{next(_call_ids)}"})
+    return calls
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    bound_tools: Optional[Tuple[str, ...]] = None
+    mistake_every: int = 0
+    model_name: str = "fake"
+    replies: list = [0]  # tool-calling replies so far, shared by the copies bind_tools() makes
+
+    @property
+    def _llm_type(self):
+        return "fake-tool-calling"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools, **kwargs):
+        names = tuple(getattr(t, "name", None) or t.__name__ for t in tools)
+        return self.model_copy(update={"bound_tools": names})
+
+    def _reply(self, messages):
+        last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        results = [m.content for m in messages[last_human + 1:] if isinstance(m, ToolMessage)]
+        if results:
+            return AIMessage(content="Done. " + " ".join(str(result) for result in results))
+        text = messages[last_human].content if last_human >= 0 else ""
+        calls = plan_tool_calls(text, self.bound_tools)
+        if calls:
+            self.replies[0] += 1
+            mistake = self.mistake_every and self.replies[0] % self.mistake_every == 0
+            if mistake and ((self.replies[0] // self.mistake_every) % 2 or "location" not in calls[0]["args"]):
+                return AIMessage(content="", invalid_tool_calls=[invalid_tool_call(
+                    name=calls[0]["name"], args="{location: kitchen", id=calls[0]["id"], error="Invalid JSON")])
+            if mistake:
+                calls[0]["args"]["location"] = "the attic"
+            return AIMessage(content="", tool_calls=calls)
+        return AIMessage(content=f"You said: {text}")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+
+class FakeWhisperClient:
+    """Mimics `Groq().audio.transcriptions.create(model=..., file=...)`."""
+
+    def __init__(self, text="turn on the kitchen light", latency=0.0):
+        self.text = text
+        self.latency = latency
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, file, **kwargs):
+        data = file[1] if isinstance(file, tuple) else file
+        if hasattr(data, "read"):
+            data = data.read()
+        if not data:
+            raise ValueError("empty audio file")
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(text=self.text)
@@ -0,0 +1,98 @@
+"""Prompt-size savings and tool-recall of tool pruning over a fixed query set.
+
+    python -m benchmarks.report_tool_pruning [--verbose]
+
+For every query the report compares the tokens of the system prompt plus the bound tool schemas
+with all tools vs. the pruned subset from tool_selector.py. A query regresses when a tool it needs
+(`expected`) is not in the subset; that tool would be invisible to the model. Token counts use
+history.estimate_tokens (about 4 characters per token). No LLM calls are made.
+"""
+import argparse
+import json
+import os
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from agent_setup import tools
+from history import estimate_tokens
+from prompts import system_prompt
+from tool_selector import ToolSelector
+
+# (query, tools the model has to call to answer it)
+QUERIES = [
+    ("turn on the kitchen light", ["toggle_light"]),
+    ("turn off all the lights", ["turn_off_all_lights"]),
+    ("switch every lamp on", ["turn_on_all_lights"]),
+    ("set the ac in room 1 to 22 degrees", ["set_ac_temperature"]),
+    ("turn on the air conditioner in room 2", ["turn_on_ac"]),
+    ("it's too hot in room 1", ["turn_on_ac"]),
+    ("turn the tv volume up to 40", ["set_tv_volume"]),
+    ("put the television on channel 5", ["change_tv_channel"]),
+    ("lock the front door", ["lock_door"]),
+    ("unlock the back door", ["unlock_door"]),
+    ("open the kitchen blinds", ["open_blinds"]),
+    ("close the curtains in room 1", ["close_blinds"]),
+    ("make me a coffee", ["start_coffee_machine"]),
+    ("we have guests coming over", ["activate_guest_mode"]),
+    ("what's the weather like", ["get_weather"]),
+    ("give me the latest headlines from iran", ["get_latest_news"]),
+    ("what time is it", ["get_current_datetime"]),
+    ("what is the status of all devices", ["get_device_status"]),
+    ("turn off the bathroom light and tell me the weather", ["toggle_light", "get_weather"]),
+    ("lock the doors and close all the blinds", ["lock_door", "close_blinds"]),
+    ("چراغ آشپزخانه را روشن کن", ["toggle_light"]),
+    ("کولر اتاق ۱ را روی ۲۴ درجه تنظیم کن", ["set_ac_temperature"]),
+    ("تلویزیون را خاموش کن", ["turn_off_tv"]),
+    ("هوا چطوره؟", ["get_weather"]),
+    ("آخرین اخبار ایران رو بگو", ["get_latest_news"]),
+    ("ساعت چنده؟", ["get_current_datetime"]),
+    ("در جلو را قفل کن", ["lock_door"]),
+    ("پرده‌های آشپزخانه را باز کن", ["open_blinds"]),
+    ("مهمون داریم", ["activate_guest_mode"]),
+    ("turn it off", ["toggle_light"]),
+]
+
+
+def schema_tokens(tool):
+    return estimate_tokens(json.dumps(convert_to_openai_tool(tool)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print the selected tools for every query")
+    args = parser.parse_args()
+
+    selector = ToolSelector(tools)
+    tokens = {t.name: schema_tokens(t) for t in tools}
+    prompt_tokens = estimate_tokens(system_prompt)
+    full = prompt_tokens + sum(tokens.values())
+
+    pruned_totals, regressions = [], []
+    for query, expected in QUERIES:
+        selection = selector.select(query)
+        names = [t.name for t in selection.tools]
+        pruned = prompt_tokens + sum(tokens[name] for name in names)
+        pruned_totals.append(pruned)
+        missing = [name for name in expected if name not in names]
+        if missing:
+            regressions.append((query, missing))
+        if args.verbose:
+            print(f"{pruned:6d} tok  {len(names):2d} tools  {query}")
+            print(f"{'':20}{', '.join(names) if selection.pruned else '(all tools)'}")
+
+    average = sum(pruned_totals) / len(pruned_totals)
+    print(f"queries             {len(QUERIES)}")
+    print(f"system prompt       {prompt_tokens} tokens")
+    print(f"all {len(tools)} tools         {full} tokens per call")
+    print(f"pruned (mean)       {average:.0f} tokens per call  ({(1 - average / full) * 100:.1f}% saved)")
+    print(f"pruned (max)        {max(pruned_totals)} tokens per call")
+    print(f"fell back to all    {sum(1 for total in pruned_totals if total == full)} queries")
+    print(f"regressions         {len(regressions)}")
+    for query, missing in regressions:
+        print(f"  {query!r} is missing {', '.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Local stand-ins for the OpenWeatherMap and NewsAPI endpoints used by tools.py.
+
+The server speaks HTTP/1.1 with keep-alive. `latency` delays every response and
+`handshake_delay` delays every new connection once, to mimic TCP+TLS setup to a remote host.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+WEATHER_RESPONSE = {"weather": [{"description": "clear sky"}], "main": {"temp": 23.5}}
+NEWS_RESPONSE = {"articles": [{"title": f"Stub headline {i}"} for i in range(1, 8)]}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per reused connection.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        if self.server.handshake_delay:
+            time.sleep(self.server.handshake_delay)
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = urlparse(self.path).path
+        if path == "/data/2.5/weather":
+            self._send(200, WEATHER_RESPONSE)
+        elif path == "/v2/top-headlines":
+            country = parse_qs(urlparse(self.path).query).get("country", ["us"])[0]
+            articles = [{"title": f"{article['title']} ({country})"} for article in NEWS_RESPONSE["articles"]]
+            self._send(200, {"articles": articles})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """Runs the stub API in a background thread: `with StubServer() as server: server.url`."""
+
+    def __init__(self, latency=0.0, handshake_delay=0.0):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.latency = latency
+        self._httpd.handshake_delay = handshake_delay
+        self._httpd.connections = 0
+        self._httpd.requests = 0
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    @property
+    def connections(self):
+        return self._httpd.connections
+
+    @property
+    def requests(self):
+        return self._httpd.requests
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,74 @@
+"""Lazy initialisation of the expensive parts of the app (LangChain, Groq, tool schemas).
+
+Nothing heavy is imported until a resource is first used, so worker processes start quickly. A
+background warm-up thread can build everything right after start-up, so the first request does
+not pay for it either.
+"""
+import importlib
+import os
+import threading
+import time
+
+from telemetry import log
+
+
+class Lazy:
+    """Thread-safe, build-once holder for a value produced by `factory`."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.build_seconds = None
+
+    @classmethod
+    def module(cls, name):
+        return cls(name, lambda: importlib.import_module(name))
+
+    def get(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    self._value = self._factory()
+                    self.build_seconds = time.perf_counter() - start
+                    self._ready = True
+        return self._value
+
+    def set(self, value):
+        """Replaces the value without calling the factory (e.g. to plug in a fake client)."""
+        with self._lock:
+            self._value = value
+            self.build_seconds = 0.0
+            self._ready = True
+
+    @property
+    def ready(self):
+        return self._ready
+
+
+def warm_up(*resources, background=True, verbose=True):
+    """Builds the given resources in order, in a daemon thread unless background is False."""
+    def run():
+        start = time.perf_counter()
+        for resource in resources:
+            try:
+                resource.get()
+            except Exception as e:
+                # The request that needs it will raise the error properly.
+                log.warning("⚠️ Warm-up of %s failed: %s", resource.name, e)
+        if verbose:
+            log.info("🔥 Warm-up finished in %.2fs", time.perf_counter() - start)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="jarvis-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_enabled():
+    return os.getenv("JARVIS_WARM_UP", "1") == "1"
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """One in-progress load that concurrent callers for the same key wait on."""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Thread-safe TTL cache with stale-while-revalidate and request coalescing.
+
+    - Entries younger than `ttl` seconds are served directly.
+    - Entries up to `stale_ttl` seconds past their TTL are still served, while a single
+      background refresh fetches a new value.
+    - Concurrent misses for the same key share one call to the loader.
+    - Loader errors are never cached; they propagate to every caller waiting on that load.
+    """
+
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=256):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, fetched_at)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "errors": 0}
+
+    def get_or_load(self, key, loader):
+        """Returns the cached value for key, calling loader() to fetch it when needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["stale_hits"] += 1
+                    if key not in self._flights:
+                        self._stats["refreshes"] += 1
+                        self._flights[key] = _Flight()
+                        threading.Thread(target=self._load, args=(key, self._flights[key], loader), daemon=True).start()
+                    return value
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                self._stats["misses"] += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if leader:
+            self._load(key, flight, loader)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _load(self, key, flight, loader):
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            if flight.error is None:
+                self._entries[key] = (flight.value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._stats["errors"] += 1
+            del self._flights[key]
+        flight.done.set()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,329 @@
+import re
+import threading
+from collections import deque, namedtuple
+
+import tools
+from device_registry import NUMBER_WORDS, fold
+from telemetry import span
+from tools import (
+    toggle_light, turn_on_all_lights, turn_off_all_lights, turn_on_ac, turn_off_ac,
+    set_ac_temperature, turn_on_tv, turn_off_tv, change_tv_channel, set_tv_volume,
+    lock_door, unlock_door, open_blinds, close_blinds, start_coffee_machine,
+    stop_coffee_machine, set_group_state,
+)
+
+# A resolved command: the tool to call, its arguments and the reply to send back.
+FastPathResult = namedtuple("FastPathResult", ["reply", "tool", "args"])
+# What a message talks about, used to key the response cache (see response_cache.py).
+Mentions = namedtuple("Mentions", ["text", "kinds", "locations", "qualifiers", "is_write", "is_time"])
+
+_DEVICE_KEYWORDS = {
+    "lamps": ["light", "lights", "lamp", "lamps", "چراغ", "لامپ"],
+    "ac_units": ["ac", "a/c", "air conditioner", "aircon", "thermostat", "temperature", "کولر", "اسپلیت", "دمای", "دما"],
+    "tv": ["tv", "television", "channel", "volume", "تلویزیون", "تی وی", "کانال"],
+    "doors": ["door", "doors", "lock", "unlock", "قفل"],
+    "blinds": ["blind", "blinds", "curtain", "curtains", "shade", "shades", "پرده", "پرده ها"],
+    "coffee_machine": ["coffee", "قهوه"],
+}
+
+_ON_WORDS = ["on", "start", "روشن"]
+_OFF_WORDS = ["off", "stop", "خاموش"]
+_ALL_WORDS = ["all", "everything", "همه", "تمام", "همه ی"]
+_OPEN_WORDS = ["open", "raise", "باز"]
+_CLOSE_WORDS = ["close", "shut", "lower", "بسته", "ببند"]
+_FLOOR_WORDS = ["floor", "طبقه"]
+_TEMPERATURE_WORDS = ["degree", "degrees", "°", "temperature", "درجه", "دما", "دمای", "روی", "to"]
+_CHANNEL_WORDS = ["channel", "کانال"]
+_VOLUME_WORDS = ["volume", "صدا", "صدای"]
+
+# Anything that looks like a question, a negation, an exception, a multi-part request or a
+# command for later goes to the agent; timed commands become automations there (tools.schedule_tool_call).
+_FALLBACK_WORDS = [
+    "and", "then", "also", "if", "when", "after", "before", "don't", "dont", "not", "never",
+    "is", "are", "what", "which", "how", "why", "status", "except", "but", "unless", "without",
+    "at", "for", "every", "each", "daily", "until", "till", "later", "tomorrow", "tonight", "morning",
+    "evening", "night", "noon", "midnight", "am", "pm", "clock", "minute", "minutes", "min", "mins",
+    "hour", "hours", "seconds", "sec", "secs",
+    "و", "بعد", "سپس", "اگر", "وقتی", "نکن", "نه", "آیا", "چرا", "چه", "چطور", "وضعیت",
+    "بجز", "به جز", "جز", "غیر از", "ساعت", "دقیقه", "ثانیه", "فردا", "امشب", "صبح", "عصر", "شب",
+    "ظهر", "هر", "روزانه",
+]
+_FALLBACK_CHARS = ("?", "؟", ",", "،", ";")
+# Clock times written without a space or with a colon: "7am", "19:30".
+_CLOCK_TIME = re.compile(r"\d(?:am|pm)(?!\w)|\d:\d")
+
+# Verbs that ask for a change; such messages are never answered from the response cache.
+_WRITE_WORDS = [
+    "turn", "switch", "set", "change", "make", "put", "open", "close", "shut", "lock", "unlock",
+    "start", "stop", "brew", "increase", "decrease", "raise", "lower", "mute", "toggle",
+    "activate", "deactivate", "enable", "disable",
+    # Automations (tools.schedule_tool_call and friends) change state too.
+    "schedule", "reschedule", "remind", "plan", "add", "delete", "remove", "cancel",
+    "کن", "بکن", "کنید", "بزن", "ببند", "بذار", "بگذار", "تنظیم", "عوض", "فعال", "غیرفعال",
+    "زمان بندی", "یادآوری", "حذف", "لغو",
+]
+# Answers to these depend on the clock, so their cache entries only live for the current minute.
+_TIME_WORDS = ["time", "date", "day", "today", "clock", "ساعت", "تاریخ", "امروز", "روز", "چندمه"]
+
+
+def _normalize(text):
+    text = fold(text)
+    text = re.sub(r"[.!\"'«»]", " ", text)
+    return " " + re.sub(r"\s+", " ", text).strip() + " "
+
+
+def _pattern(words, whole_words=False):
+    parts = []
+    for word in sorted(words, key=len, reverse=True):
+        # Persian verbs and nouns take suffixes ("خاموشش", "چراغ‌ها"), so only anchor their start.
+        tail = r"(?!\w)" if whole_words or word.isascii() else ""
+        parts.append(r"(?<!\w)" + re.escape(word) + tail)
+    return re.compile("|".join(parts))
+
+
+class CommandRouter:
+    """Resolves simple single-device commands locally so they skip the LLM round trip.
+
+    Anything the router is not certain about returns None and should be handed to the agent.
+    """
+
+    def __init__(self):
+        self._device_patterns = {kind: _pattern(words) for kind, words in _DEVICE_KEYWORDS.items()}
+        self._fallback = _pattern(_FALLBACK_WORDS, whole_words=True)
+        self._on = _pattern(_ON_WORDS)
+        self._off = _pattern(_OFF_WORDS)
+        self._all = _pattern(_ALL_WORDS)
+        self._open = _pattern(_OPEN_WORDS)
+        self._close = _pattern(_CLOSE_WORDS)
+        self._temperature = _pattern(_TEMPERATURE_WORDS)
+        self._channel = _pattern(_CHANNEL_WORDS)
+        self._volume = _pattern(_VOLUME_WORDS)
+        self._write = _pattern(_WRITE_WORDS, whole_words=True)
+        self._time = _pattern(_TIME_WORDS, whole_words=True)
+        self._location_patterns = {}
+        self._floor_mention = _pattern(_FLOOR_WORDS)
+        numbers = "|".join(re.escape(word) for words in NUMBER_WORDS.values() for word in words)
+        self._floor_phrase = re.compile(
+            rf"(?:(?<!\w)(?:on|in) (?:the )?)?(?:(?<!\w)floor (\d+|{numbers})(?!\w)|(?<!\w)(\d+|{numbers}) floor(?!\w)"
+            rf"|طبقه (?:ی )?(\d+|{numbers})(?!\w))")
+        self._number_words = {word: number for number, words in NUMBER_WORDS.items() for word in words}
+
+    def _locations(self, kind):
+        # Names and aliases come from the device registry (see device_registry.py).
+        if kind not in self._location_patterns:
+            registry = tools.device_registry
+            self._location_patterns[kind] = [(loc, _pattern(fold(alias) for alias in registry.aliases(kind, loc)))
+                                             for loc in registry.locations(kind)]
+        return self._location_patterns[kind]
+
+    def _find_location(self, kind, text):
+        """Returns (location, text without the location) or (None, text) when zero or several match."""
+        found = []
+        for location, pattern in self._locations(kind):
+            match = pattern.search(text)
+            if match:
+                found.append((location, match))
+        if len(found) != 1:
+            locations = [loc for loc, _ in self._locations(kind)]
+            if not found and len(locations) == 1:
+                return locations[0], text
+            return None, text
+        location, match = found[0]
+        return location, text[:match.start()] + " " + text[match.end():]
+
+    def mentions(self, user_input):
+        """Describes which device types and locations a message refers to, and whether it asks for a change."""
+        text = _normalize(user_input)
+        kinds = tuple(kind for kind, pattern in self._device_patterns.items() if pattern.search(text))
+        locations = set()
+        for kind in kinds or tools.device_states.kinds():
+            locations.update(location for location, pattern in self._locations(kind) if pattern.search(text))
+        # Words that flip the meaning of an otherwise similar message ("on" vs "off", "channel 5" vs "7").
+        qualifiers = [name for name, pattern in (("on", self._on), ("off", self._off), ("open", self._open),
+                                                 ("close", self._close), ("all", self._all)) if pattern.search(text)]
+        qualifiers += re.findall(r"\d+", text)
+        return Mentions(
+            text=" ".join(re.sub(r"[?؟,،;]", " ", text).split()),
+            kinds=kinds,
+            locations=tuple(sorted(locations)),
+            qualifiers=tuple(qualifiers),
+            is_write=bool(self._write.search(text)),
+            is_time=bool(self._time.search(text)),
+        )
+
+    def _floor(self, text):
+        """Returns (floor, text without it); floor is None when none is named and False when unclear."""
+        if not self._floor_mention.search(text):
+            return None, text
+        matches = list(self._floor_phrase.finditer(text))
+        if len(matches) != 1:
+            return False, text
+        match = matches[0]
+        word = next(group for group in match.groups() if group)
+        return int(self._number_words.get(word, word)), text[:match.start()] + " " + text[match.end():]
+
+    def _on_off(self, text):
+        on, off = bool(self._on.search(text)), bool(self._off.search(text))
+        if on == off:
+            return None
+        return "on" if on else "off"
+
+    def route(self, user_input):
+        """Returns a FastPathResult if the command was handled locally, otherwise None."""
+        if not user_input or any(char in user_input for char in _FALLBACK_CHARS):
+            return None
+        text = _normalize(user_input)
+        if self._fallback.search(text) or _CLOCK_TIME.search(text):
+            return None
+
+        kinds = [kind for kind, pattern in self._device_patterns.items() if pattern.search(text)]
+        if len(kinds) != 1:
+            return None
+        kind = kinds[0]
+        persian = bool(re.search(r"[؀-ۿ]", user_input))
+
+        intent = getattr(self, f"_intent_{kind}")(text)
+        if intent is None:
+            return None
+        tool, args, reply_fa = intent
+
+        with span("tool", tool.name):
+            result = tool.invoke(args)
+        if result.startswith("Error"):
+            return None
+        return FastPathResult(reply=reply_fa if persian else result, tool=tool.name, args=args)
+
+    def _intent_lamps(self, text):
+        floor, text = self._floor(text)
+        state = self._on_off(text)
+        if state is None or floor is False:
+            return None
+        state_fa = "روشن" if state == "on" else "خاموش"
+        if floor is not None:
+            return (set_group_state, {"state": state, "device_type": "lamps", "floor": floor},
+                    f"انجام شد. چراغ‌های طبقه {floor} {state_fa} شدند.")
+        if self._all.search(text):
+            tool = turn_on_all_lights if state == "on" else turn_off_all_lights
+            return tool, {"confirm": True}, f"انجام شد. همه چراغ‌ها {state_fa} شدند."
+        location, _ = self._find_location("lamps", text)
+        if location is None:
+            return None
+        return toggle_light, {"location": location, "state": state}, f"انجام شد. چراغ {_fa(location)} {state_fa} شد."
+
+    def _intent_ac_units(self, text):
+        location, rest = self._find_location("ac_units", text)
+        if location is None:
+            return None
+        numbers = re.findall(r"\d+", rest)
+        if numbers:
+            if len(numbers) != 1 or not self._temperature.search(rest):
+                return None
+            # Out-of-range values are rejected by the tool (DeviceStateEngine.validate).
+            temperature = int(numbers[0])
+            return (set_ac_temperature, {"location": location, "temperature": temperature},
+                    f"انجام شد. دمای کولر {_fa(location)} روی {temperature} درجه تنظیم شد.")
+        state = self._on_off(text)
+        if state is None:
+            return None
+        tool = turn_on_ac if state == "on" else turn_off_ac
+        state_fa = "روشن" if state == "on" else "خاموش"
+        return tool, {"location": location}, f"انجام شد. کولر {_fa(location)} {state_fa} شد."
+
+    def _intent_tv(self, text):
+        location, rest = self._find_location("tv", text)
+        if location is None:
+            return None
+        numbers = re.findall(r"\d+", rest)
+        channel, volume = bool(self._channel.search(rest)), bool(self._volume.search(rest))
+        if channel or volume:
+            if len(numbers) != 1 or channel == volume:
+                return None
+            value = int(numbers[0])
+            if channel:
+                return (change_tv_channel, {"location": location, "channel": value},
+                        f"انجام شد. تلویزیون روی کانال {value} رفت.")
+            return (set_tv_volume, {"location": location, "volume": value},
+                    f"انجام شد. صدای تلویزیون روی {value} تنظیم شد.")
+        state = self._on_off(text)
+        if state is None or numbers:
+            return None
+        tool = turn_on_tv if state == "on" else turn_off_tv
+        state_fa = "روشن" if state == "on" else "خاموش"
+        return tool, {"location": location}, f"انجام شد. تلویزیون {state_fa} شد."
+
+    def _intent_doors(self, text):
+        location, _ = self._find_location("doors", text)
+        if location is None:
+            return None
+        # In Persian "unlock" is "open the lock" (قفل ... باز کن).
+        unlock = bool(re.search(r"(?<!\w)unlock(?!\w)", text)) or ("قفل" in text and "باز" in text)
+        lock = bool(re.search(r"(?<!\w)lock(?!\w)", text)) or ("قفل" in text and "باز" not in text)
+        if lock == unlock:
+            return None
+        if lock:
+            return lock_door, {"location": location}, f"انجام شد. در {_fa(location)} قفل شد."
+        return unlock_door, {"location": location}, f"انجام شد. قفل در {_fa(location)} باز شد."
+
+    def _intent_blinds(self, text):
+        location, _ = self._find_location("blinds", text)
+        if location is None:
+            return None
+        opened, closed = bool(self._open.search(text)), bool(self._close.search(text))
+        if opened == closed:
+            return None
+        if opened:
+            return open_blinds, {"location": location}, f"انجام شد. پرده‌های {_fa(location)} باز شدند."
+        return close_blinds, {"location": location}, f"انجام شد. پرده‌های {_fa(location)} بسته شدند."
+
+    def _intent_coffee_machine(self, text):
+        state = self._on_off(text)
+        if state is None:
+            return None
+        if state == "on":
+            return start_coffee_machine, {"confirm": True}, "انجام شد. قهوه‌ساز روشن شد."
+        return stop_coffee_machine, {"confirm": True}, "انجام شد. قهوه‌ساز خاموش شد."
+
+
+def _fa(location):
+    return tools.device_registry.name_fa(location)
+
+
+class RouteStats:
+    """Counts requests per path ('fast', 'cache' or 'agent') and keeps a window of recent latencies."""
+
+    def __init__(self, window=1000, paths=("fast", "cache", "agent")):
+        self._lock = threading.Lock()
+        self._counts = {path: 0 for path in paths}
+        self._latencies = {path: deque(maxlen=window) for path in paths}
+
+    def record(self, path, seconds):
+        with self._lock:
+            self._counts[path] += 1
+            self._latencies[path].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = {path: sorted(values) for path, values in self._latencies.items()}
+
+        total = sum(counts.values())
+        report = {"total": total, "hit_ratio": round(counts["fast"] / total, 4) if total else 0.0}
+        for path, values in latencies.items():
+            report[path] = {
+                "count": counts[path],
+                "p50_ms": _percentile_ms(values, 50),
+                "p99_ms": _percentile_ms(values, 99),
+            }
+        return report
+
+
+def _percentile_ms(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 2)
+
+
+command_router = CommandRouter()
+route_stats = RouteStats()
+
@@ -0,0 +1,216 @@
+"""The assistant itself, shared by every transport running in the process.
+
+app.py (web UI and HTTP API), device_gateway.py (the routes ESP32 boards use) and jarvis.py (the
+terminal) are thin layers over this module. It owns the lazily built resources (agent, tools and
+device state, response cache, Groq client), the chat history and the streaming transcriptions,
+and answers a message the same way whichever transport it came from. `python app.py` serves the
+web UI and the boards from one process, and `python jarvis.py --serve` adds the terminal to it, so
+all of this is built once and every transport sees the same house, caches and conversations.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+if not GROQ_API_KEY:
+    raise ValueError("Error: GROQ_API_KEY not found in .env file.")
+
+import storage
+from admission import Overloaded, llm_slots, rate_limiter, whisper_slots
+from bootstrap import Lazy, warm_up, warm_up_enabled
+from history import ConversationStore
+from speech import StreamRegistry, backend_from_env
+from telemetry import log, requests_total, span
+
+WHISPER_MODEL = "whisper-large-v3"
+
+
+def _build_groq_client():
+    from groq import Groq
+    return Groq(api_key=GROQ_API_KEY)
+
+
+# LangChain, the tool schemas and the Groq SDK are only loaded on first use (see bootstrap.py).
+fast_router = Lazy.module("command_router")
+agent_setup = Lazy.module("agent_setup")
+tools_module = Lazy.module("tools")
+response_cache = Lazy.module("response_cache")
+groq_client = Lazy("groq_client", _build_groq_client)
+conversations = ConversationStore(
+    max_sessions=int(os.getenv("JARVIS_MAX_SESSIONS", 1000)),
+    token_budget=int(os.getenv("JARVIS_HISTORY_TOKENS", 1500)),
+    backend=storage.backend,
+)
+# Streaming transcription: raw PCM16 chunks are fed to a stream per recording; see speech.py.
+transcription_streams = StreamRegistry(backend_from_env(groq_client))
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start(verbose=True):
+    """Starts the background warm-up once per process, whichever transport asks first."""
+    global _started
+    with _start_lock:
+        if _started or not warm_up_enabled():
+            return
+        _started = True
+    warm_up(fast_router, response_cache, agent_setup, groq_client, verbose=verbose)
+
+
+def response_cache_key(router, user_input, chat_history=()):
+    """Response cache key for a message that missed the fast path; None when it must not be cached."""
+    cache = response_cache.get().response_cache
+    tools = tools_module.get()
+    return cache.key(router.command_router.mentions(user_input), tools.device_states, tools.automations.revision,
+                     chat_history)
+
+
+def _cacheable(tool_names, device_states, version):
+    """Whether an agent reply may be replayed: no device changed and only read-only tools ran."""
+    read_only = tools_module.get().READ_ONLY_TOOLS
+    return device_states.version == version and all(name in read_only for name in tool_names)
+
+
+def _route(user_input):
+    """The fast path: runs the command if the router understands it; returns (router, result or None)."""
+    with span("route"):
+        router = fast_router.get()
+        return router, router.command_router.route(user_input)
+
+
+def _lookup(router, user_input, session_id):
+    """Response cache lookup; returns (cache, device_states, key, reply or None, chat history).
+
+    The session's history is part of the key, since the agent's reply may refer back to it.
+    """
+    with span("history"):
+        chat_history = conversations.get_messages(session_id)
+    with span("cache"):
+        cache = response_cache.get().response_cache
+        device_states = tools_module.get().device_states
+        cache_key = response_cache_key(router, user_input, chat_history)
+        return cache, device_states, cache_key, cache.get(cache_key), chat_history
+
+
+def _remember(cache, cache_key, reply, tool_names, device_states, version):
+    if _cacheable(tool_names, device_states, version):
+        cache.put(cache_key, reply)
+
+
+def answer(user_input, session_id, endpoint="/chat", client=None, priority=None):
+    """Answers one message through the fast path, the response cache or the agent; returns (reply, path).
+
+    Only the agent path goes through admission control. It raises Overloaded when `client` is over
+    its rate limit or the LLM queue cannot take the message in time; callers in this process (no
+    `client`) are not rate limited. `priority` defaults to the one the message's tools imply.
+    """
+    start = time.perf_counter()
+    router, fast_path = _route(user_input)
+    if fast_path is not None:
+        path = "fast"
+        bot_reply = fast_path.reply
+        log.info("⚡ Fast path: %s(%s)", fast_path.tool, fast_path.args)
+    else:
+        cache, device_states, cache_key, bot_reply, chat_history = _lookup(router, user_input, session_id)
+        path = "cache" if bot_reply is not None else "agent"
+    if path == "agent":
+        agent = agent_setup.get()
+        version = device_states.version
+        if client is not None:
+            rate_limiter.take(client)
+        with llm_slots.slot(agent.priority_for(user_input) if priority is None else priority), span("agent"):
+            response = agent.executor_for(user_input).invoke(
+                {"input": user_input, "chat_history": chat_history},
+                config={"callbacks": [agent.timing_callbacks]},
+            )
+        bot_reply = response.get('output', "I'm sorry, I couldn't process that.")
+        tool_names = [action.tool for action, _ in response.get("intermediate_steps", ())]
+        _remember(cache, cache_key, response.get('output'), tool_names, device_states, version)
+    router.route_stats.record(path, time.perf_counter() - start)
+    requests_total.inc(endpoint, path)
+    log.info("🤖 Jarvis reply (%s): %s", path, bot_reply)
+
+    conversations.append(session_id, user_input, bot_reply)
+    return bot_reply, path
+
+
+async def stream_answer(user_input, session_id, emit, client=None, endpoint="/chat/stream"):
+    """Like answer(), streaming the agent's progress as `await emit(event, data)` calls.
+
+    Events: `path`, then `tool_start`/`tool_end`/`token` as they happen, then `done` (or `error`).
+    Raises Overloaded before emitting anything when admission control turns the agent call away.
+    Routing (which may run a tool and wait for the journal), the cache, the history and device
+    state reads can block on disk or the shared store, so they run in worker threads.
+    """
+    start = time.perf_counter()
+    try:
+        router, fast_path = await asyncio.to_thread(_route, user_input)
+        if fast_path is not None:
+            path = "fast"
+            bot_reply = fast_path.reply
+            await emit("path", {"path": path, "session_id": session_id})
+            await emit("tool_start", {"name": fast_path.tool, "input": fast_path.args})
+            await emit("token", {"text": bot_reply})
+        else:
+            cache, device_states, cache_key, bot_reply, chat_history = await asyncio.to_thread(
+                _lookup, router, user_input, session_id)
+            path = "cache" if bot_reply is not None else "agent"
+            if bot_reply is not None:
+                await emit("path", {"path": path, "session_id": session_id})
+                await emit("token", {"text": bot_reply})
+        if path == "agent":
+            # On a cold worker (or while the warm-up is still running) this builds the agent.
+            agent = await asyncio.to_thread(agent_setup.get)
+            if client is not None:
+                rate_limiter.take(client)
+            async with llm_slots.aslot(agent.priority_for(user_input)):
+                await emit("path", {"path": path, "session_id": session_id})
+                version = await asyncio.to_thread(lambda: device_states.version)
+                tool_names = []
+                with span("agent"):
+                    events = agent.executor_for(user_input).astream_events(
+                        {"input": user_input, "chat_history": chat_history},
+                        config={"callbacks": [agent.timing_callbacks]},
+                        version="v2",
+                    )
+                    async for event in events:
+                        kind = event["event"]
+                        if kind == "on_chat_model_stream":
+                            text = event["data"]["chunk"].content
+                            if text:
+                                await emit("token", {"text": text})
+                        elif kind == "on_tool_start":
+                            tool_names.append(event["name"])
+                            await emit("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+                        elif kind == "on_tool_end":
+                            await emit("tool_end", {"name": event["name"], "output": str(event["data"].get("output"))})
+                        elif kind == "on_chain_end" and not event.get("parent_ids"):
+                            # The outermost run is the executor itself, whatever its class is called.
+                            bot_reply = event["data"]["output"].get("output")
+            await asyncio.to_thread(_remember, cache, cache_key, bot_reply, tool_names, device_states, version)
+            bot_reply = bot_reply or "I'm sorry, I couldn't process that."
+
+        router.route_stats.record(path, time.perf_counter() - start)
+        requests_total.inc(endpoint, path)
+        log.info("🤖 Jarvis reply (%s, stream): %s", path, bot_reply)
+        await asyncio.to_thread(conversations.append, session_id, user_input, bot_reply)
+        await emit("done", {"reply": bot_reply, "path": path})
+    except Overloaded:
+        raise
+    except Exception as e:
+        log.exception("Error during streamed agent execution: %s", e)
+        await emit("error", {"error": "An internal error occurred."})
+
+
+def transcribe(filename, stream):
+    """Transcribes an uploaded recording with Whisper; waits for a Whisper slot (may raise Overloaded).
+
+    The upload is passed on as a stream (werkzeug spools large files to disk), never copied into memory.
+    """
+    with whisper_slots.slot():
+        return groq_client.get().audio.transcriptions.create(model=WHISPER_MODEL, file=(filename, stream)).text
@@ -0,0 +1,143 @@
+"""Device gateway: the routes ESP32 boards and other device clients use, as Flask blueprints.
+
+- `state_routes`: /get_device_states, /device_states/schema and /device_states/changes, the full
+  state and long-polled deltas in JSON or the binary packet of state_codec.py.
+- `command_routes`: /chat and /transcribe for boards that send text or audio. They answer through
+  core.py like the web UI does. A client without a session_id joins the boards' shared
+  conversation, and its agent calls wait ahead of general questions.
+
+app.py mounts both (the commands under /device), so one process serves the web UI and the boards.
+appForESP32.py serves them on their own, at the paths the firmware has always used.
+"""
+import os
+
+from flask import Blueprint, Response, request, jsonify
+
+from admission import PRIORITY_DEVICE, Overloaded, rate_limiter
+from bootstrap import Lazy
+from core import answer, tools_module, transcribe
+from state_codec import BINARY_MIMETYPE, StateEncoder
+from telemetry import log, span
+
+LONG_POLL_TIMEOUT = float(os.getenv("JARVIS_LONG_POLL_TIMEOUT", 25))
+# Clients without a session_id share one conversation, as the ESP32 does.
+DEFAULT_SESSION = "esp32"
+
+state_routes = Blueprint("device_states", __name__)
+command_routes = Blueprint("device_commands", __name__)
+state_encoder = Lazy("state_encoder", lambda: StateEncoder(tools_module.get().device_states))
+
+
+@command_routes.errorhandler(Overloaded)
+def too_many_requests(e):
+    log.warning("🚦 %s (retry after %ss)", e, e.retry_after)
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+@command_routes.route('/chat', methods=['POST'])
+def chat():
+    payload = request.get_json(silent=True) or {}
+    user_input = payload.get('message')
+    session_id = payload.get('session_id') or DEFAULT_SESSION
+    log.info("\n📥 Device text message received: %s", user_input)
+
+    if not user_input:
+        return jsonify({"error": "No message provided"}), 400
+
+    try:
+        bot_reply, path = answer(user_input, session_id, request.path, request.remote_addr, PRIORITY_DEVICE)
+        return jsonify({"reply": bot_reply, "path": path})
+    except Overloaded as e:
+        return too_many_requests(e)
+    except Exception as e:
+        log.exception("Error during agent execution: %s", e)
+        return jsonify({"error": "An internal error occurred."}), 500
+
+
+@command_routes.route('/transcribe', methods=['POST'])
+def transcribe_audio():
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file found"}), 400
+    audio_file = request.files['audio']
+    rate_limiter.take(request.remote_addr)
+    try:
+        with span("transcribe", request.path):
+            return jsonify({"text": transcribe(audio_file.filename, audio_file.stream)})
+    except Overloaded as e:
+        return too_many_requests(e)
+    except Exception as e:
+        log.exception("Error during Groq transcription: %s", e)
+        return jsonify({"error": "Failed to transcribe audio."}), 500
+
+
+def wants_binary():
+    """Content negotiation: `Accept: application/vnd.jarvis.state` or `?format=binary`."""
+    if request.args.get("format"):
+        return request.args["format"] == "binary"
+    return request.accept_mimetypes.best_match(["application/json", BINARY_MIMETYPE]) == BINARY_MIMETYPE
+
+
+def encoded_state():
+    """The full state in the negotiated format, from the per-version cache."""
+    fmt, mimetype = ("binary", BINARY_MIMETYPE) if wants_binary() else ("json", "application/json")
+    version, data = state_encoder.get().encode(fmt)
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(str(version))
+    response.vary.add("Accept")
+    return version, response
+
+
+@state_routes.route('/get_device_states', methods=['GET'])
+def get_device_states():
+    """
+    This endpoint sends the status of all devices to the ESP32 in compact JSON, or in the binary
+    format of state_codec.py when asked for it. Supports If-None-Match with the state version as ETag.
+    """
+    version = tools_module.get().device_states.version
+    etag = str(version)
+    if etag in request.if_none_match:
+        return "", 304, {"ETag": f'"{etag}"'}
+    version, response = encoded_state()
+    log.info("\n📡 ESP32 is requesting device states (version %d, %s, %s bytes).",
+             version, response.mimetype, response.content_length)
+    return response
+
+
+@state_routes.route('/device_states/schema', methods=['GET'])
+def device_state_schema():
+    """Describes the layout of the binary state format (bit and offset of every device)."""
+    return jsonify(state_encoder.get().schema())
+
+
+@state_routes.route('/device_states/changes', methods=['GET'])
+def device_state_changes():
+    """
+    Long-poll endpoint for device clients. The client passes the last version it has seen
+    (`?since=<version>` or `If-None-Match: "<version>"`). The request blocks until the state changes
+    or `timeout` seconds pass, then returns only the devices changed since that version; if nothing
+    changed it returns 304. Without a version the full state is returned.
+    Binary clients (see wants_binary) always get the full state: it is a few bytes and the same
+    cached packet serves every client.
+    """
+    device_states = tools_module.get().device_states
+    since = request.args.get("since", type=int)
+    if since is None and request.if_none_match:
+        since = next((int(tag) for tag in request.if_none_match if tag.isdigit()), None)
+    timeout = min(request.args.get("timeout", LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+
+    if since is not None and not device_states.wait_for_change(since, timeout):
+        return "", 304, {"ETag": f'"{since}"'}
+
+    if wants_binary():
+        version, response = encoded_state()
+        log.info("\n📡 Device client synced from version %s to %d (%s bytes).", since, version, response.content_length)
+        return response
+    version, changes = device_states.changes_since(-1 if since is None else since)
+    full = since is None or since > version
+    log.info("\n📡 Device client synced from version %s to %d: %s", since, version, changes)
+    response = jsonify({"version": version, "full": full, "changes": changes})
+    response.set_etag(str(version))
+    return response
@@ -0,0 +1,263 @@
+"""What devices exist, where they are and what people call them.
+
+device_state.py owns the state of every device. The registry owns the rest: the room and floor of
+each device, its capabilities, and its English and Persian aliases. It keeps an index for each,
+so tools, the command router and the tool schemas never hardcode location lists.
+
+- resolve(kind, name) maps what a user or the LLM said to a device location. It tries the exact
+  name, then the aliases (one dictionary lookup after folding Persian letters, digits, spacing and
+  case), then a fuzzy match among the names of that device type. Names that fit several devices
+  resolve to nothing rather than to a guess.
+- select(kind=, room=, floor=, capability=) returns a group of devices from the smallest matching
+  index, so "all lights on floor 2" costs O(matches), not O(devices).
+
+The default house is DEFAULT_DEVICE_STATES plus DEFAULT_ROOMS. Point JARVIS_HOUSE at a JSON file
+to describe another one; see README.md for the format.
+"""
+import difflib
+import json
+import os
+import re
+from collections import namedtuple
+
+from device_state import DEFAULT_DEVICE_STATES, DEVICE_TYPES
+
+PERSIAN_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+PERSIAN_LETTERS = str.maketrans({"ي": "ی", "ك": "ک", "‌": " ", "ـ": ""})
+
+NUMBER_WORDS = {
+    "0": ["zero", "ground", "صفر", "همکف"],
+    "1": ["one", "first", "یک", "اول"],
+    "2": ["two", "second", "دو", "دوم"],
+    "3": ["three", "third", "سه", "سوم"],
+    "4": ["four", "fourth", "چهار", "چهارم"],
+}
+
+# Room -> floor, extra aliases and Persian display name. Rooms missing here are on floor 1.
+DEFAULT_ROOMS = {
+    "kitchen": {"floor": 1, "aliases": ["آشپزخانه", "آشپزخونه"], "name_fa": "آشپزخانه"},
+    "bathroom": {"floor": 1, "aliases": ["bath room", "حمام", "حموم", "دستشویی", "سرویس بهداشتی"], "name_fa": "حمام"},
+    "living_room": {"floor": 1, "aliases": ["lounge", "پذیرایی", "هال", "نشیمن"], "name_fa": "پذیرایی"},
+    "front": {"floor": 1, "aliases": ["entrance", "جلو", "جلویی", "ورودی"], "name_fa": "جلو"},
+    "back": {"floor": 1, "aliases": ["backyard", "پشتی", "عقب"], "name_fa": "پشتی"},
+    "room 1": {"floor": 2},
+    "room 2": {"floor": 2},
+}
+
+# What each device type can do; group commands pick devices by the capability a state needs.
+CAPABILITIES = {
+    "lamps": ("power",),
+    "ac_units": ("power", "temperature"),
+    "tv": ("power", "channel", "volume"),
+    "doors": ("lock",),
+    "blinds": ("open",),
+    "coffee_machine": ("power",),
+}
+STATE_CAPABILITY = {"on": "power", "off": "power", "locked": "lock", "unlocked": "lock",
+                    "open": "open", "closed": "open"}
+
+# Starting values for devices a house file declares without them.
+DEFAULT_STATES = {"doors": "locked", "blinds": "closed"}  # everything else starts "off"
+DEFAULT_FIELDS = {"temperature": 24, "channel": 1, "volume": 20}
+
+# Above this many devices of a type, tool schemas name the rooms instead of every location.
+SCHEMA_LOCATION_LIMIT = int(os.getenv("JARVIS_SCHEMA_LOCATION_LIMIT", 25))
+FUZZY_CUTOFF = 0.8
+
+Device = namedtuple("Device", ["kind", "location", "room", "floor", "capabilities", "aliases", "initial"])
+
+
+def fold(text):
+    """Lower case with Arabic letters, Persian digits and joiners mapped to their plain Persian/ASCII forms."""
+    return text.translate(PERSIAN_LETTERS).translate(PERSIAN_DIGITS).lower()
+
+
+def _key(name):
+    # Lookup key: also ignores spaces, underscores and the madda that users often leave out.
+    return re.sub(r"[\s_]+", "", fold(str(name))).replace("آ", "ا")
+
+
+def _names(name):
+    return {name, name.replace("_", " "), name.replace(" ", "").replace("_", "")}
+
+
+def _room_aliases(room, extra=()):
+    aliases = _names(room)
+    aliases.update(extra)
+    match = re.fullmatch(r"room ?(\d+)", room)
+    if match:
+        number = match.group(1)
+        for word in [number] + NUMBER_WORDS.get(number, []):
+            aliases.update([f"room {word}", f"room number {word}", f"اتاق {word}", f"اتاق شماره {word}"])
+    return aliases
+
+
+class DeviceRegistry:
+    def __init__(self, devices, rooms=None):
+        """devices: [{"type", "location", "room"?, "floor"?, "aliases"?, "state" or fields}]."""
+        self.rooms = {}
+        for room, info in (rooms or {}).items():
+            self.rooms[room] = dict(info)
+        self._devices = {}  # (kind, location) -> Device
+        self._index = {}  # (index name, value) -> [Device]
+        self._aliases = {}  # (kind, alias key) -> [location]
+        self._room_keys = {}  # alias key -> room
+        for spec in devices:
+            self._add(spec)
+        for room, info in self.rooms.items():
+            for alias in _room_aliases(room, info.get("aliases", ())):
+                self._room_keys.setdefault(_key(alias), room)
+        # Fuzzy candidates by device type and the numbers in the name.
+        self._fuzzy_keys = {}
+        for kind, alias_key in self._aliases:
+            self._fuzzy_keys.setdefault((kind, tuple(re.findall(r"\d+", alias_key))), []).append(alias_key)
+
+    @classmethod
+    def from_states(cls, states=DEFAULT_DEVICE_STATES, rooms=DEFAULT_ROOMS):
+        """A registry where every location is also the room of its device."""
+        return cls([{"type": kind, "location": location, "state": value}
+                    for kind, locations in states.items() for location, value in locations.items()], rooms)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            house = json.load(f)
+        return cls(house["devices"], house.get("rooms", {}))
+
+    def _add(self, spec):
+        kind, location = spec["type"], spec["location"]
+        if kind not in DEVICE_TYPES:
+            raise ValueError(f"Unknown device type '{kind}' for '{location}'.")
+        if (kind, location) in self._devices:
+            raise ValueError(f"Duplicate device {kind}/{location}.")
+        room = spec.get("room", location)
+        room_info = self.rooms.setdefault(room, {})
+        floor = spec.get("floor", room_info.get("floor", 1))
+        room_info.setdefault("floor", floor)
+        initial = spec.get("state", DEFAULT_STATES.get(kind, "off"))
+        field_names = DEVICE_TYPES[kind][0].FIELDS
+        if field_names != ("state",):
+            fields = dict(initial) if isinstance(initial, dict) else {"state": initial}
+            fields.update((name, spec[name]) for name in field_names if name != "state" and name in spec)
+            initial = {name: fields.get(name, DEFAULT_FIELDS.get(name)) for name in field_names}
+        aliases = _names(location)
+        aliases.update(spec.get("aliases", ()))
+        # The room's names point at the device too; if a room holds several devices of this type,
+        # those names become ambiguous and only the device names pick one.
+        aliases.update(_room_aliases(room, room_info.get("aliases", ())))
+        device = Device(kind, location, room, floor, CAPABILITIES[kind], frozenset(aliases), initial)
+
+        self._devices[(kind, location)] = device
+        for name, value in (("kind", kind), ("room", room), ("floor", floor), ("kind+room", (kind, room)),
+                            ("kind+floor", (kind, floor))) + tuple(("capability", c) for c in device.capabilities):
+            self._index.setdefault((name, value), []).append(device)
+        for alias in aliases:
+            locations = self._aliases.setdefault((kind, _key(alias)), [])
+            if location not in locations:
+                locations.append(location)
+
+    def initial_states(self):
+        """{kind: {location: value}} for DeviceStateEngine, in registry order."""
+        states = {}
+        for device in self._devices.values():
+            states.setdefault(device.kind, {})[device.location] = device.initial
+        return states
+
+    def kinds(self):
+        return tuple(dict.fromkeys(kind for kind, _ in self._devices))
+
+    def locations(self, kind):
+        return tuple(device.location for device in self._index.get(("kind", kind), ()))
+
+    def get(self, kind, location):
+        return self._devices.get((kind, location))
+
+    def floors(self):
+        return sorted({floor for name, floor in self._index if name == "floor"})
+
+    def aliases(self, kind, location):
+        """Every name of one device (for the command router's patterns)."""
+        device = self._devices.get((kind, location))
+        return set(device.aliases) if device else set()
+
+    def name_fa(self, location):
+        """The Persian display name of a location (or room), for fast-path replies."""
+        info = self.rooms.get(location, {})
+        if info.get("name_fa"):
+            return info["name_fa"]
+        match = re.fullmatch(r"room ?(\d+)", location)
+        if match:
+            return f"اتاق {match.group(1)}"
+        return location
+
+    def resolve(self, kind, name, fuzzy=True):
+        """The location of the one `kind` device called `name` (exact, alias, then fuzzy), or None."""
+        if (kind, name) in self._devices:
+            return name
+        locations = self._aliases.get((kind, _key(name)))
+        if locations:
+            return locations[0] if len(locations) == 1 else None
+        if fuzzy:
+            close = self.suggest(kind, name, count=2)
+            if len(close) == 1:
+                return close[0]
+        return None
+
+    def suggest(self, kind, name, count=3):
+        """Locations whose names are close to `name`, best first (for 'did you mean' errors)."""
+        # Numbers are never fuzzy: "room 3" is not a typo of "room 1".
+        digits = tuple(re.findall(r"\d+", _key(name)))
+        keys = self._fuzzy_keys.get((kind, digits), ())
+        found = []
+        for alias_key in difflib.get_close_matches(_key(name), keys, n=count * 2, cutoff=FUZZY_CUTOFF):
+            for location in self._aliases[(kind, alias_key)]:
+                if location not in found:
+                    found.append(location)
+        return found[:count]
+
+    def resolve_room(self, name):
+        """The room called `name` (by any alias), or None."""
+        room = self._room_keys.get(_key(name))
+        if room is None:
+            digits = re.findall(r"\d+", _key(name))
+            keys = [key for key in self._room_keys if re.findall(r"\d+", key) == digits]
+            close = difflib.get_close_matches(_key(name), keys, n=1, cutoff=FUZZY_CUTOFF)
+            room = self._room_keys[close[0]] if close else None
+        return room
+
+    def select(self, kind=None, room=None, floor=None, capability=None):
+        """Devices matching every given filter, read from the most specific index."""
+        if kind is not None and room is not None:
+            candidates = self._index.get(("kind+room", (kind, room)), [])
+        elif kind is not None and floor is not None:
+            candidates = self._index.get(("kind+floor", (kind, floor)), [])
+        else:
+            lists = [self._index.get((name, value), []) for name, value in
+                     (("kind", kind), ("room", room), ("floor", floor), ("capability", capability)) if value is not None]
+            candidates = min(lists, key=len) if lists else list(self._devices.values())
+        return [device for device in candidates
+                if (kind is None or device.kind == kind) and (room is None or device.room == room)
+                and (floor is None or device.floor == floor)
+                and (capability is None or capability in device.capabilities)]
+
+    def describe_rooms(self):
+        """Argument description of a room filter, for tool schemas."""
+        text = "Only the devices in this room; empty for the whole house."
+        if len(self.rooms) <= SCHEMA_LOCATION_LIMIT:
+            text += " Rooms: " + ", ".join(f"'{room}'" for room in self.rooms) + "."
+        return text
+
+    def describe_locations(self, kind):
+        """Argument description listing the valid locations of a device type, for tool schemas."""
+        locations = self.locations(kind)
+        if len(locations) <= SCHEMA_LOCATION_LIMIT:
+            return "One of: " + ", ".join(f"'{location}'" for location in locations) + "."
+        rooms = sorted({device.room for device in self._index[("kind", kind)]})
+        return (f"A device name or its room ({len(locations)} devices). Rooms: "
+                + ", ".join(f"'{room}'" for room in rooms) + ".")
+
+
+def registry_from_env():
+    """The house in JARVIS_HOUSE (a JSON file), or the default house."""
+    path = os.getenv("JARVIS_HOUSE")
+    return DeviceRegistry.from_file(path) if path else DeviceRegistry.from_states()
@@ -0,0 +1,441 @@
+"""Single owner of all device state.
+
+Every device is stored as a small immutable record (``__slots__`` classes below). Writers are
+serialised by one lock and publish a new view with copy-on-write of only the device types they
+touched; readers grab the current view without locking, so they always see a consistent state
+and never copy the whole tree. Each commit bumps a global version, and every record and device
+type remembers the version of its last change.
+
+With a shared storage backend (see storage.py) the view is a cache of the stored state: reads
+reload it when the stored version moved on (checked at most every JARVIS_STATE_SYNC_INTERVAL
+seconds), and writes are compare-and-set on the version, retried when another worker got there first.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from telemetry import log
+
+
+class DeviceRecord:
+    __slots__ = ("version",)
+    FIELDS = ()
+
+    def __init__(self, version=0, **fields):
+        object.__setattr__(self, "version", version)
+        for name in self.FIELDS:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable; use DeviceStateEngine.update()")
+
+    def replace(self, version, **changes):
+        fields = {name: changes.get(name, getattr(self, name)) for name in self.FIELDS}
+        return type(self)(version, **fields)
+
+    def fields(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def to_json(self):
+        """The JSON shape the rest of the app uses: a bare state string or a dict of fields."""
+        return self.fields()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.fields() == other.fields()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields}, version={self.version})"
+
+
+class Switch(DeviceRecord):
+    __slots__ = ("state",)
+    FIELDS = ("state",)
+
+    def to_json(self):
+        return self.state
+
+
+class ACUnit(DeviceRecord):
+    __slots__ = ("state", "temperature")
+    FIELDS = ("state", "temperature")
+
+
+class TV(DeviceRecord):
+    __slots__ = ("state", "channel", "volume")
+    FIELDS = ("state", "channel", "volume")
+
+
+# Device type -> (record class, allowed values of the "state" field).
+DEVICE_TYPES = {
+    "lamps": (Switch, ("on", "off")),
+    "ac_units": (ACUnit, ("on", "off")),
+    "tv": (TV, ("on", "off")),
+    "doors": (Switch, ("locked", "unlocked")),
+    "blinds": (Switch, ("open", "closed")),
+    "coffee_machine": (Switch, ("on", "off")),
+}
+
+# Allowed range (inclusive) of each numeric field, per device type.
+FIELD_RANGES = {
+    "ac_units": {"temperature": (16, 30)},
+    "tv": {"channel": (1, 999), "volume": (0, 100)},
+}
+
+DEFAULT_DEVICE_STATES = {
+    "lamps": {
+        "kitchen": "off",
+        "bathroom": "off",
+        "room 1": "off",
+        "room 2": "off",
+    },
+    "ac_units": {
+        "room 1": {"state": "off", "temperature": 24},
+        "kitchen": {"state": "off", "temperature": 25},
+    },
+    "tv": {
+        "living_room": {"state": "off", "channel": 1, "volume": 20}
+    },
+    "doors": {
+        "front": "locked",
+        "back": "locked"
+    },
+    "blinds": {
+        "kitchen": "closed",
+        "room 1": "closed"
+    },
+    "coffee_machine": {
+        "kitchen": "off"
+    }
+}
+
+# Result of one write: the record before and after, and the version it was committed under.
+Change = namedtuple("Change", ["kind", "location", "old", "new", "version"])
+
+_View = namedtuple("_View", ["version", "devices", "kind_versions"])
+
+SYNC_INTERVAL = float(os.getenv("JARVIS_STATE_SYNC_INTERVAL", 0))
+# How often wait_for_change() looks at the shared store for changes made by other workers.
+POLL_INTERVAL = float(os.getenv("JARVIS_STATE_POLL_INTERVAL", 0.25))
+
+
+def _make_record(kind, value, version=0):
+    record_class, _ = DEVICE_TYPES[kind]
+    if isinstance(value, dict):
+        return record_class(version, **value)
+    return record_class(version, state=value)
+
+
+def _location_key(location):
+    return location.lower().replace(" ", "").replace("_", "")
+
+
+def _stored(view):
+    """A view as plain data: (version, {kind: {location: (fields, version)}}, {kind: version})."""
+    return view.version, {
+        kind: {location: (record.fields(), record.version) for location, record in locations.items()}
+        for kind, locations in view.devices.items()
+    }, dict(view.kind_versions)
+
+
+def _from_stored(version, devices, kind_versions):
+    return _View(version, {
+        kind: {location: _make_record(kind, fields, record_version)
+               for location, (fields, record_version) in locations.items()}
+        for kind, locations in devices.items()
+    }, kind_versions)
+
+
+def _restored(defaults, version, devices, kind_versions):
+    """The default view with every recovered device that still exists laid over it."""
+    restored = {kind: dict(locations) for kind, locations in defaults.devices.items()}
+    for kind, locations in devices.items():
+        for location, (fields, record_version) in locations.items():
+            default = restored.get(kind, {}).get(location)
+            if default is not None:
+                restored[kind][location] = _make_record(kind, {**default.fields(), **fields}, record_version)
+    restored_kinds = {kind: kind_versions.get(kind, 0) for kind in restored}
+    return _View(version, restored, restored_kinds)
+
+
+class DeviceStateEngine:
+    def __init__(self, initial=None, backend=None, journal=None, sync_interval=SYNC_INTERVAL):
+        initial = DEFAULT_DEVICE_STATES if initial is None else initial
+        devices = {
+            kind: {location: _make_record(kind, value) for location, value in locations.items()}
+            for kind, locations in initial.items()
+        }
+        self._view = _View(0, devices, {kind: 0 for kind in devices})
+        self._write_lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._backend = backend
+        self._journal = journal
+        self._listeners = []
+        self._watcher = None
+        self._sync_lock = threading.Lock()
+        self.sync_interval = sync_interval
+        self._synced_at = 0.0
+        if backend is not None:
+            backend.seed(*_stored(self._view))
+            self._sync(force=True)
+        if journal is not None:
+            recovered = journal.recover()
+            if recovered is not None:
+                self._view = _restored(self._view, *recovered)
+            journal.open(lambda: _stored(self._view))
+
+    @property
+    def shared(self):
+        """True when other processes can change the state too (a shared storage backend)."""
+        return self._backend is not None
+
+    def add_listener(self, listener):
+        """Calls listener(version, {kind: {location: value}}) after every change, in version order.
+
+        Listeners run under the write lock, so they must be quick (see state_events.ChangeHub).
+        """
+        self._listeners.append(listener)
+
+    def watch(self):
+        """With a shared backend, changes made by other workers are only seen (and passed to the
+        listeners) when the store is read; this starts a background thread that keeps reading it."""
+        if self._backend is None or self._watcher is not None:
+            return
+        with self._sync_lock:
+            if self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name="jarvis-state-watch", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while True:
+            try:
+                self.wait_for_change(self.version, timeout=30)
+            except Exception as e:
+                log.warning("⚠️ Watching the shared state failed: %s", e)
+                time.sleep(1)
+
+    def _notify(self, version, changes):
+        for listener in self._listeners:
+            try:
+                listener(version, changes)
+            except Exception as e:
+                log.warning("⚠️ State change listener failed: %s", e)
+
+    def _current(self):
+        """The view to read from; with a shared backend, reloaded first if another worker wrote."""
+        if self._backend is not None:
+            return self._sync()
+        return self._view
+
+    def _sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._synced_at < self.sync_interval:
+            return self._view
+        self._synced_at = now
+        view = self._view
+        if self._backend.version() == view.version:
+            return view
+        with self._sync_lock:
+            old = self._view
+            view = _from_stored(*self._backend.load())
+            if view.version <= old.version:
+                return old
+            self._view = view
+            if self._listeners:
+                changed = {}
+                for kind, locations in view.devices.items():
+                    if view.kind_versions.get(kind, 0) > old.version:
+                        changed[kind] = {location: record.to_json() for location, record in locations.items()
+                                         if record.version > old.version}
+                self._notify(view.version, changed)
+        with self._changed:
+            self._changed.notify_all()
+        return view
+
+    @property
+    def version(self):
+        return self._current().version
+
+    def kind_version(self, kind):
+        return self._current().kind_versions.get(kind, 0)
+
+    def kinds(self):
+        return tuple(self._current().devices)
+
+    def locations(self, kind):
+        return tuple(self._current().devices.get(kind, ()))
+
+    def resolve(self, kind, location):
+        """Maps a user-supplied location ('Room1', 'living room') to its canonical name, or None."""
+        locations = self._current().devices.get(kind, {})
+        if location in locations:
+            return location
+        key = _location_key(location)
+        for name in locations:
+            if _location_key(name) == key:
+                return name
+        return None
+
+    def get(self, kind, location):
+        return self._current().devices.get(kind, {}).get(location)
+
+    def snapshot(self, kind=None):
+        """Plain-dict copy of the current state (or of one device type) for JSON responses."""
+        devices = self._current().devices
+        if kind is not None:
+            return {location: record.to_json() for location, record in devices[kind].items()}
+        return {
+            kind: {location: record.to_json() for location, record in locations.items()}
+            for kind, locations in devices.items()
+        }
+
+    def changes_since(self, since):
+        """Returns (version, {kind: {location: value}}) with every device written after `since`.
+
+        Pass -1 for the full state. A `since` newer than the current version (e.g. a client that
+        outlived a server restart) also gets the full state.
+        """
+        view = self._current()
+        if since > view.version:
+            since = -1
+        changes = {}
+        for kind, locations in view.devices.items():
+            if view.kind_versions[kind] > since or since < 0:
+                changed = {location: record.to_json() for location, record in locations.items()
+                           if record.version > since}
+                if changed:
+                    changes[kind] = changed
+        return view.version, changes
+
+    def wait_for_change(self, since, timeout):
+        """Blocks until the version differs from `since` or `timeout` seconds pass; returns True on change."""
+        if self._backend is None:
+            with self._changed:
+                return self._changed.wait_for(lambda: self._view.version != since, timeout)
+        # Writes by other workers do not notify this process, so the store is polled as well.
+        deadline = time.monotonic() + timeout
+        while self._sync(force=True).version == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._changed:
+                self._changed.wait(min(remaining, POLL_INTERVAL))
+        return True
+
+    def validate(self, kind, location, fields, view=None):
+        """Returns an error message for an invalid write, or None.
+
+        Every write goes through this (apply() runs it on each operation), so the type and range
+        rules for device fields live here and nowhere else; tools and routes call it to turn a bad
+        request into an error message instead of an exception.
+        """
+        view = view or self._current()
+        if not isinstance(kind, str) or kind not in view.devices:
+            return f"Unknown device type '{kind}'."
+        if not isinstance(location, str):
+            return f"The {kind} location must be a string."
+        if not isinstance(fields, dict):
+            return "The fields to set must be an object."
+        record = view.devices[kind].get(location)
+        if record is None:
+            return f"Unknown {kind} location '{location}'."
+        unknown = set(fields) - set(record.FIELDS)
+        if unknown:
+            return f"Unknown field(s) for {kind}: {', '.join(sorted(unknown))}."
+        _, states = DEVICE_TYPES[kind]
+        if "state" in fields and fields["state"] not in states:
+            return f"Invalid state '{fields['state']}' for {kind}. Must be one of: {', '.join(states)}."
+        for name, value in fields.items():
+            if name == "state":
+                continue
+            if not isinstance(value, int) or isinstance(value, bool):
+                return f"Field '{name}' for {kind} must be an integer."
+            low, high = FIELD_RANGES.get(kind, {}).get(name, (value, value))
+            if not low <= value <= high:
+                return f"Field '{name}' for {kind} must be between {low} and {high}."
+        return None
+
+    def update(self, kind, location, **fields):
+        """Writes one device and returns its Change."""
+        return self.apply([(kind, location, fields)])[0]
+
+    def apply(self, operations):
+        """Atomically applies [(kind, location, fields), ...] under a single new version.
+
+        All operations are validated before anything is written; a ValueError is raised if any of
+        them is invalid. Writes that do not change anything do not bump the version. With a
+        journal, this returns once the write is durable; concurrent writers share one fsync.
+        Once the journal has failed, every write raises JournalFailedError and changes nothing.
+        """
+        with self._write_lock:
+            if self._journal is not None:
+                self._journal.check()
+            while True:
+                view = self._view if self._backend is None else self._sync(force=True)
+                for kind, location, fields in operations:
+                    error = self.validate(kind, location, fields, view)
+                    if error:
+                        raise ValueError(error)
+
+                new_view, changes = self._applied(view, operations)
+                if new_view is None:
+                    return changes
+                written = _written(changes, new_view.version)
+                if self._backend is not None and not self._backend.commit(
+                        view.version, new_view.version,
+                        [(kind, location, record.fields(), record.version) for (kind, location), record in written.items()],
+                        {kind: new_view.kind_versions[kind] for kind, _ in written}):
+                    continue  # another worker wrote first; redo the operations on top of its state
+                with self._sync_lock:
+                    # A reader may already have loaded (and announced) this commit from the shared store.
+                    if self._view.version < new_view.version:
+                        self._view = new_view
+                        if self._listeners:
+                            changed = {}
+                            for (kind, location), record in written.items():
+                                changed.setdefault(kind, {})[location] = record.to_json()
+                            self._notify(new_view.version, changed)
+                # Appended after the view is published: a snapshot taken now must include this record.
+                ticket = None
+                if self._journal is not None:
+                    ticket = self._journal.append(
+                        new_view.version, [(kind, location, record.fields()) for (kind, location), record in written.items()])
+                with self._changed:
+                    self._changed.notify_all()
+                break
+        # Outside the write lock, so the next writers can queue their records for the same fsync.
+        if ticket is not None:
+            self._journal.wait(ticket)
+        return changes
+
+    @staticmethod
+    def _applied(view, operations):
+        """Returns (new view or None if nothing changed, [Change, ...])."""
+        version = view.version + 1
+        devices = dict(view.devices)
+        kind_versions = dict(view.kind_versions)
+        copied = set()
+        changes = []
+        for kind, location, fields in operations:
+            if kind not in copied:
+                devices[kind] = dict(devices[kind])
+                copied.add(kind)
+            old = devices[kind][location]
+            new = old.replace(version, **fields)
+            if new == old:
+                changes.append(Change(kind, location, old, old, view.version))
+                continue
+            devices[kind][location] = new
+            kind_versions[kind] = version
+            changes.append(Change(kind, location, old, new, version))
+
+        if not any(change.version == version for change in changes):
+            return None, changes
+        return _View(version, devices, kind_versions), changes
+
+
+def _written(changes, version):
+    """{(kind, location): final record} of the devices a commit under `version` changed."""
+    return {(change.kind, change.location): change.new for change in changes if change.version == version}
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) that avoids loading a tokenizer."""
+    return len(text) // 4 + 1
+
+
+def summarize_turns(previous_summary, turns, max_tokens):
+    """Default local summariser: keeps the first sentence of every old turn, newest last.
+
+    `turns` is a list of (user_text, reply) tuples. The result is trimmed from the front so it
+    never exceeds max_tokens. Swap in an LLM-backed callable with the same signature if needed.
+    """
+    lines = [previous_summary] if previous_summary else []
+    for user_text, reply in turns:
+        lines.append(f"User: {_first_sentence(user_text)} / Jarvis: {_first_sentence(reply)}")
+    summary = "\n".join(lines)
+    max_chars = max_tokens * 4
+    if len(summary) > max_chars:
+        summary = summary[-max_chars:]
+        summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+    return summary
+
+
+def _first_sentence(text, limit=120):
+    text = " ".join(text.split())
+    for mark in (". ", "! ", "? ", "؟ "):
+        index = text.find(mark)
+        if 0 < index < limit:
+            return text[:index + 1]
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class _Session:
+    __slots__ = ("lock", "turns", "tokens", "summary", "last_used")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns = deque()  # (user_text, reply, tokens)
+        self.tokens = 0
+        self.summary = ""
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """Per-session chat history with a token budget, rolling summaries and LRU eviction.
+
+    Each session keeps its most recent turns verbatim while they fit in `token_budget`; older
+    turns are folded into a short summary capped at `summary_tokens`. At most `max_sessions`
+    sessions are kept and sessions idle for longer than `idle_timeout` seconds are dropped, so
+    memory stays bounded regardless of how many clients connect.
+
+    With a shared `backend` (see storage.py) sessions are loaded from and saved to it on every
+    turn instead, so any worker can continue any conversation. Appends to one session are
+    serialised within the process (the web UI and an attached terminal share it), so concurrent
+    turns do not overwrite each other's load-modify-save.
+    """
+
+    def __init__(self, max_sessions=1000, token_budget=1500, summary_tokens=300,
+                 idle_timeout=3600, summarizer=summarize_turns, backend=None):
+        self.max_sessions = max_sessions
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.idle_timeout = idle_timeout
+        self.summarizer = summarizer
+        self.backend = backend
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # Striped by session id: bounded memory, and unrelated sessions rarely wait for each other.
+        self._backend_locks = [threading.Lock() for _ in range(64)]
+
+    def _stored_session(self, session_id):
+        session = _Session()
+        data = self.backend.load_session(session_id)
+        if data:
+            session.summary = data["summary"]
+            session.turns.extend(tuple(turn) for turn in data["turns"])
+            session.tokens = sum(tokens for _, _, tokens in session.turns)
+        return session
+
+    def _session(self, session_id):
+        if self.backend is not None:
+            return self._stored_session(session_id)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            # The oldest entries sit at the front, so stop at the first one that is still fresh.
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_used <= self.idle_timeout:
+                    break
+                del self._sessions[oldest_id]
+        return session
+
+    def get_messages(self, session_id):
+        """Returns the LangChain messages to pass as `chat_history` for this session."""
+        # Imported here so the fast path never has to load LangChain.
+        from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+        session = self._session(session_id)
+        with session.lock:
+            messages = []
+            if session.summary:
+                messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{session.summary}"))
+            for user_text, reply, _ in session.turns:
+                messages.extend([HumanMessage(content=user_text), AIMessage(content=reply)])
+        return messages
+
+    def append(self, session_id, user_text, reply):
+        if self.backend is None:
+            self._append(session_id, self._session(session_id), user_text, reply)
+            return
+        with self._backend_locks[hash(session_id) % len(self._backend_locks)]:
+            self._append(session_id, self._stored_session(session_id), user_text, reply)
+
+    def _append(self, session_id, session, user_text, reply):
+        # A single oversized turn must not blow the budget on its own.
+        max_chars = self.token_budget * 2
+        user_text, reply = user_text[:max_chars], reply[:max_chars]
+        tokens = estimate_tokens(user_text) + estimate_tokens(reply)
+        with session.lock:
+            session.turns.append((user_text, reply, tokens))
+            session.tokens += tokens
+
+            evicted = []
+            while session.tokens > self.token_budget and len(session.turns) > 1:
+                old_user, old_reply, old_tokens = session.turns.popleft()
+                session.tokens -= old_tokens
+                evicted.append((old_user, old_reply))
+            if evicted:
+                session.summary = self.summarizer(session.summary, evicted, self.summary_tokens)
+            if self.backend is not None:
+                self.backend.save_session(session_id, {"summary": session.summary, "turns": list(session.turns)},
+                                          self.idle_timeout, self.max_sessions)
+
+    def clear(self, session_id):
+        if self.backend is not None:
+            self.backend.delete_session(session_id)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,71 @@
+"""Shared keep-alive HTTP client for every outbound call made by the tools.
+
+`get()` uses one pooled `requests.Session` and retries transient failures (connection errors,
+timeouts, 429 and 5xx) with exponential backoff, but never past the call's overall time budget.
+The tools are synchronous; on the async paths LangChain runs them in worker threads, which share
+the same pool.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 10))
+POOL_SIZE_PER_HOST = int(os.getenv("HTTP_POOL_SIZE_PER_HOST", 10))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2))
+DEFAULT_BUDGET = float(os.getenv("HTTP_TIMEOUT_BUDGET", 5))
+MAX_ATTEMPTS = int(os.getenv("HTTP_MAX_ATTEMPTS", 3))
+BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.2))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                new_session = requests.Session()
+                # pool_block caps concurrent connections per host instead of opening throwaway ones.
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE_PER_HOST, pool_block=True)
+                new_session.mount("http://", adapter)
+                new_session.mount("https://", adapter)
+                _session = new_session
+    return _session
+
+
+def _backoff(attempt):
+    return BACKOFF * (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def get(url, budget=DEFAULT_BUDGET, **kwargs):
+    """GET through the shared session, retrying transient failures within `budget` seconds.
+
+    Raises the same `requests` exceptions as `requests.get`; the last failure is raised once the
+    attempts or the budget run out.
+    """
+    deadline = time.monotonic() + budget
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            response = session().get(url, timeout=(min(CONNECT_TIMEOUT, remaining), remaining), **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                return response
+            error = None
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            response, error = None, e
+
+        attempt += 1
+        delay = _backoff(attempt - 1)
+        if attempt >= MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
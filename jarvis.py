@@ -1,138 +1,129 @@
+"""Terminal transport: chat with Jarvis from the console.
+
+    python jarvis.py [--server URL | --local] [--serve] [--host 127.0.0.1] [--port 5001]
+
+By default the console attaches to a Jarvis server that is already running (JARVIS_SERVER, default
+http://127.0.0.1:5001) and sends every message to its /chat. It then uses that server's warm agent,
+caches, device state and history, and builds nothing itself. When no server answers (or with
+--local) the core (core.py) runs in this process instead. --serve also starts the web UI and the
+ESP32 gateway (app.py) in this process, so all three transports share one agent.
+"""
+import argparse
 import os
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.messages import HumanMessage, AIMessage
+import threading
+import uuid
+
+import requests
 from rich.console import Console
 
-# Import tools
-from tools import (
-    toggle_light,
-    set_ac_temperature,
-    get_device_status,
-    get_weather,
-    get_latest_news,
-    get_current_datetime,
-    turn_on_ac,
-    turn_off_ac,
-    turn_on_tv,
-    turn_off_tv,
-    change_tv_channel,
-    set_tv_volume,
-    activate_guest_mode,
-    stop_coffee_machine,
-    start_coffee_machine,
-    turn_off_all_lights,
-    close_blinds,
-    open_blinds,
-    unlock_door,
-    lock_door
-)
-
-# Load API key
-load_dotenv()
-if not os.getenv("GROQ_API_KEY"):
-    print("Error: GROQ_API_KEY not found.")
-    exit()
+DEFAULT_SERVER = os.getenv("JARVIS_SERVER", "http://127.0.0.1:5001")
+PROBE_TIMEOUT = 0.5
+CHAT_TIMEOUT = 120
 
 # Console for display
 console = Console()
 
-# Initialize LLM
-# llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)  # best model
-llm = ChatGroq(model="llama3-70b-8192", temperature=0)
-# llm = ChatGroq(model="llama3-8b-8192", temperature=0)   # faster
-
-# Tools list
-tools = [
-    toggle_light,
-    set_ac_temperature,
-    get_device_status,
-    get_weather,
-    get_latest_news,
-    get_current_datetime,
-    turn_on_ac,
-    turn_off_ac,
-    turn_on_tv,
-    turn_off_tv,
-    change_tv_channel,
-    set_tv_volume,
-    activate_guest_mode,
-    stop_coffee_machine,
-    start_coffee_machine,
-    turn_off_all_lights,
-    close_blinds,
-    open_blinds,
-    unlock_door,
-    lock_door
-]
-
-# Prompt template
-prompt_template = """
-You are a powerful and helpful smart home assistant. Your name is Jarvis.
-
-Follow these rules strictly:
-1. You MUST respond in the same language as the user's query (English or Persian).
-2. Be conversational and friendly, but get straight to the point.
-3. Think about which tool is the best fit for the user's request.
-4. If you are asked to do something you cannot do with your tools, politely say that you are unable to do so.
-5. After executing all necessary tools for a multi-part request, synthesize all the results into a single, final answer.
-6. If you already called a tool and received the answer, do not call the tool again. Just return a final response to the user.
-7. The default language is English. default city for weather is Tehran, default state for news is US.
-
-Here is the conversation history:
-{chat_history}
-
-User's new input: {input}
-
-Your response (including any tool calls):
-{agent_scratchpad}
-"""
-prompt = ChatPromptTemplate.from_template(prompt_template)
 
-# Agent creation
-agent = create_tool_calling_agent(llm, tools, prompt)
+class RemoteChat:
+    """Talks to a running server over HTTP; the server keeps the history under our session id."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        self.session_id = None
+
+    def probe(self):
+        try:
+            return self.http.get(f"{self.url}/health", timeout=PROBE_TIMEOUT).ok
+        except requests.RequestException:
+            return False
+
+    def ask(self, text):
+        response = self.http.post(f"{self.url}/chat", json={"message": text, "session_id": self.session_id},
+                                  timeout=CHAT_TIMEOUT)
+        if response.status_code == 429:
+            return f"I'm busy right now, try again in {response.headers.get('Retry-After', 1)}s.", "busy"
+        response.raise_for_status()
+        payload = response.json()
+        self.session_id = payload.get("session_id", self.session_id)
+        return payload["reply"], payload.get("path")
+
+
+class LocalChat:
+    """Answers through core.py in this process."""
+
+    def __init__(self, core):
+        self.core = core
+        self.session_id = f"cli-{uuid.uuid4().hex}"
+
+    def ask(self, text):
+        return self.core.answer(text, self.session_id, endpoint="cli")
+
+
+def serve(host, port):
+    """Runs app.py (web UI and ESP32 gateway) in a background thread of this process."""
+    from werkzeug.serving import make_server
+
+    import app
+
+    server = make_server(host, port, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="jarvis-http", daemon=True).start()
+    console.print(f"[bold green]🌐 Web UI and ESP32 gateway on http://{host}:{port}[/bold green]")
+
+
+def connect(args):
+    if not args.local and not args.serve:
+        remote = RemoteChat(args.server)
+        if remote.probe():
+            console.print(f"[green]🔗 Attached to the Jarvis server at {remote.url}.[/green]")
+            return remote
+        if args.server != DEFAULT_SERVER:
+            raise SystemExit(f"Error: no Jarvis server answers at {args.server}.")
+    if not os.getenv("GROQ_API_KEY"):
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not os.getenv("GROQ_API_KEY"):
+            raise SystemExit("Error: GROQ_API_KEY not found.")
+    # Replies are printed by the console; the per-request log lines would only repeat them.
+    os.environ.setdefault("JARVIS_LOG_LEVEL", "WARNING")
+    import core
+
+    if args.serve:
+        serve(args.host, args.port)
+    # Builds the agent while the user is typing their first message.
+    core.start(verbose=False)
+    return LocalChat(core)
 
-agent_executor = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True
-)
 
 # Main loop
 def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="URL of a running Jarvis server to attach to")
+    parser.add_argument("--local", action="store_true", help="run the agent in this process even if a server is up")
+    parser.add_argument("--serve", action="store_true", help="also serve the web UI and ESP32 gateway from this process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+
+    chat = connect(args)
     console.print("[bold green]🤖 Smart Home Assistant Jarvis is active.[/bold green] Type 'exit' to quit.")
 
-    chat_history = []
-
     while True:
         user_input = console.input("[bold blue]You: [/bold blue]")
         if user_input.lower() == 'exit':
             console.print("🤖 [bold red]Goodbye![/bold red]")
             break
+        if not user_input.strip():
+            continue
 
         console.print("[yellow]Jarvis is thinking...[/yellow]")
 
         try:
-            response = agent_executor.invoke({
-                "input": user_input,
-                "chat_history": chat_history
-            })
-
-            console.print(f"[bold green]Assistant:[/bold green] {response['output']}")
-            chat_history.extend([
-                HumanMessage(content=user_input),
-                AIMessage(content=response['output'])
-            ])
-            chat_history = chat_history[-10:]  # Keep last 10 messages
-
+            reply, _ = chat.ask(user_input)
+            console.print(f"[bold green]Assistant:[/bold green] {reply}")
         except Exception as e:
             console.print(f"[bold red]An error occurred: {e}[/bold red]")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,344 @@
+"""Crash-safe persistence of the in-memory device state: an append-only journal plus compacted snapshots.
+
+Every committed write is appended to the current journal segment as one framed record
+(length, CRC32, compact JSON). Writers do not fsync on their own. With sync="commit" (the default)
+the first writer waiting for durability becomes the leader: it writes and fsyncs every record
+buffered so far in one go, and the writers that queued up behind it return together (group
+commit). sync="interval" fsyncs in the background every `fsync_interval` seconds and never makes
+writers wait. A crash can then lose that window of writes. sync="off" leaves flushing to the OS.
+
+After `snapshot_every` records a background thread starts a new segment, writes the full state to
+snapshot-<version>.json (atomically, via rename) and deletes the older segments and snapshots.
+Recovery loads the newest snapshot and replays the newer records. A torn record at the end of a
+segment (a crash mid-write) fails its CRC check and is ignored.
+
+If writing or fsyncing a batch fails, the journal stops: the records may be half written, and after a
+failed fsync the OS may have dropped the dirty pages, so retrying could report data as durable when it
+is not. The writers waiting for that batch, and every later one, get JournalFailedError, and the
+state engine refuses new changes (see check()) instead of applying ones that cannot be persisted.
+
+JARVIS_STATE_DIR picks the directory (default `state`; `off` disables persistence). Only one
+process can own a directory. Use JARVIS_STORAGE (see storage.py) to share state between processes.
+"""
+import atexit
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from telemetry import log
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_HEADER = struct.Struct("<II")  # payload length, CRC32 of the payload
+
+
+class JournalLockedError(RuntimeError):
+    """Another process is already writing to this state directory."""
+
+
+class JournalFailedError(RuntimeError):
+    """A write or fsync of the journal failed; nothing appended since then is durable."""
+
+
+def _fsync_directory(path):
+    # Makes a rename or a new file durable; not possible (nor needed) on Windows.
+    if fcntl is None:
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def lock_file(path):
+    """Opens `path` holding an exclusive lock on it; raises JournalLockedError if another process has it."""
+    lock_file = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        raise JournalLockedError(f"{path} is locked by another process")
+    return lock_file
+
+
+class StateJournal:
+    def __init__(self, directory, sync="commit", fsync_interval=0.01, snapshot_every=1000):
+        if sync not in ("commit", "interval", "off"):
+            raise ValueError(f"Unknown journal sync mode '{sync}'. Use commit, interval or off.")
+        self.directory = directory
+        self.sync = sync
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        try:
+            self._lock_file = lock_file(os.path.join(directory, "LOCK"))
+        except JournalLockedError:
+            raise JournalLockedError(f"{directory} is used by another process")
+
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._pending = []  # encoded records not yet written to the file
+        self._appended = 0  # records appended since start-up; also the ticket of the last one
+        self._durable = 0  # records written (and fsynced, unless sync="off")
+        self._flushing = False
+        self._since_snapshot = 0
+        self._compacting = False
+        self._compact_lock = threading.Lock()
+        self._state = None
+        self._replayed = 0
+        self._file = None
+        self._segment = 0
+        self._closed = False
+        self._failed = None  # JournalFailedError once a write failed; raised to every later waiter
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "journal-*.log")))
+
+    def _snapshots(self):
+        paths = glob.glob(os.path.join(self.directory, "snapshot-*.json"))
+        return sorted(paths, key=lambda path: int(os.path.basename(path)[9:-5]))
+
+    def recover(self):
+        """Returns (version, {kind: {location: (fields, version)}}, {kind: version}), or None if empty."""
+        version, devices, kind_versions = None, {}, {}
+        self._replayed = 0
+        for path in reversed(self._snapshots()):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                log.warning("⚠️ Skipping unreadable snapshot %s", path)
+                continue
+            version = snapshot["version"]
+            kind_versions = snapshot["kind_versions"]
+            devices = {kind: {location: (fields, record_version) for location, (fields, record_version) in locations.items()}
+                       for kind, locations in snapshot["devices"].items()}
+            break
+
+        for path in self._segments():
+            for record in self._read_segment(path):
+                record_version = record["v"]
+                if version is not None and record_version <= version:
+                    continue
+                for kind, location, fields in record["w"]:
+                    devices.setdefault(kind, {})[location] = (fields, record_version)
+                    kind_versions[kind] = record_version
+                version = record_version
+                self._replayed += 1
+        return None if version is None else (version, devices, kind_versions)
+
+    @staticmethod
+    def _read_segment(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, offset)
+            payload = data[offset + _HEADER.size:offset + _HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                log.warning("⚠️ Ignoring a torn record at the end of %s", path)
+                return
+            yield json.loads(payload)
+            offset += _HEADER.size + length
+
+    def open(self, state):
+        """Starts a new segment for appends; `state()` must return the current state in recover()'s format."""
+        self._state = state
+        segments = self._segments()
+        self._segment = int(os.path.basename(segments[-1])[8:-4]) + 1 if segments else 1
+        self._file = self._open_segment(self._segment)
+        # Records replayed at start-up count towards the next snapshot, so a long journal gets compacted.
+        self._since_snapshot = self._replayed
+        if self._since_snapshot >= self.snapshot_every:
+            self._compacting = True
+            threading.Thread(target=self.compact, name="jarvis-snapshot", daemon=True).start()
+        if self.sync == "interval":
+            threading.Thread(target=self._flush_periodically, name="jarvis-journal", daemon=True).start()
+        atexit.register(self.close)
+        return self
+
+    def _open_segment(self, number):
+        f = open(os.path.join(self.directory, f"journal-{number:08d}.log"), "ab")
+        _fsync_directory(self.directory)
+        return f
+
+    def append(self, version, writes):
+        """Buffers one committed write [(kind, location, fields)]; returns a ticket for wait().
+
+        Call it in commit order (the state engine does, under its write lock).
+        """
+        payload = json.dumps({"v": version, "w": writes}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._pending.append(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._appended += 1
+            ticket = self._appended
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, name="jarvis-snapshot", daemon=True).start()
+        return ticket
+
+    def check(self):
+        """Raises JournalFailedError if an earlier write failed, so the caller can refuse a new change."""
+        with self._lock:
+            if self._failed is not None:
+                raise self._failed
+
+    def wait(self, ticket):
+        """Blocks until the record with this ticket is written (and fsynced with sync="commit").
+
+        With sync="interval" it returns at once; the background flush writes the record.
+        """
+        if self.sync != "interval":
+            self._flush(ticket)
+
+    def _flush(self, ticket=None):
+        """Writes the buffered records up to `ticket` (default: all), sharing the fsync with other waiters."""
+        with self._lock:
+            target = self._appended if ticket is None else ticket
+            while self._durable < target:
+                if self._failed is not None:
+                    raise self._failed
+                if self._flushing:
+                    self._flushed.wait()
+                    continue
+                # Leader: take everything buffered so far, including records of writers behind us.
+                self._flushing = True
+                batch, self._pending = self._pending, []
+                upto, f = self._appended, self._file
+                error = None
+                self._lock.release()
+                try:
+                    if batch:
+                        f.write(b"".join(batch))
+                        f.flush()
+                        if self.sync != "off":
+                            os.fsync(f.fileno())
+                except Exception as e:
+                    error = e
+                finally:
+                    self._lock.acquire()
+                    self._flushing = False
+                    self._flushed.notify_all()
+                if error is not None:
+                    self._fail(error)
+                    continue
+                self._durable = upto
+
+    def _fail(self, error):
+        # Called with self._lock held.
+        log.error("❌ Writing the state journal in %s failed; device changes are no longer persisted: %s",
+                  self.directory, error)
+        self._failed = JournalFailedError(f"State journal write failed: {error}")
+        self._failed.__cause__ = error
+
+    def _flush_periodically(self):
+        while not self._closed and self._failed is None:
+            time.sleep(self.fsync_interval)
+            try:
+                self._flush()
+            except JournalFailedError:
+                return
+
+    def _rotate(self):
+        """Makes everything appended so far durable and starts a new segment; returns the old segment number."""
+        with self._lock:
+            while self._flushing:
+                self._flushed.wait()
+            if self._failed is not None:
+                raise self._failed
+            new = self._open_segment(self._segment + 1)
+            self._flushing = True
+            batch, self._pending = self._pending, []
+            upto, old = self._appended, self._file
+            self._segment += 1
+            self._file = new
+            self._since_snapshot = 0
+        error = None
+        try:
+            old.write(b"".join(batch))
+            old.flush()
+            os.fsync(old.fileno())
+            old.close()
+        except Exception as e:
+            error = e
+        with self._lock:
+            self._flushing = False
+            self._flushed.notify_all()
+            if error is not None:
+                self._fail(error)
+                raise self._failed
+            self._durable = upto
+        return self._segment - 1
+
+    def compact(self):
+        """Writes a snapshot of the current state and deletes the journal segments it covers."""
+        with self._compact_lock:
+            try:
+                self._compact()
+            finally:
+                self._compacting = False
+
+    def _compact(self):
+        start = time.perf_counter()
+        last_old_segment = self._rotate()
+        # Everything in the closed segments was committed before this call, so it is in the state.
+        version, devices, kind_versions = self._state()
+        path = os.path.join(self.directory, f"snapshot-{version}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "devices": devices, "kind_versions": kind_versions}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_directory(self.directory)
+        for old in self._snapshots():
+            if old != path:
+                os.remove(old)
+        for segment in self._segments():
+            if int(os.path.basename(segment)[8:-4]) <= last_old_segment:
+                os.remove(segment)
+        log.debug("💾 State snapshot at version %s written in %.1fms", version, (time.perf_counter() - start) * 1000)
+
+    def close(self, snapshot=True):
+        """Flushes everything and, by default, leaves a fresh snapshot so the next start-up replays nothing."""
+        if self._closed or self._file is None:
+            return
+        if self._failed is None:
+            self._flush()
+            if snapshot and self._since_snapshot:
+                self.compact()
+        self._closed = True
+        self._file.close()
+        self._lock_file.close()
+
+
+def journal_from_env():
+    """The journal for JARVIS_STATE_DIR, or None when persistence is off or the directory is taken."""
+    directory = os.getenv("JARVIS_STATE_DIR", "state")
+    if not directory or directory == "off":
+        return None
+    try:
+        return StateJournal(
+            directory,
+            sync=os.getenv("JARVIS_JOURNAL_SYNC", "commit"),
+            fsync_interval=float(os.getenv("JARVIS_JOURNAL_FSYNC_MS", 10)) / 1000,
+            snapshot_every=int(os.getenv("JARVIS_SNAPSHOT_EVERY", 1000)),
+        )
+    except JournalLockedError as e:
+        log.warning("⚠️ Device state will not be persisted: %s. Set JARVIS_STORAGE to share state "
+                    "between processes.", e)
+        return None
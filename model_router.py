@@ -0,0 +1,231 @@
+"""Tiered model routing: every LLM step goes to a small, fast model first and only escalates to the
+large model when the small one's answer does not look trustworthy.
+
+The agent's chat model is a TieredModel. For each step of the agent loop it:
+1. Goes straight to the large model when the step is already past a problem: the tool results it
+   is about to read contain an error ("Error: Unknown location ..."), or the request has taken
+   MULTI_STEP_ROUNDS rounds of tool calls.
+2. Otherwise asks the small model and checks its answer before any tool runs. The answer is
+   escalated when a tool call could not be parsed, names a tool that is not bound, has arguments
+   that fail the tool's schema, or names a device location the registry cannot resolve. An empty
+   reply is escalated too.
+Requests that need several steps from the start (their message touches many tool categories or
+chains actions with "then") skip the small model entirely; see needs_large().
+
+Because the check happens before the tools run, escalating never repeats a device write. TierStats
+records calls, latency, tokens and cost per tier and why each escalation happened (GET /model_stats).
+Set JARVIS_MODEL_ROUTING=0 to always use the large model.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import Runnable
+
+from history import estimate_tokens
+from tools import TOOL_DEVICE_KINDS, device_registry
+
+MODEL_ROUTING = os.getenv("JARVIS_MODEL_ROUTING", "1") == "1"
+SMALL_MODEL = os.getenv("JARVIS_SMALL_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("JARVIS_LARGE_MODEL", "llama-3.3-70b-versatile")
+
+
+def _prices(name, default):
+    # "input,output" in US dollars per million tokens.
+    return tuple(float(price) for price in os.getenv(name, default).split(","))
+
+
+# Groq's list prices; override them when they change.
+PRICES = {
+    "small": _prices("JARVIS_SMALL_MODEL_PRICE", "0.05,0.08"),
+    "large": _prices("JARVIS_LARGE_MODEL_PRICE", "0.59,0.79"),
+}
+MULTI_STEP_ROUNDS = 2
+MULTI_STEP_CATEGORIES = 3
+_CHAINED = re.compile(r"\b(then|after that|afterwards)\b|سپس|بعدش|بعد از اون")
+
+
+def needs_large(user_input, selection):
+    """True for requests that need several dependent steps, which the small model gets wrong most."""
+    categories = [category for category in selection.categories if category != "datetime"]
+    return len(categories) >= MULTI_STEP_CATEGORIES or bool(_CHAINED.search(user_input.lower()))
+
+
+class TierStats:
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._tiers = {tier: {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+                       for tier in PRICES}
+        self._latencies = {tier: deque(maxlen=window) for tier in PRICES}
+        self._escalations = {}
+        self._steps = 0  # agent steps that started on the small tier's side
+        self._requests = {"small_first": 0, "large_only": 0}
+
+    def record_call(self, tier, seconds, input_tokens, output_tokens):
+        input_price, output_price = PRICES[tier]
+        with self._lock:
+            stats = self._tiers[tier]
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += (input_tokens * input_price + output_tokens * output_price) / 1e6
+            self._latencies[tier].append(seconds)
+
+    def record_step(self, escalation=None):
+        with self._lock:
+            self._steps += 1
+            if escalation is not None:
+                self._escalations[escalation] = self._escalations.get(escalation, 0) + 1
+
+    def record_request(self, tiered):
+        with self._lock:
+            self._requests["small_first" if tiered else "large_only"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            tiers = {tier: dict(stats) for tier, stats in self._tiers.items()}
+            latencies = {tier: sorted(values) for tier, values in self._latencies.items()}
+            escalations = dict(self._escalations)
+            requests = dict(self._requests)
+            steps = self._steps
+        for tier, stats in tiers.items():
+            stats["cost_usd"] = round(stats["cost_usd"], 6)
+            stats["p50_ms"] = _percentile_ms(latencies[tier], 50)
+            stats["p95_ms"] = _percentile_ms(latencies[tier], 95)
+        return {
+            "routing": MODEL_ROUTING,
+            "models": {"small": SMALL_MODEL, "large": LARGE_MODEL},
+            "requests": requests,
+            "tiers": tiers,
+            "escalations": escalations,
+            # Share of the steps of small-first requests that ended up on the large model.
+            "escalation_rate": round(sum(escalations.values()) / steps, 4) if steps else 0.0,
+        }
+
+
+def _percentile_ms(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 2)
+
+
+tier_stats = TierStats()
+
+
+def _messages(model_input):
+    return model_input.to_messages() if hasattr(model_input, "to_messages") else list(model_input)
+
+
+def _escalate_before(messages):
+    """Reason to skip the small model for this step, or None."""
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+    step = messages[last_human + 1:]
+    if sum(1 for m in step if isinstance(m, AIMessage) and m.tool_calls) >= MULTI_STEP_ROUNDS:
+        return "multi_step"
+    last_ai = max((i for i, m in enumerate(step) if isinstance(m, AIMessage)), default=None)
+    if last_ai is not None and any(isinstance(m, ToolMessage) and str(m.content).startswith("Error")
+                                   for m in step[last_ai + 1:]):
+        return "tool_error"
+    return None
+
+
+def check_reply(message, tools_by_name):
+    """Reason not to trust a small-model reply, or None when it looks fine."""
+    if getattr(message, "invalid_tool_calls", None):
+        return "parse_error"
+    if not message.tool_calls:
+        return None if str(message.content).strip() else "empty_reply"
+    for call in message.tool_calls:
+        tool = tools_by_name.get(call["name"])
+        if tool is None:
+            return "unknown_tool"
+        schema = getattr(tool, "args_schema", None)
+        if isinstance(schema, type):
+            try:
+                schema.model_validate(call["args"])
+            except ValueError:
+                return "bad_arguments"
+        kinds = TOOL_DEVICE_KINDS.get(call["name"])
+        location = call["args"].get("location")
+        if location and kinds and kinds != "*" and len(kinds) == 1 and \
+                device_registry.resolve(kinds[0], str(location)) is None:
+            return "unknown_location"
+        room = call["args"].get("room")
+        if room and device_registry.resolve_room(str(room)) is None:
+            return "unknown_location"
+    return None
+
+
+def _usage(model_input, message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    # Models that report no usage (the offline fakes) are estimated like chat history is.
+    text_in = " ".join(str(m.content) for m in _messages(model_input))
+    text_out = str(message.content) + "".join(str(call) for call in message.tool_calls)
+    return estimate_tokens(text_in), estimate_tokens(text_out)
+
+
+class TieredModel:
+    """Stands in for a chat model in create_tool_calling_agent; see the module docstring.
+
+    With small_first=False every step goes to the large model (for requests needs_large() picked),
+    which keeps their calls in the same statistics.
+    """
+
+    def __init__(self, small, large, small_first=True, stats=tier_stats):
+        self.small = small
+        self.large = large
+        self.small_first = small_first
+        self.stats = stats
+
+    def bind_tools(self, tools, **kwargs):
+        return _TieredBinding(self, self.small.bind_tools(tools, **kwargs), self.large.bind_tools(tools, **kwargs),
+                              {tool.name: tool for tool in tools})
+
+
+class _TieredBinding(Runnable):
+    def __init__(self, model, small, large, tools_by_name):
+        self.model = model
+        self.small = small
+        self.large = large
+        self.tools_by_name = tools_by_name
+
+    def _record(self, tier, start, model_input, message):
+        self.model.stats.record_call(tier, time.perf_counter() - start, *_usage(model_input, message))
+
+    def invoke(self, input, config=None, **kwargs):
+        if self.model.small_first:
+            reason = _escalate_before(_messages(input))
+            if reason is None:
+                start = time.perf_counter()
+                message = self.small.invoke(input, config, **kwargs)
+                self._record("small", start, input, message)
+                reason = check_reply(message, self.tools_by_name)
+            self.model.stats.record_step(reason)
+            if reason is None:
+                return message
+        start = time.perf_counter()
+        message = self.large.invoke(input, config, **kwargs)
+        self._record("large", start, input, message)
+        return message
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if self.model.small_first:
+            reason = _escalate_before(_messages(input))
+            if reason is None:
+                start = time.perf_counter()
+                message = await self.small.ainvoke(input, config, **kwargs)
+                self._record("small", start, input, message)
+                reason = check_reply(message, self.tools_by_name)
+            self.model.stats.record_step(reason)
+            if reason is None:
+                return message
+        start = time.perf_counter()
+        message = await self.large.ainvoke(input, config, **kwargs)
+        self._record("large", start, input, message)
+        return message
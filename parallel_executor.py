@@ -0,0 +1,127 @@
+"""AgentExecutor that runs the independent tool calls of one LLM step concurrently.
+
+Tool calls are grouped into lanes by the device types they touch (tools.TOOL_DEVICE_KINDS).
+Calls in the same lane run one after another in the order the model emitted them, so writes to
+the same device never reorder; different lanes (e.g. lights vs. a weather lookup) run in
+parallel. Results are always returned in the original order for the agent scratchpad.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.agents import AgentExecutor
+
+from tools import TOOL_DEVICE_KINDS, device_states
+
+MAX_WORKERS = int(os.getenv("JARVIS_TOOL_WORKERS", 8))
+
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="jarvis-tool")
+
+# While set, _perform_agent_action records actions here instead of running them.
+_deferred_actions = contextvars.ContextVar("deferred_actions", default=None)
+# Per step, device type -> future of the last call queued on it, used by the async path.
+_device_tails = contextvars.ContextVar("device_tails", default=None)
+
+
+def device_kinds(agent_action):
+    """Device types an action reads or writes; empty for tools that touch no device."""
+    kinds = TOOL_DEVICE_KINDS.get(agent_action.tool, ())
+    if kinds == "*":
+        tool_input = agent_action.tool_input if isinstance(agent_action.tool_input, dict) else {}
+        device_type = tool_input.get("device_type", "all")
+        return tuple(device_states.kinds()) if device_type == "all" else (device_type,)
+    return kinds
+
+
+def plan_lanes(actions):
+    """Splits actions into lanes of indices; actions sharing a device type end up in the same lane."""
+    lanes = []  # [(kinds, [indices])]
+    for index, action in enumerate(actions):
+        kinds = set(device_kinds(action))
+        members = [index]
+        remaining = []
+        for lane_kinds, lane_members in lanes:
+            if lane_kinds & kinds:
+                kinds |= lane_kinds
+                members = lane_members + members
+            else:
+                remaining.append((lane_kinds, lane_members))
+        lanes = remaining + [(kinds, sorted(members))]
+    return [members for _, members in lanes]
+
+
+class _PendingStep:
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        pending = _deferred_actions.get()
+        if pending is None:
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        pending.append(agent_action)
+        return _PendingStep(len(pending) - 1)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        pending = []
+        token = _deferred_actions.set(pending)
+        try:
+            # Plans the step; tool calls are only recorded, not run.
+            outputs = list(super()._iter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager))
+        finally:
+            _deferred_actions.reset(token)
+
+        results = self._run_lanes(name_to_tool_map, color_mapping, pending, run_manager)
+        for output in outputs:
+            yield results[output.index] if isinstance(output, _PendingStep) else output
+
+    def _run_lanes(self, name_to_tool_map, color_mapping, actions, run_manager):
+        def run_lane(indices):
+            return [(index, super(ParallelAgentExecutor, self)._perform_agent_action(
+                name_to_tool_map, color_mapping, actions[index], run_manager)) for index in indices]
+
+        lanes = plan_lanes(actions)
+        if len(lanes) <= 1:
+            finished = [run_lane(indices) for indices in lanes]
+        else:
+            # Each lane gets a copy of the current context so callbacks and tracing still nest correctly.
+            futures = [_pool.submit(contextvars.copy_context().run, run_lane, indices) for indices in lanes]
+            finished = [future.result() for future in futures]
+
+        results = [None] * len(actions)
+        for lane in finished:
+            for index, step in lane:
+                results[index] = step
+        return results
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        # LangChain already gathers all calls of a step, starting them in emission order. Before its
+        # first await, each call queues itself behind the last earlier call on each of its device
+        # types, all at once, so an action touching several types cannot be overtaken on one of
+        # them while it waits for another (the same ordering plan_lanes gives the sync path).
+        tails = _device_tails.get()
+        kinds = device_kinds(agent_action)
+        if tails is None or not kinds:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        done = asyncio.get_running_loop().create_future()
+        before = {tails[kind] for kind in kinds if kind in tails}
+        for kind in kinds:
+            tails[kind] = done
+        try:
+            for previous in before:
+                await previous
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        finally:
+            done.set_result(None)
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # A fresh queue for every step; the tasks LangChain gathers inherit it through the context.
+        _device_tails.set({})
+        async for output in super()._aiter_next_step(
+                name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+            yield output
@@ -0,0 +1,248 @@
+"""A small in-memory server speaking the Redis protocol, for running JARVIS_STORAGE=redis://... without Redis.
+
+    python resp_server.py [--host 127.0.0.1] [--port 6379]
+
+It implements the commands storage.py uses (strings with expiry, hashes, WATCH/MULTI/EXEC) plus a
+few for poking at it with redis-cli. Data is not persisted. Every command runs under one lock, so
+MULTI/EXEC blocks are atomic and WATCH sees every write made by other connections.
+"""
+import argparse
+import socket
+import socketserver
+import threading
+import time
+
+from storage import RespError, read_reply
+
+
+class Store:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._data = {}  # key -> value (str or dict)
+        self._expires = {}  # key -> monotonic deadline
+        self._revisions = {}  # key -> write counter, for WATCH
+
+    def _alive(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self._data.pop(key, None)
+            del self._expires[key]
+            self._touch(key)
+        return key in self._data
+
+    def _touch(self, key):
+        self._revisions[key] = self._revisions.get(key, 0) + 1
+
+    def revision(self, key):
+        self._alive(key)
+        return self._revisions.get(key, 0)
+
+    def _hash(self, key):
+        value = self._data.get(key) if self._alive(key) else None
+        if value is not None and not isinstance(value, dict):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def run(self, name, args):
+        handler = getattr(self, "cmd_" + name, None)
+        if handler is None:
+            raise RespError(f"ERR unknown command '{name}'")
+        return handler(*args)
+
+    def cmd_ping(self, message="PONG"):
+        return message
+
+    def cmd_get(self, key):
+        value = self._data.get(key) if self._alive(key) else None
+        if isinstance(value, dict):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        exists = self._alive(key)
+        if ("NX" in options and exists) or ("XX" in options and not exists):
+            return None
+        self._data[key] = value
+        self._expires.pop(key, None)
+        for unit, scale in (("EX", 1.0), ("PX", 0.001)):
+            if unit in options:
+                self._expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        self._touch(key)
+        return "OK"
+
+    def cmd_setnx(self, key, value):
+        return 1 if self.cmd_set(key, value, "NX") else 0
+
+    def cmd_incr(self, key):
+        value = int(self.cmd_get(key) or 0) + 1
+        self._data[key] = str(value)
+        self._touch(key)
+        return value
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self._data[key]
+                self._expires.pop(key, None)
+                self._touch(key)
+                deleted += 1
+        return deleted
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self._expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self._expires.get(key)
+        return -1 if deadline is None else int(deadline - time.monotonic())
+
+    def cmd_keys(self, pattern="*"):
+        prefix = pattern.rstrip("*")
+        return [key for key in list(self._data) if self._alive(key) and key.startswith(prefix)]
+
+    def cmd_flushdb(self):
+        for key in list(self._data):
+            self._touch(key)
+        self._data.clear()
+        self._expires.clear()
+        return "OK"
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise RespError("ERR wrong number of arguments for 'hset' command")
+        value = self._hash(key)
+        if value is None:
+            value = self._data[key] = {}
+        added = sum(1 for field in pairs[::2] if field not in value)
+        value.update(zip(pairs[::2], pairs[1::2]))
+        self._touch(key)
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self._hash(key) or {}).get(field)
+
+    def cmd_hgetall(self, key):
+        return [x for item in (self._hash(key) or {}).items() for x in item]
+
+    def cmd_hdel(self, key, *fields):
+        value = self._hash(key) or {}
+        deleted = sum(1 for field in fields if value.pop(field, None) is not None)
+        if deleted:
+            self._touch(key)
+        return deleted
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Replies to a pipeline are written one by one; do not let Nagle hold them back.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        store = self.server.store
+        watched = {}  # key -> revision when WATCHed
+        queued = None  # commands between MULTI and EXEC
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            name, args = command[0].lower(), command[1:]
+            try:
+                if name == "multi":
+                    queued, reply = [], "OK"
+                elif name == "exec":
+                    if queued is None:
+                        raise RespError("ERR EXEC without MULTI")
+                    with store.lock:
+                        if any(store.revision(key) != revision for key, revision in watched.items()):
+                            reply = None
+                        else:
+                            reply = [self._run(store, n, a) for n, a in queued]
+                    queued, watched = None, {}
+                elif name == "discard":
+                    queued, watched, reply = None, {}, "OK"
+                elif queued is not None:
+                    queued.append((name, args))
+                    reply = "QUEUED"
+                elif name == "watch":
+                    with store.lock:
+                        watched.update((key, store.revision(key)) for key in args)
+                    reply = "OK"
+                elif name == "unwatch":
+                    watched, reply = {}, "OK"
+                elif name in ("select", "auth"):
+                    reply = "OK"
+                elif name == "quit":
+                    self.wfile.write(b"+OK\r\n")
+                    return
+                else:
+                    with store.lock:
+                        reply = store.run(name, args)
+            except RespError as e:
+                reply = e
+            except (TypeError, ValueError, IndexError):
+                reply = RespError(f"ERR wrong arguments for '{name}' command")
+            self.wfile.write(_encode_reply(reply))
+
+    @staticmethod
+    def _run(store, name, args):
+        try:
+            return store.run(name, args)
+        except RespError as e:
+            return e
+
+
+def _encode_reply(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, RespError):
+        return b"-%s\r\n" % str(reply).encode("utf-8")
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(_encode_reply(item) for item in reply)
+    if reply in ("OK", "QUEUED", "PONG"):
+        return b"+%s\r\n" % reply.encode("utf-8")
+    data = reply.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=6379):
+        super().__init__((host, port), Handler)
+        self.store = Store()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        """Serves in a background thread and returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RespServer(args.host, args.port)
+    print(f"🧰 Redis stand-in listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,186 @@
+"""Response cache in front of the agent for repeated read-only questions.
+
+Entries are keyed on the normalised message plus a fingerprint of the device state it depends on,
+so "status of lamps" stays cached until a lamp changes, and a digest of the conversation so far, so a
+reply that refers back to one session's earlier turns is never served to another. Messages that ask for a change are never
+cached, and callers only store a reply when no device changed while the agent produced it and every
+tool it called is read-only (tools.READ_ONLY_TOOLS).
+
+If NumPy is installed and JARVIS_CACHE_SIMILARITY is above 0, a message that is not cached verbatim
+can also be answered by a close paraphrase with the same fingerprint (character n-gram TF-IDF vectors,
+cosine similarity). The fingerprint includes the locations, numbers and on/off words of the message,
+so "is the kitchen light on" never matches "is the kitchen light off". Without NumPy only exact
+matches are served.
+"""
+import hashlib
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NGRAM = 3
+DIMENSIONS = 1 << 12
+
+
+def ngram_vector(text):
+    """Hashed character n-gram counts of text."""
+    vector = numpy.zeros(DIMENSIONS, dtype=numpy.float32)
+    padded = f" {text} "
+    for i in range(len(padded) - NGRAM + 1):
+        vector[zlib.crc32(padded[i:i + NGRAM].encode("utf-8")) % DIMENSIONS] += 1
+    return vector
+
+
+def history_digest(messages):
+    """Digest of a chat history; empty for a new conversation, so first turns are shared."""
+    if not messages:
+        return ""
+    digest = hashlib.blake2b(digest_size=16)
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("reply", "stored_at", "vector")
+
+    def __init__(self, reply, stored_at, vector):
+        self.reply = reply
+        self.stored_at = stored_at
+        self.vector = vector
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of agent replies.
+
+    Use key() to build the cache key for a message; it is None for messages that must not be
+    cached, and get()/put() ignore a None key.
+    """
+
+    def __init__(self, name="responses", max_entries=512, ttl=300, similarity=0.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity if numpy is not None else 0.0
+        self._entries = OrderedDict()  # (text, fingerprint) -> _Entry
+        self._texts = {}  # fingerprint -> set of texts, the candidates for similarity matching
+        self._document_frequency = numpy.zeros(DIMENSIONS, dtype=numpy.float32) if self.similarity else None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "similar_hits": 0, "misses": 0, "bypassed": 0,
+                       "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def key(mentions, device_states, automations_revision=0, history=()):
+        """(text, fingerprint) for a message described by CommandRouter.mentions(), or None for writes.
+
+        `automations_revision` (AutomationEngine.revision) keeps answers about the rules fresh, and
+        `history` is the chat history the agent would get (ConversationStore.get_messages()).
+        """
+        if mentions.is_write:
+            return None
+        if mentions.kinds:
+            state = tuple((kind, device_states.kind_version(kind)) for kind in mentions.kinds)
+        else:
+            # No device named: the answer may depend on any of them.
+            state = device_states.version
+        minute = time.strftime("%Y-%m-%d %H:%M") if mentions.is_time else None
+        return mentions.text, (state, automations_revision, mentions.locations, mentions.qualifiers, minute,
+                               history_digest(history))
+
+    def get(self, key):
+        """Returns the cached reply for key, or None."""
+        with self._lock:
+            if key is None:
+                self._stats["bypassed"] += 1
+                return None
+            now = time.monotonic()
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.reply
+            if self.similarity:
+                similar = self._most_similar(key, now)
+                if similar is not None:
+                    self._entries.move_to_end(similar)
+                    self._stats["similar_hits"] += 1
+                    return self._entries[similar].reply
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, reply):
+        if key is None or not reply:
+            return
+        vector = ngram_vector(key[0]) if self.similarity else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(reply, time.monotonic(), vector)
+            self._texts.setdefault(key[1], set()).add(key[0])
+            if vector is not None:
+                self._document_frequency += vector > 0
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._texts.clear()
+            if self._document_frequency is not None:
+                self._document_frequency[:] = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), similarity=self.similarity)
+        served = stats["hits"] + stats["similar_hits"]
+        lookups = served + stats["misses"]
+        stats["hit_ratio"] = round(served / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry.stored_at >= self.ttl:
+            self._remove(key)
+            self._stats["expired"] += 1
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        texts = self._texts.get(key[1])
+        if texts is not None:
+            texts.discard(key[0])
+            if not texts:
+                del self._texts[key[1]]
+        if entry.vector is not None:
+            self._document_frequency -= entry.vector > 0
+
+    def _most_similar(self, key, now):
+        """Key of the closest live entry with the same fingerprint, if it clears the similarity threshold."""
+        text, fingerprint = key
+        candidates = [(candidate, fingerprint) for candidate in list(self._texts.get(fingerprint, ()))]
+        candidates = [candidate for candidate in candidates if self._live(candidate, now) is not None]
+        if not candidates:
+            return None
+        idf = numpy.log((1 + len(self._entries)) / (1 + self._document_frequency)) + 1
+        query = ngram_vector(text) * idf
+        matrix = numpy.stack([self._entries[candidate].vector for candidate in candidates]) * idf
+        norms = numpy.linalg.norm(matrix, axis=1) * numpy.linalg.norm(query)
+        scores = matrix @ query / numpy.maximum(norms, 1e-9)
+        best = int(numpy.argmax(scores))
+        return candidates[best] if scores[best] >= self.similarity else None
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("JARVIS_RESPONSE_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("JARVIS_RESPONSE_CACHE_TTL", 300)),
+    similarity=float(os.getenv("JARVIS_CACHE_SIMILARITY", 0.85)),
+)
@@ -0,0 +1,79 @@
+"""Production launcher: runs Jarvis in several worker processes that share one house state.
+
+    python serve.py [--app main|esp32] [--workers 4] [--host 0.0.0.0] [--port 5001] [--server uvicorn|gunicorn]
+
+Every worker is a separate process with its own Python interpreter, so throughput scales with the
+number of cores. Device state and chat history must then live outside the workers (see storage.py):
+when JARVIS_STORAGE is not set and more than one worker is requested, a SQLite database next to
+this file is used. Point JARVIS_STORAGE at a Redis server (or resp_server.py) to spread workers over
+several hosts.
+
+`uvicorn` is the default server. `gunicorn` (Linux/macOS only, `pip install gunicorn`) runs the
+same apps with uvicorn workers for the main app and threaded sync workers for the ESP32 app.
+"""
+import argparse
+import os
+import sys
+
+# app name -> (import string, uvicorn interface)
+APPS = {
+    "main": ("asgi:application", "asgi3"),
+    "esp32": ("appForESP32:app", "wsgi"),
+}
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jarvis.db")
+
+
+def configure_storage(workers):
+    storage = os.getenv("JARVIS_STORAGE", "memory")
+    if workers > 1 and storage == "memory":
+        storage = os.environ["JARVIS_STORAGE"] = f"sqlite:///{DEFAULT_DB}"
+        print(f"🗄️ {workers} workers need shared state; using JARVIS_STORAGE={storage}")
+    return storage
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    target, interface = APPS[args.app]
+    uvicorn.run(target, host=args.host, port=args.port, workers=args.workers, interface=interface,
+                log_level=args.log_level, access_log=False)
+
+
+def run_gunicorn(args):
+    target, interface = APPS[args.app]
+    command = ["gunicorn", target, "--bind", f"{args.host}:{args.port}", "--workers", str(args.workers),
+               "--log-level", args.log_level]
+    if interface == "wsgi":
+        # Long-polling ESP32 clients hold a thread each.
+        command += ["--worker-class", "gthread", "--threads", "16"]
+    else:
+        command += ["--worker-class", "uvicorn.workers.UvicornWorker"]
+    try:
+        os.execvp(command[0], command)
+    except FileNotFoundError:
+        sys.exit("gunicorn is not installed; run `pip install gunicorn` or use --server uvicorn.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", choices=sorted(APPS), default="main")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    storage = configure_storage(args.workers)
+    # Per-request console output costs more than it is worth with many workers.
+    os.environ.setdefault("JARVIS_LOG_LEVEL", "WARNING")
+    print(f"🚀 Jarvis ({args.app}) on http://{args.host}:{args.port} with {args.workers} {args.server} "
+          f"worker(s), storage {storage}")
+    if args.server == "gunicorn":
+        run_gunicorn(args)
+    else:
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
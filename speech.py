@@ -0,0 +1,234 @@
+"""Streaming speech-to-text: voice-activity segmentation plus a pluggable transcription backend.
+
+The browser sends raw 16-bit mono PCM in small chunks while the user is talking. EnergyVAD cuts the
+audio into utterances at pauses. Each utterance is wrapped as a WAV file and transcribed in the
+background while more audio arrives, so partial text is ready before the user stops speaking, and
+only the utterance being recorded is held in memory.
+
+Backends implement `transcribe(wav_bytes, filename) -> str`:
+- GroqWhisperBackend calls Whisper through the Groq SDK (the default), within admission.whisper_slots.
+- StubBackend needs no network and returns a fixed description of each segment. Select it with
+  JARVIS_STT_BACKEND=stub for offline development and benchmarks.
+"""
+import io
+import math
+import os
+import secrets
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import whisper_slots
+
+SAMPLE_RATE = 16000
+# Sample rates a client may stream at (telephone to studio quality).
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 48000
+VAD_THRESHOLD = int(os.getenv("JARVIS_VAD_THRESHOLD", 500))  # RMS of a 16-bit frame
+VAD_SILENCE_MS = int(os.getenv("JARVIS_VAD_SILENCE_MS", 600))
+VAD_MAX_SEGMENT_SECONDS = float(os.getenv("JARVIS_VAD_MAX_SEGMENT", 15))
+STREAM_IDLE_TIMEOUT = float(os.getenv("JARVIS_STT_STREAM_TIMEOUT", 60))
+MAX_STREAMS = int(os.getenv("JARVIS_STT_MAX_STREAMS", 100))
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("JARVIS_STT_WORKERS", 4)), thread_name_prefix="jarvis-stt")
+
+
+def pcm16_to_wav(pcm, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class GroqWhisperBackend:
+    def __init__(self, client, model="whisper-large-v3"):
+        self._client = client  # a bootstrap.Lazy, so the Groq SDK is only loaded when first needed
+        self.model = model
+
+    def transcribe(self, wav_bytes, filename="segment.wav"):
+        with whisper_slots.slot():
+            transcription = self._client.get().audio.transcriptions.create(model=self.model, file=(filename, wav_bytes))
+        return transcription.text.strip()
+
+
+class StubBackend:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def transcribe(self, wav_bytes, filename="segment.wav"):
+        if self.latency:
+            time.sleep(self.latency)
+        with wave.open(io.BytesIO(wav_bytes)) as wav:
+            seconds = wav.getnframes() / wav.getframerate()
+        return f"[{seconds:.1f}s of speech]"
+
+
+def backend_from_env(groq_client):
+    if os.getenv("JARVIS_STT_BACKEND", "groq") == "stub":
+        return StubBackend()
+    return GroqWhisperBackend(groq_client)
+
+
+class EnergyVAD:
+    """Splits a PCM16 stream into utterances using the RMS energy of fixed-size frames.
+
+    A segment starts at the first loud frame (with `pre_roll_ms` of audio before it, so soft
+    onsets are kept) and ends after `silence_ms` of quiet frames or at `max_segment_seconds`.
+    Segments with less than `min_speech_ms` of loud frames (clicks, coughs) are dropped.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=30, threshold=VAD_THRESHOLD, silence_ms=VAD_SILENCE_MS,
+                 pre_roll_ms=300, min_speech_ms=150, max_segment_seconds=VAD_MAX_SEGMENT_SECONDS):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.threshold = threshold
+        self._frame_bytes = sample_rate * frame_ms // 1000 * 2
+        assert self._frame_bytes > 0, f"sample rate {sample_rate} and frame of {frame_ms} ms give empty frames"
+        self._silence_frames = silence_ms // frame_ms
+        self._min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self._max_frames = int(max_segment_seconds * 1000 // frame_ms)
+        self._pre_roll = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self._pending = b""
+        self._segment = []
+        self._speech_frames = 0
+        self._quiet_run = 0
+
+    def feed(self, pcm):
+        """Adds audio; returns the PCM of every utterance that ended in it."""
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self._frame_bytes
+        self._pending = data[usable:]
+        finished = []
+        for offset in range(0, usable, self._frame_bytes):
+            segment = self._add_frame(data[offset:offset + self._frame_bytes])
+            if segment:
+                finished.append(segment)
+        return finished
+
+    def flush(self):
+        """Ends the stream; returns the last utterance, if any."""
+        if self._pending:
+            frame = self._pending + b"\x00" * (self._frame_bytes - len(self._pending))
+            self._pending = b""
+            segment = self._add_frame(frame)
+            if segment:
+                return segment
+        return self._close_segment()
+
+    def _add_frame(self, frame):
+        samples = array("h", frame)
+        loud = math.sqrt(sum(s * s for s in samples) / len(samples)) >= self.threshold
+        if not self._segment:
+            if not loud:
+                self._pre_roll.append(frame)
+                return None
+            self._segment = list(self._pre_roll)
+            self._pre_roll.clear()
+        self._segment.append(frame)
+        if loud:
+            self._speech_frames += 1
+            self._quiet_run = 0
+        else:
+            self._quiet_run += 1
+        if self._quiet_run >= self._silence_frames or len(self._segment) >= self._max_frames:
+            return self._close_segment()
+        return None
+
+    def _close_segment(self):
+        segment, speech_frames = self._segment, self._speech_frames
+        self._segment, self._speech_frames, self._quiet_run = [], 0, 0
+        if speech_frames < self._min_speech_frames:
+            return None
+        return b"".join(segment)
+
+
+class TranscriptionStream:
+    """One recording: audio goes through the VAD and every utterance is transcribed in the background."""
+
+    def __init__(self, backend, sample_rate=SAMPLE_RATE):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.last_used = time.monotonic()
+        self._vad = EnergyVAD(sample_rate)
+        self._segments = []  # futures, in speaking order
+        self._lock = threading.Lock()
+
+    def feed(self, pcm):
+        with self._lock:
+            self.last_used = time.monotonic()
+            for segment in self._vad.feed(pcm):
+                self._submit(segment)
+
+    def finish(self, timeout=None):
+        """Transcribes what is left and returns the full text once every segment is done."""
+        with self._lock:
+            segment = self._vad.flush()
+            if segment:
+                self._submit(segment)
+            segments = list(self._segments)
+        return " ".join(text for text in (future.result(timeout=timeout) for future in segments) if text)
+
+    def partial_text(self):
+        """Text of the segments transcribed so far, stopping at the first one still in progress."""
+        texts = []
+        with self._lock:
+            segments = list(self._segments)
+        for future in segments:
+            if not future.done():
+                break
+            if future.exception() is None and future.result():
+                texts.append(future.result())
+        return " ".join(texts)
+
+    @property
+    def segment_count(self):
+        return len(self._segments)
+
+    def _submit(self, segment):
+        index = len(self._segments) + 1
+        wav_bytes = pcm16_to_wav(segment, self.sample_rate)
+        self._segments.append(_pool.submit(self.backend.transcribe, wav_bytes, f"segment-{index}.wav"))
+
+
+class StreamRegistry:
+    """Open transcription streams by server-issued id; streams idle for too long are dropped.
+
+    Ids come from open() and are unguessable, so a client can only feed or end its own recording.
+    """
+
+    def __init__(self, backend, max_streams=MAX_STREAMS, idle_timeout=STREAM_IDLE_TIMEOUT):
+        self.backend = backend
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, sample_rate=SAMPLE_RATE):
+        """Starts a stream and returns its new id; None when too many are open."""
+        with self._lock:
+            self._expire()
+            if len(self._streams) >= self.max_streams:
+                return None
+            stream_id = secrets.token_urlsafe(16)
+            self._streams[stream_id] = TranscriptionStream(self.backend, sample_rate)
+            return stream_id
+
+    def get(self, stream_id):
+        """The open stream with this id, or None."""
+        with self._lock:
+            self._expire()
+            return self._streams.get(stream_id)
+
+    def close(self, stream_id):
+        with self._lock:
+            return self._streams.pop(stream_id, None)
+
+    def _expire(self):
+        now = time.monotonic()
+        for stream_id in [sid for sid, s in self._streams.items() if now - s.last_used > self.idle_timeout]:
+            del self._streams[stream_id]
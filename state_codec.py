@@ -0,0 +1,109 @@
+"""Compact encodings of the full device state for microcontroller clients.
+
+Two formats, each built once per state version and cached, so polling clients cost a dictionary
+lookup instead of a serialisation:
+
+- "json": the state as compact JSON (no whitespace), for clients that parse JSON anyway.
+- "binary" (`application/vnd.jarvis.state`): a fixed-layout packet that a board can read in place
+  without a JSON parser or a heap-allocated document. All integers are little-endian:
+
+      offset  size  field
+      0       1     magic 0x4A ('J')
+      1       1     schema version (SCHEMA_VERSION)
+      2       4     state version, uint32
+      6       2     layout id: the low 16 bits of a CRC32 of the device layout
+      8       n     state bits, one per device in layout order, least significant bit first:
+                    1 when the device is in the first state of its type (on, locked, open)
+      8+n     2*m   numeric fields, int16 each, in layout order (AC temperature; TV channel, volume);
+                    values outside the int16 range are clamped to it
+
+  The layout is every device of the house in a fixed order: device types in DEVICE_TYPES order,
+  locations in the order they were defined. GET /device_states/schema on the ESP32 app describes
+  it. A board compares the layout id with the one it was built for, so adding a device makes it
+  complain instead of reading the wrong bits.
+"""
+import json
+import struct
+import threading
+import zlib
+
+from device_state import DEVICE_TYPES
+
+SCHEMA_VERSION = 1
+BINARY_MIMETYPE = "application/vnd.jarvis.state"
+_MAGIC = 0x4A
+_HEADER = struct.Struct("<BBIH")
+_INT16_MIN, _INT16_MAX = -0x8000, 0x7FFF
+
+
+class StateEncoder:
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._cache = {}  # format -> (state version, encoded bytes)
+        self._layout = None  # (devices of the state it was built for, layout, layout id)
+
+    def layout(self, state=None):
+        """[(kind, location, numeric field names)] in packet order, and the layout id."""
+        if state is None:
+            state = self.engine.changes_since(-1)[1]
+        key = tuple((kind, tuple(locations)) for kind, locations in state.items())
+        cached = self._layout
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        order = sorted(state, key=list(DEVICE_TYPES).index)
+        layout = [(kind, location, tuple(field for field in DEVICE_TYPES[kind][0].FIELDS if field != "state"))
+                  for kind in order for location in state[kind]]
+        layout_id = zlib.crc32(json.dumps(layout).encode("utf-8")) & 0xFFFF
+        self._layout = (key, layout, layout_id)
+        return layout, layout_id
+
+    def schema(self):
+        """JSON description of the binary format, for firmware authors."""
+        layout, layout_id = self.layout()
+        numeric = [f"{kind}/{location}/{field}" for kind, location, fields in layout for field in fields]
+        return {
+            "mimetype": BINARY_MIMETYPE,
+            "schema_version": SCHEMA_VERSION,
+            "layout_id": layout_id,
+            "header_bytes": _HEADER.size,
+            "state_bits": [{"bit": i, "device": f"{kind}/{location}", "set_when": DEVICE_TYPES[kind][1][0]}
+                           for i, (kind, location, _) in enumerate(layout)],
+            "numeric_fields": [{"offset": _HEADER.size + (len(layout) + 7) // 8 + 2 * i, "field": name}
+                               for i, name in enumerate(numeric)],
+        }
+
+    def encode(self, fmt):
+        """Returns (state version, bytes) of the current state in "json" or "binary"."""
+        version = self.engine.version
+        cached = self._cache.get(fmt)
+        if cached is not None and cached[0] == version:
+            return cached
+        with self._lock:
+            cached = self._cache.get(fmt)
+            if cached is not None and cached[0] == self.engine.version:
+                return cached
+            version, state = self.engine.changes_since(-1)
+            if fmt == "json":
+                data = json.dumps(state, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            elif fmt == "binary":
+                data = self._pack(version, state)
+            else:
+                raise ValueError(f"Unknown state format '{fmt}'. Use json or binary.")
+            cached = self._cache[fmt] = (version, data)
+        return cached
+
+    def _pack(self, version, state):
+        layout, layout_id = self.layout(state)
+        bits = bytearray((len(layout) + 7) // 8)
+        numbers = []
+        for i, (kind, location, fields) in enumerate(layout):
+            value = state[kind][location]
+            fields_value = value if isinstance(value, dict) else {"state": value}
+            if fields_value["state"] == DEVICE_TYPES[kind][1][0]:
+                bits[i // 8] |= 1 << (i % 8)
+            # A stored value can predate the range checks; the packet must still encode.
+            numbers += [min(_INT16_MAX, max(_INT16_MIN, int(fields_value[field]))) for field in fields]
+        return (_HEADER.pack(_MAGIC, SCHEMA_VERSION, version & 0xFFFFFFFF, layout_id) + bytes(bits)
+                + struct.pack(f"<{len(numbers)}h", *numbers))
+
@@ -0,0 +1,153 @@
+"""Publish/subscribe hub that pushes device state changes to web UIs and controllers.
+
+DeviceStateEngine calls the hub for every commit (and, with a shared storage backend, for every
+change it picks up from other workers). The hub encodes each change once per device type into a
+compact JSON event and appends it to a ring buffer. Subscribers do not get queues of their own:
+each one only holds a cursor into the ring, so publishing costs the same for ten or ten thousand
+subscribers and an idle subscriber costs one small object plus its connection.
+
+- Topics: a subscriber lists the device types it cares about (None means all).
+- Backpressure: a subscriber reads at its own pace, limited by how fast its connection drains.
+- Slow consumers: a subscriber that falls more than `max_lag` events behind (or behind the start of
+  the ring) is evicted with SlowConsumer. Clients then reconnect with their last version and get
+  the state they missed from DeviceStateEngine.changes_since().
+
+Subscribers are asyncio-based and served by the ASGI app (see asgi.py). Publishing happens on any
+thread and wakes each event loop with a single call_soon_threadsafe().
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque, namedtuple
+from itertools import islice
+
+BUFFER_SIZE = int(os.getenv("JARVIS_EVENT_BUFFER", 1024))
+MAX_SUBSCRIBERS = int(os.getenv("JARVIS_MAX_SUBSCRIBERS", 10000))
+
+
+# One change of one device type, encoded once for every subscriber: as JSON (WebSocket) and as an
+# SSE frame whose id is the version, so EventSource resumes from it after a reconnect.
+Event = namedtuple("Event", ["version", "kind", "json", "sse"])
+
+
+def encode(event_type, version, data):
+    payload = json.dumps(dict({"type": event_type, "version": version}, **data), ensure_ascii=False, separators=(",", ":"))
+    return payload, f"id: {version}\nevent: {event_type}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class SlowConsumer(Exception):
+    """The subscriber fell too far behind and has to resynchronise."""
+
+
+class HubFull(Exception):
+    """MAX_SUBSCRIBERS are already connected."""
+
+
+class Subscription:
+    __slots__ = ("hub", "topics", "cursor", "loop", "closed")
+
+    def __init__(self, hub, topics, cursor, loop):
+        self.hub = hub
+        self.topics = topics
+        self.cursor = cursor
+        self.loop = loop
+        self.closed = False
+
+    async def next(self, timeout=None):
+        """Waits for Events of the subscribed topics; returns them ([] on timeout)."""
+        while True:
+            wakeup = self.hub._wakeup(self.loop)
+            events = self.hub._read(self)
+            if events:
+                return events
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub._unsubscribe(self)
+
+
+class ChangeHub:
+    def __init__(self, engine, buffer_size=BUFFER_SIZE, max_subscribers=MAX_SUBSCRIBERS, max_lag=None):
+        self.engine = engine
+        self.max_subscribers = max_subscribers
+        self.max_lag = max_lag or buffer_size
+        self._events = deque(maxlen=buffer_size)  # (sequence, Event)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._loops = {}  # event loop -> [asyncio.Event set on the next publish, subscriber count]
+        self._subscribers = 0
+        self._stats = {"published": 0, "evicted": 0, "rejected": 0}
+        engine.add_listener(self.publish)
+
+    def publish(self, version, changes):
+        """Called by the state engine, in version order: changes is {kind: {location: value}}."""
+        with self._lock:
+            for kind, locations in changes.items():
+                self._sequence += 1
+                payload, frame = encode("change", version, {"kind": kind, "changes": locations})
+                self._events.append((self._sequence, Event(version, kind, payload, frame)))
+            self._stats["published"] += len(changes)
+            loops = list(self._loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake, loop)
+            except RuntimeError:  # the loop was closed
+                with self._lock:
+                    self._loops.pop(loop, None)
+
+    def subscribe(self, topics=None):
+        """Registers a subscriber on the running event loop; raises HubFull at max_subscribers."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._subscribers >= self.max_subscribers:
+                self._stats["rejected"] += 1
+                raise HubFull(f"{self.max_subscribers} subscribers are already connected")
+            self._subscribers += 1
+            entry = self._loops.setdefault(loop, [asyncio.Event(), 0])
+            entry[1] += 1
+            subscription = Subscription(self, frozenset(topics) if topics else None, self._sequence, loop)
+        # With a shared backend, changes by other workers only arrive while the engine keeps reading.
+        self.engine.watch()
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers -= 1
+            entry = self._loops.get(subscription.loop)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._loops[subscription.loop]
+
+    def _wake(self, loop):
+        # Runs on `loop`: wake everyone waiting there and hand out a fresh event for the next publish.
+        entry = self._loops.get(loop)
+        if entry is not None:
+            entry[0].set()
+            entry[0] = asyncio.Event()
+
+    def _wakeup(self, loop):
+        entry = self._loops.get(loop)
+        return entry[0] if entry is not None else asyncio.Event()
+
+    def _read(self, subscription):
+        with self._lock:
+            oldest = self._events[0][0] if self._events else self._sequence + 1
+            if subscription.cursor < oldest - 1 or self._sequence - subscription.cursor > self.max_lag:
+                self._stats["evicted"] += 1
+                raise SlowConsumer(f"{self._sequence - subscription.cursor} events behind")
+            start = subscription.cursor - oldest + 1
+            events = [event for _, event in islice(self._events, max(0, start), None)
+                      if subscription.topics is None or event.kind in subscription.topics]
+            subscription.cursor = self._sequence
+        return events
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, subscribers=self._subscribers, buffered=len(self._events), sequence=self._sequence)
@@ -0,0 +1,352 @@
+"""Shared storage for device state and conversation history, so several workers see one house.
+
+JARVIS_STORAGE selects the backend:
+- `memory` (default): state and history live in the process, as before. Only for a single worker.
+- `sqlite:///path/to/jarvis.db`: one SQLite file in WAL mode, for the workers of one host.
+- `redis://[:password@]host:6379/0`: any server speaking the Redis protocol (RESP). `resp_server.py`
+  is a small stand-in for development and benchmarks.
+
+Device state is stored as one JSON document per device together with the version of its last
+change, plus the global and per-type versions (see device_state.py). Every write is a
+compare-and-set on the global version: when another worker committed first, commit() returns False
+and DeviceStateEngine.apply() retries against the new state, so no change is ever lost. History is
+stored as one JSON document per session (summary and recent turns). Automation rules are stored as
+one JSON document per rule, with a revision counter bumped on every change (see automations.py).
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+
+class SQLiteBackend:
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS devices (
+                kind TEXT NOT NULL, location TEXT NOT NULL, fields TEXT NOT NULL, version INTEGER NOT NULL,
+                PRIMARY KEY (kind, location));
+            CREATE TABLE IF NOT EXISTS kind_versions (kind TEXT PRIMARY KEY, version INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+            CREATE TABLE IF NOT EXISTS automations (id TEXT PRIMARY KEY, spec TEXT NOT NULL);
+        """)
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork so workers never share a file handle.
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self, mode="IMMEDIATE"):
+        db = self._connection()
+        db.execute(f"BEGIN {mode}")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def version(self):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return None if row is None else row[0]
+
+    def load(self):
+        """Returns (version, {kind: {location: (fields, version)}}, {kind: version}), or None when empty."""
+        with self._transaction("DEFERRED") as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None:
+                return None
+            devices = {}
+            for kind, location, fields, version in db.execute("SELECT kind, location, fields, version FROM devices"):
+                devices.setdefault(kind, {})[location] = (json.loads(fields), version)
+            kind_versions = dict(db.execute("SELECT kind, version FROM kind_versions"))
+        return row[0], devices, kind_versions
+
+    def seed(self, version, devices, kind_versions):
+        """Stores the initial state, unless another worker already did."""
+        with self._transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = 'version'").fetchone():
+                return
+            self._write(db, version, [(kind, location, fields, record_version)
+                                      for kind, locations in devices.items()
+                                      for location, (fields, record_version) in locations.items()], kind_versions)
+
+    def commit(self, expected_version, version, writes, kind_versions):
+        """Writes [(kind, location, fields, version)] if the stored version is still expected_version."""
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != expected_version:
+                return False
+            self._write(db, version, writes, kind_versions)
+        return True
+
+    @staticmethod
+    def _write(db, version, writes, kind_versions):
+        db.executemany("INSERT OR REPLACE INTO devices VALUES (?, ?, ?, ?)",
+                       [(kind, location, json.dumps(fields), record_version)
+                        for kind, location, fields, record_version in writes])
+        db.executemany("INSERT OR REPLACE INTO kind_versions VALUES (?, ?)", list(kind_versions.items()))
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+
+    def load_session(self, session_id):
+        row = self._connection().execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save_session(self, session_id, data, idle_timeout, max_sessions):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                       (session_id, json.dumps(data, ensure_ascii=False), now))
+            db.execute("DELETE FROM sessions WHERE last_used < ?", (now - idle_timeout,))
+            db.execute("DELETE FROM sessions WHERE session_id IN "
+                       "(SELECT session_id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (max_sessions,))
+
+    def delete_session(self, session_id):
+        with self._transaction() as db:
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def automations_revision(self):
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'automations'").fetchone()
+        return 0 if row is None else row[0]
+
+    def load_automations(self):
+        """Returns (revision, [rule spec, ...])."""
+        with self._transaction("DEFERRED") as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'automations'").fetchone()
+            specs = [json.loads(spec) for spec, in db.execute("SELECT spec FROM automations ORDER BY rowid")]
+        return 0 if row is None else row[0], specs
+
+    def save_automation(self, rule_id, spec):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO automations VALUES (?, ?)", (rule_id, json.dumps(spec, ensure_ascii=False)))
+            self._bump_automations(db)
+
+    def delete_automation(self, rule_id):
+        """Returns whether the rule existed."""
+        with self._transaction() as db:
+            deleted = db.execute("DELETE FROM automations WHERE id = ?", (rule_id,)).rowcount > 0
+            if deleted:
+                self._bump_automations(db)
+        return deleted
+
+    @staticmethod
+    def _bump_automations(db):
+        db.execute("INSERT INTO meta VALUES ('automations', 1) ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+
+class RespError(Exception):
+    """An error reply from the server."""
+
+
+class RespClient:
+    """Minimal Redis protocol (RESP2) client with one connection per thread.
+
+    Only what the backend below needs: plain commands and pipelines. WATCH/MULTI/EXEC work because a
+    thread always talks to the server over the same connection.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, timeout=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url):
+        parsed = urlparse(url)
+        db = int(parsed.path.strip("/") or 0)
+        password = unquote(parsed.password) if parsed.password else None
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, password)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            self._local.pid = os.getpid()
+            if self.password:
+                self.execute("AUTH", self.password)
+            if self.db:
+                self.execute("SELECT", self.db)
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn[0].close()
+
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def pipeline(self, commands):
+        """Sends every command at once and returns their replies; error replies are returned as RespError."""
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b"".join(_encode(command) for command in commands))
+            return [read_reply(reader) for _ in commands]
+        except (OSError, ConnectionError):
+            self._drop()
+            raise
+
+
+def _encode(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        return RespError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)[:-2]
+        return data.decode("utf-8")
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"Unexpected reply from the server: {line!r}")
+
+
+def _pairs(flat):
+    """HGETALL reply [k1, v1, k2, v2, ...] -> {k1: v1, ...}"""
+    return dict(zip(flat[::2], flat[1::2]))
+
+
+class RedisBackend:
+    def __init__(self, client, prefix="jarvis:"):
+        self.client = client
+        self._version_key = prefix + "version"
+        self._devices_key = prefix + "devices"
+        self._kinds_key = prefix + "kind_versions"
+        self._session_prefix = prefix + "session:"
+        self._automations_key = prefix + "automations"
+        self._automations_revision_key = prefix + "automations_revision"
+
+    def version(self):
+        version = self.client.execute("GET", self._version_key)
+        return None if version is None else int(version)
+
+    def load(self):
+        replies = self.client.pipeline([("MULTI",), ("GET", self._version_key), ("HGETALL", self._devices_key),
+                                        ("HGETALL", self._kinds_key), ("EXEC",)])
+        version, flat_devices, flat_kinds = replies[-1]
+        if version is None:
+            return None
+        devices = {}
+        for field, value in _pairs(flat_devices).items():
+            kind, location = field.split("\t", 1)
+            stored = json.loads(value)
+            devices.setdefault(kind, {})[location] = (stored["fields"], stored["version"])
+        return int(version), devices, {kind: int(v) for kind, v in _pairs(flat_kinds).items()}
+
+    def seed(self, version, devices, kind_versions):
+        writes = [(kind, location, fields, record_version)
+                  for kind, locations in devices.items() for location, (fields, record_version) in locations.items()]
+        self.client.execute("WATCH", self._version_key)
+        if self.client.execute("GET", self._version_key) is not None:
+            self.client.execute("UNWATCH")
+            return
+        # A nil EXEC means another worker seeded first, which is just as good.
+        self._exec(version, writes, kind_versions)
+
+    def commit(self, expected_version, version, writes, kind_versions):
+        self.client.execute("WATCH", self._version_key)
+        current = self.client.execute("GET", self._version_key)
+        if current is None or int(current) != expected_version:
+            self.client.execute("UNWATCH")
+            return False
+        return self._exec(version, writes, kind_versions) is not None
+
+    def _exec(self, version, writes, kind_versions):
+        device_fields = []
+        for kind, location, fields, record_version in writes:
+            device_fields += [f"{kind}\t{location}", json.dumps({"fields": fields, "version": record_version})]
+        commands = [("MULTI",)]
+        if device_fields:
+            commands.append(("HSET", self._devices_key, *device_fields))
+        if kind_versions:
+            commands.append(("HSET", self._kinds_key, *[x for item in kind_versions.items() for x in item]))
+        commands += [("SET", self._version_key, version), ("EXEC",)]
+        return self.client.pipeline(commands)[-1]
+
+    def load_session(self, session_id):
+        data = self.client.execute("GET", self._session_prefix + session_id)
+        return None if data is None else json.loads(data)
+
+    def save_session(self, session_id, data, idle_timeout, max_sessions):
+        # Idle sessions expire on their own; max_sessions is left to the server's maxmemory policy.
+        self.client.execute("SET", self._session_prefix + session_id, json.dumps(data, ensure_ascii=False),
+                            "EX", max(1, int(idle_timeout)))
+
+    def delete_session(self, session_id):
+        self.client.execute("DEL", self._session_prefix + session_id)
+
+    def automations_revision(self):
+        return int(self.client.execute("GET", self._automations_revision_key) or 0)
+
+    def load_automations(self):
+        replies = self.client.pipeline([("MULTI",), ("GET", self._automations_revision_key),
+                                        ("HGETALL", self._automations_key), ("EXEC",)])
+        revision, flat = replies[-1]
+        return int(revision or 0), [json.loads(spec) for spec in _pairs(flat).values()]
+
+    def save_automation(self, rule_id, spec):
+        self.client.pipeline([("MULTI",), ("HSET", self._automations_key, rule_id, json.dumps(spec, ensure_ascii=False)),
+                              ("INCR", self._automations_revision_key), ("EXEC",)])
+
+    def delete_automation(self, rule_id):
+        deleted, _ = self.client.pipeline([("MULTI",), ("HDEL", self._automations_key, rule_id),
+                                           ("INCR", self._automations_revision_key), ("EXEC",)])[-1]
+        return deleted > 0
+
+
+def backend_from_url(url):
+    """Backend for a JARVIS_STORAGE value; None means in-process memory."""
+    if not url or url == "memory":
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith("redis://"):
+        return RedisBackend(RespClient.from_url(url))
+    raise ValueError(f"Unsupported JARVIS_STORAGE '{url}'. Use memory, sqlite:///<path> or redis://<host>:<port>/<db>.")
+
+
+STORAGE_URL = os.getenv("JARVIS_STORAGE", "memory")
+backend = backend_from_url(STORAGE_URL)
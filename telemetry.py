@@ -0,0 +1,215 @@
+"""Timing spans, Prometheus-style metrics, an optional sampling profiler and the app logger.
+
+- `span(stage, name)` times a block into the `jarvis_stage_seconds` histogram. Inside
+  `request_trace()` the spans of one request are also collected, and logged as one line at DEBUG.
+- `metrics.render()` returns every metric in the Prometheus text format (served at /metrics).
+- With JARVIS_PROFILE_SAMPLE_RATE > 0, that fraction of traced requests runs under cProfile and
+  the stats are written to JARVIS_PROFILE_DIR (open them with `python -m pstats <file>`).
+- `log` replaces print() on the hot path. JARVIS_LOG_LEVEL picks what is shown: DEBUG (default,
+  also enables the agent's verbose output), INFO, WARNING, or OFF for production.
+
+Nothing here imports LangChain; the callback handler that times LLM and tool calls lives in
+telemetry_callbacks.py.
+"""
+import bisect
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LOG_LEVEL = os.getenv("JARVIS_LOG_LEVEL", "DEBUG").upper()
+PROFILE_SAMPLE_RATE = float(os.getenv("JARVIS_PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("JARVIS_PROFILE_DIR", "profiles")
+
+
+def _build_logger():
+    logger = logging.getLogger("jarvis")
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    if LOG_LEVEL == "OFF":
+        logger.disabled = True
+    else:
+        logger.setLevel(getattr(logging, LOG_LEVEL, logging.DEBUG))
+    return logger
+
+
+log = _build_logger()
+# The agent's step-by-step console output is only worth its cost while debugging.
+AGENT_VERBOSE = log.isEnabledFor(logging.DEBUG)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values) if value != ""]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        # Counts are stored per bucket and only made cumulative in render(), keeping observe() cheap.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Registers a callable returning extra exposition lines, evaluated on every render()."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+stage_seconds = metrics.histogram(
+    "jarvis_stage_seconds", "Time spent in each stage of handling a request.", labels=("stage", "name"))
+requests_total = metrics.counter(
+    "jarvis_requests_total", "Handled requests by endpoint and the path that answered them.", labels=("endpoint", "path"))
+
+# Spans of the request being handled, as [(stage, name, seconds)], or None outside request_trace().
+_trace = contextvars.ContextVar("jarvis_trace", default=None)
+_profile_lock = threading.Lock()
+
+
+def record(stage, name, seconds):
+    stage_seconds.observe(seconds, stage, name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, name, seconds))
+
+
+@contextmanager
+def span(stage, name=""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, name, time.perf_counter() - start)
+
+
+@contextmanager
+def request_trace(endpoint):
+    """Collects the spans of one request, times it as a whole and maybe profiles it."""
+    trace = []
+    token = _trace.set(trace)
+    profiler = _start_profiler()
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        elapsed = time.perf_counter() - start
+        if profiler is not None:
+            _stop_profiler(profiler, endpoint)
+        _trace.reset(token)
+        stage_seconds.observe(elapsed, "request", endpoint)
+        if log.isEnabledFor(logging.DEBUG):
+            stages = " ".join(f"{stage}{'/' + name if name else ''}={seconds * 1000:.1f}ms"
+                              for stage, name, seconds in trace)
+            log.debug("⏱️ %s %.1fms %s", endpoint, elapsed * 1000, stages)
+
+
+def _start_profiler():
+    # cProfile allows one active profiler per process, so concurrent samples are skipped.
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler, endpoint):
+    try:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{endpoint.strip('/').replace('/', '_') or 'root'}-{time.time_ns()}.prof")
+        profiler.dump_stats(path)
+        log.info("📈 Profile written to %s", path)
+    finally:
+        _profile_lock.release()
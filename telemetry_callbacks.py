@@ -0,0 +1,54 @@
+"""LangChain callback handler that records every LLM call and tool invocation as a telemetry span.
+
+Pass it per call so it reaches every nested run:
+    executor.invoke(inputs, config={"callbacks": [timing_callbacks]})
+"""
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import telemetry
+
+
+class TimingCallbackHandler(BaseCallbackHandler):
+    def __init__(self):
+        self._started = {}  # run_id -> (stage, name, start)
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, stage, name):
+        with self._lock:
+            self._started[run_id] = (stage, name, time.perf_counter())
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is not None:
+            stage, name, start = started
+            telemetry.record(stage, name, time.perf_counter() - start)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        name = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "")
+        self._start(run_id, "llm", name)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        name = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "")
+        self._start(run_id, "llm", name)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name", ""))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+timing_callbacks = TimingCallbackHandler()
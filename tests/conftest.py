@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Tests never touch the network, the state directory or a running automation engine.
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ["JARVIS_STATE_DIR"] = "off"
+os.environ["JARVIS_AUTOMATIONS"] = "off"
+os.environ["JARVIS_WARM_UP"] = "0"
+os.environ.setdefault("JARVIS_LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+import automations
+from automations import AutomationEngine
+from device_state import DeviceStateEngine
+from resp_server import RespServer
+from storage import SQLiteBackend, backend_from_url
+
+
+class RecordingTool:
+    def __init__(self):
+        self.calls = []
+        self.called = threading.Event()
+
+    def invoke(self, args):
+        self.calls.append(args)
+        self.called.set()
+        return "done"
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        yield SQLiteBackend(str(tmp_path / "jarvis.db"))
+        return
+    server = RespServer(port=0).start()
+    yield backend_from_url(server.url)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workers(backend, tmp_path, monkeypatch):
+    """Two workers sharing one store and rules file: the first runs the rules."""
+    monkeypatch.setattr(automations, "SYNC_INTERVAL", 0.05)
+    tool = RecordingTool()
+    path = str(tmp_path / "automations.json")
+    runner = AutomationEngine(DeviceStateEngine(backend=backend), {"lock_door": tool}, path, backend=backend).load()
+    other = AutomationEngine(DeviceStateEngine(backend=backend), {"lock_door": tool}, path, backend=backend).load()
+    return runner, other, tool
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_any_worker_can_add_a_rule_and_the_runner_fires_it(workers):
+    runner, other, tool = workers
+    assert runner.active and not other.active
+
+    rule = other.add({"trigger": {"type": "time", "at": "+1s"},
+                      "actions": [{"tool": "lock_door", "args": {"location": "front"}}]})
+
+    assert [spec["id"] for spec in runner.rules()] == [rule.id]
+    assert tool.called.wait(5)
+    assert tool.calls == [{"location": "front"}]
+    wait_until(lambda: not other.rules())  # a one-shot rule is gone once it fired
+
+
+def test_any_worker_can_delete_a_rule(workers):
+    runner, other, tool = workers
+    rule = runner.add({"trigger": {"type": "time", "at": "07:00"},
+                       "actions": [{"tool": "lock_door", "args": {"location": "front"}}]})
+    revision = other.revision
+
+    assert other.remove(rule.id)
+
+    assert other.revision != revision
+    wait_until(lambda: rule.id not in runner._rules)  # the runner dropped it, not just the store
+    assert not runner.rules()
+    assert not other.remove(rule.id)
+
+
+@pytest.fixture
+def engine():
+    return AutomationEngine(DeviceStateEngine(), {"lock_door": RecordingTool()}, path="off")
+
+
+def state_rule(**trigger):
+    return {"trigger": {"type": "state", "device": "doors", "location": "front", **trigger},
+            "actions": [{"tool": "lock_door", "args": {"location": "front"}}]}
+
+
+@pytest.mark.parametrize("trigger", [
+    {"equals": "onn"},
+    {"equals": "on"},  # a door is locked or unlocked
+    {"field": "temperature", "equals": 22},
+    {"location": "garage", "equals": "unlocked"},
+    {"device": "ac_units", "location": "room 1", "field": "temperature", "equals": 99},
+    {"device": "ac_units", "location": "room 1", "field": "temperature", "equals": "22"},
+])
+def test_state_trigger_values_are_checked_like_writes(engine, trigger):
+    with pytest.raises(ValueError):
+        engine.add(state_rule(**trigger))
+
+    assert not engine.rules()
+
+
+def test_a_reachable_state_trigger_is_accepted(engine):
+    engine.add(state_rule(equals="unlocked", **{"for": 600}))
+    engine.add(state_rule(device="ac_units", location="room 1", field="temperature", equals=28))
+
+    assert len(engine.rules()) == 2
@@ -0,0 +1,59 @@
+import pytest
+
+import tools
+from command_router import command_router
+
+
+@pytest.fixture(autouse=True)
+def fresh_house():
+    before = tools.device_states.snapshot()
+    yield
+    tools.device_states.apply([(kind, location, value if isinstance(value, dict) else {"state": value})
+                               for kind, locations in before.items() for location, value in locations.items()])
+
+
+@pytest.mark.parametrize("message", [
+    "turn off the kitchen light at 7am",
+    "turn on the kitchen light in 10 minutes",
+    "turn on the bathroom light tomorrow",
+    "lock the front door in 10 minutes",
+    "turn off the kitchen light at 19:30",
+    "turn on the kitchen light for an hour",
+    "turn on the kitchen light every day at 7pm",
+    "turn on the kitchen light tonight",
+    "چراغ آشپزخانه را ساعت ۷ روشن کن",
+    "چراغ آشپزخانه را فردا روشن کن",
+    "کولر اتاق ۱ را ده دقیقه دیگر روشن کن",
+])
+def test_timed_commands_go_to_the_agent(message):
+    before = tools.device_states.version
+
+    assert command_router.route(message) is None
+    assert tools.device_states.version == before
+
+
+@pytest.mark.parametrize("message", [
+    "turn on all the lights except the kitchen",
+    "turn on all the lights but the kitchen",
+    "همه چراغ ها را بجز آشپزخانه روشن کن",
+])
+def test_exceptions_go_to_the_agent(message):
+    before = tools.device_states.version
+
+    assert command_router.route(message) is None
+    assert tools.device_states.version == before
+
+
+@pytest.mark.parametrize("message, tool", [
+    ("turn on the light in the kitchen", "toggle_light"),
+    ("turn on all lights", "turn_on_all_lights"),
+    ("turn on the lights on the second floor", "set_group_state"),
+    ("lock the front door", "lock_door"),
+    ("set the ac in room 1 to 23 degrees", "set_ac_temperature"),
+    ("چراغ آشپزخانه را روشن کن", "toggle_light"),
+])
+def test_simple_commands_stay_on_the_fast_path(message, tool):
+    result = command_router.route(message)
+
+    assert result is not None
+    assert result.tool == tool
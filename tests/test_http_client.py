@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import http_client
+from benchmarks.stubs import StubServer
+
+
+@pytest.fixture
+def server():
+    with StubServer() as server:
+        yield server
+
+
+def weather_url(server):
+    return f"{server.url}/data/2.5/weather?q=tehran&appid=stub&units=metric"
+
+
+def test_sequential_calls_reuse_one_connection(server):
+    for _ in range(20):
+        http_client.get(weather_url(server)).raise_for_status()
+
+    assert server.requests == 20
+    assert server.connections == 1
+
+
+def test_bare_requests_open_a_connection_per_call(server):
+    # The baseline the pool is measured against in benchmarks/bench_http_pool.py.
+    for _ in range(5):
+        requests.get(weather_url(server), timeout=5).raise_for_status()
+
+    assert server.connections == 5
+
+
+def test_concurrent_calls_stay_within_the_pool(server):
+    with ThreadPoolExecutor(max_workers=http_client.POOL_SIZE_PER_HOST * 2) as pool:
+        responses = list(pool.map(lambda _: http_client.get(weather_url(server)), range(100)))
+
+    assert all(response.ok for response in responses)
+    assert server.connections <= http_client.POOL_SIZE_PER_HOST
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from device_state import DeviceStateEngine
+from journal import JournalFailedError, StateJournal
+
+
+@pytest.fixture
+def engine(tmp_path):
+    journal = StateJournal(str(tmp_path), snapshot_every=10 ** 6)
+    engine = DeviceStateEngine(journal=journal)
+    yield engine
+    journal.close()
+
+
+def failing_fsync(fd):
+    raise OSError(5, "Input/output error")
+
+
+def test_changes_survive_a_restart(tmp_path):
+    journal = StateJournal(str(tmp_path), snapshot_every=10 ** 6)
+    DeviceStateEngine(journal=journal).update("lamps", "kitchen", state="on")
+    journal.close(snapshot=False)
+
+    recovered = DeviceStateEngine(journal=StateJournal(str(tmp_path)))
+
+    assert recovered.get("lamps", "kitchen").state == "on"
+    assert recovered.version == 1
+
+
+def test_failed_fsync_is_reported_to_the_writer(engine, monkeypatch):
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+
+    with pytest.raises(JournalFailedError):
+        engine.update("lamps", "kitchen", state="on")
+
+
+def test_writes_after_a_failure_are_refused_without_changing_the_state(engine, monkeypatch):
+    heard = []
+    engine.add_listener(lambda version, changed: heard.append(version))
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+    with pytest.raises(JournalFailedError):
+        engine.update("lamps", "kitchen", state="on")
+    monkeypatch.undo()
+    version, state, heard_before = engine.version, engine.get("lamps", "bathroom"), list(heard)
+
+    with pytest.raises(JournalFailedError):
+        engine.update("lamps", "bathroom", state="on")
+
+    assert engine.version == version
+    assert engine.get("lamps", "bathroom") == state
+    assert heard == heard_before
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import core
+from benchmarks.fakes import FakeChatModel
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_agent():
+    core.agent_setup.get().use_llm(FakeChatModel())
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    core.response_cache.get().response_cache.clear()
+
+
+def streamed(message, session_id):
+    events = []
+
+    async def emit(event, data):
+        events.append((event, data))
+
+    asyncio.run(core.stream_answer(message, session_id, emit))
+    return dict(events)["done"]["path"]
+
+
+def test_a_follow_up_is_not_served_to_another_session():
+    core.answer("my name is Sara", "cache-s1")
+    assert core.answer("hello there friend", "cache-s1")[1] == "agent"
+
+    # Same message, different conversation: the agent must see this session's own history.
+    core.answer("my name is Ali", "cache-s2")
+    assert core.answer("hello there friend", "cache-s2")[1] == "agent"
+    assert streamed("hello there friend", "cache-s3") == "agent"
+
+
+def test_first_turns_are_shared_between_sessions():
+    assert core.answer("hello there friend", "cache-s4") == ("You said: hello there friend", "agent")
+
+    assert core.answer("hello there friend", "cache-s5") == ("You said: hello there friend", "cache")
+    assert streamed("hello there friend", "cache-s6") == "cache"
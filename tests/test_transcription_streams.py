@@ -0,0 +1,58 @@
+import pytest
+
+import app as app_module
+from core import transcription_streams
+from speech import StreamRegistry, StubBackend
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def silence(seconds, rate=16000):
+    return b"\0\0" * int(seconds * rate)
+
+
+def open_stream(client, **query):
+    response = client.post("/transcribe/stream", query_string=query)
+    assert response.status_code == 201
+    return response.json["stream_id"]
+
+
+def test_the_server_issues_unguessable_stream_ids(client):
+    first, second = open_stream(client), open_stream(client)
+
+    assert first != second
+    assert len(first) >= 20
+    assert first in transcription_streams._streams and second in transcription_streams._streams
+
+
+def test_a_recording_goes_through_its_issued_id(client):
+    stream_id = open_stream(client, rate=8000)
+
+    assert client.post(f"/transcribe/stream/{stream_id}", data=silence(0.5, 8000)).status_code == 200
+    assert transcription_streams.get(stream_id).sample_rate == 8000
+    assert client.post(f"/transcribe/stream/{stream_id}/end").json == {"text": ""}
+    assert client.post(f"/transcribe/stream/{stream_id}/end").status_code == 404
+
+
+@pytest.mark.parametrize("path", [
+    "/transcribe/stream/chosen-by-client",
+    "/transcribe/stream/chosen-by-client/end",
+    "/voice/stream/chosen-by-client/end",
+])
+def test_unknown_stream_ids_are_rejected(client, path):
+    assert client.post(path, data=silence(0.1)).status_code == 404
+    assert "chosen-by-client" not in transcription_streams._streams
+
+
+def test_out_of_range_rates_are_refused_when_the_stream_opens(client):
+    assert client.post("/transcribe/stream", query_string={"rate": 0}).status_code == 400
+
+
+def test_the_registry_refuses_streams_past_its_limit():
+    registry = StreamRegistry(StubBackend(), max_streams=1)
+
+    assert registry.open() is not None
+    assert registry.open() is None
@@ -0,0 +1,51 @@
+"""The background warm-up started by core.start() must leave nothing for the first request to build.
+
+Each check runs in a fresh interpreter, as a new worker would; the agent answers with
+benchmarks.fakes.FakeChatModel, so no network access or API key is needed.
+
+    python -m pytest tests
+"""
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST_SCRIPT = """
+import json, threading, time
+import core
+from benchmarks.fakes import FakeChatModel
+
+# Records which thread runs the agent builder, and how often.
+builds = []
+build_agent = core.agent_setup._factory
+core.agent_setup._factory = lambda: (builds.append(threading.current_thread().name), build_agent())[1]
+
+core.start(verbose=False)
+deadline = time.monotonic() + 120
+while not all(r.ready for r in (core.fast_router, core.response_cache, core.agent_setup, core.groq_client)):
+    assert time.monotonic() < deadline, "warm-up did not finish"
+    time.sleep(0.01)
+core.agent_setup.get().use_llm(FakeChatModel())
+
+reply, path = core.answer("what time is it?", "warm-start-test")
+print("RESULT " + json.dumps({"path": path, "builds": builds}))
+"""
+
+
+def run(script, **env):
+    env = dict(os.environ, GROQ_API_KEY="test", JARVIS_STATE_DIR="off", JARVIS_AUTOMATIONS="off",
+               JARVIS_LOG_LEVEL="WARNING", **env)
+    output = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True, timeout=300).stdout
+    line = next(line for line in output.splitlines() if "RESULT " in line)
+    return json.loads(line[line.index("RESULT ") + len("RESULT "):])
+
+
+def test_first_request_after_start_does_not_build_the_agent():
+    result = run(FIRST_REQUEST_SCRIPT, JARVIS_WARM_UP="1")
+
+    assert result["path"] == "agent"
+    # Built exactly once, by the warm-up thread; the request found it ready.
+    assert result["builds"] == ["jarvis-warm-up"]
@@ -0,0 +1,101 @@
+"""Picks the tools worth binding to the LLM for one message.
+
+Every bound tool adds its JSON schema to the prompt, so binding all of them for "turn the TV
+volume up" sends a few thousand tokens the model never needs. Tools are indexed by category (the
+device types in tools.TOOL_DEVICE_KINDS plus weather, news, date/time, scenes, device groups and automations) and by the words
+of their names and docstrings. A message gets the tools of every category it mentions plus
+get_device_status. When nothing matches (e.g. "turn it off" as a follow-up) all tools are bound,
+so pruning never hides a tool the model could need.
+"""
+import re
+from collections import namedtuple
+
+from admission import PRIORITY_DEVICE, PRIORITY_LOW, PRIORITY_NORMAL
+from command_router import command_router
+from tools import TOOL_DEVICE_KINDS
+
+# Words that point at a category, on top of the device words command_router already knows.
+CATEGORY_KEYWORDS = {
+    "ac_units": ["hot", "cold", "warm", "cool", "heat", "گرم", "سرد", "گرمه", "سرده"],
+    "weather": ["weather", "forecast", "outside", "rain", "sunny", "cloudy", "هوا", "بارون", "باران"],
+    "news": ["news", "headline", "headlines", "خبر", "اخبار"],
+    "datetime": ["time", "date", "day", "today", "clock", "schedule", "ساعت", "تاریخ", "امروز"],
+    "scenes": ["guest", "guests", "party", "مهمان", "مهمون"],
+    "groups": ["floor", "every", "everything", "whole", "طبقه", "همه", "تمام"],
+    "automations": ["schedule", "every day", "daily", "minute", "hour", "later", "tomorrow", "when", "if", "automation",
+                    "دقیقه", "ساعت", "بعد", "فردا", "اگر", "وقتی", "هر روز", "خودکار"],
+}
+CATEGORY_TOOLS = {
+    "weather": ("get_weather",),
+    "news": ("get_latest_news",),
+    "datetime": ("get_current_datetime",),
+    "scenes": ("activate_guest_mode",),
+    "groups": ("set_group_state",),
+    "automations": ("schedule_tool_call", "add_state_automation", "list_automations", "delete_automation",
+                    "get_current_datetime"),
+}
+ALWAYS_BOUND = ("get_device_status",)
+# Categories that do not touch a device; messages about nothing else wait behind device commands.
+CHATTER_CATEGORIES = {"weather", "news", "datetime"}
+
+# Docstring words too common to say anything about which tool is meant.
+_STOP_WORDS = {
+    "the", "a", "an", "in", "on", "off", "of", "to", "for", "and", "or", "is", "are", "be", "it", "its",
+    "this", "that", "use", "valid", "location", "locations", "specific", "specified", "should", "only",
+    "turns", "turn", "sets", "set", "between", "also", "currently", "given", "house", "home", "all",
+    "can", "into", "function", "gets", "puts", "returns", "fetches", "default", "code", "current", "type",
+    "device", "devices", "front", "back", "bathroom", "kitchen", "room",
+}
+
+Selection = namedtuple("Selection", ["tools", "categories", "pruned"])
+
+
+def _words(text):
+    return set(re.findall(r"[a-z]+", text.lower().replace("_", " ")))
+
+
+class ToolSelector:
+    def __init__(self, tools, tool_kinds=TOOL_DEVICE_KINDS):
+        self.tools = list(tools)
+        self._tools_by_name = {t.name: t for t in self.tools}
+        self._category_tools = dict(CATEGORY_TOOLS)
+        for name, kinds in tool_kinds.items():
+            # Single-device tools belong to their device type; guest mode and status are handled separately.
+            if kinds != "*" and len(kinds) == 1:
+                self._category_tools.setdefault(kinds[0], ())
+                self._category_tools[kinds[0]] += (name,)
+        self._category_patterns = {
+            category: re.compile("|".join(r"(?<!\w)" + re.escape(word) for word in words))
+            for category, words in CATEGORY_KEYWORDS.items()
+        }
+        # word -> tool names, from tool names and docstrings; words shared by many tools are dropped.
+        index = {}
+        for t in self.tools:
+            for word in _words(t.name) | _words(t.description):
+                if word not in _STOP_WORDS and len(word) > 2:
+                    index.setdefault(word, set()).add(t.name)
+        self._word_index = {word: names for word, names in index.items() if len(names) <= 3}
+
+    def select(self, user_input):
+        """Returns a Selection with the tools to bind (in their original order) for this message."""
+        mentions = command_router.mentions(user_input)
+        categories = set(mentions.kinds)
+        categories.update(category for category, pattern in self._category_patterns.items()
+                          if pattern.search(mentions.text))
+        names = set(ALWAYS_BOUND)
+        for category in categories:
+            names.update(self._category_tools.get(category, ()))
+        for word in _words(mentions.text):
+            names.update(self._word_index.get(word, ()))
+
+        if names == set(ALWAYS_BOUND):
+            return Selection(tuple(self.tools), (), False)
+        selected = tuple(t for t in self.tools if t.name in names)
+        return Selection(selected, tuple(sorted(categories)), len(selected) < len(self.tools))
+
+    def priority(self, user_input):
+        """Admission priority of a message (see admission.py): device commands first, weather/news last."""
+        categories = set(self.select(user_input).categories)
+        if categories - CHATTER_CATEGORIES:
+            return PRIORITY_DEVICE
+        return PRIORITY_LOW if categories else PRIORITY_NORMAL
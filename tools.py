@@ -1,115 +1,215 @@
 import os
 import requests
 import json
+import time
 from datetime import datetime
-from langchain_core.tools import tool
+from typing import Annotated
 
+from langchain_core.tools import tool
 
-device_states = {
-    "lamps": {
-        "kitchen": "off",
-        "bathroom": "off",
-        "room 1": "off",
-        "room 2": "off",
-    },
-    "ac_units": {
-        "room 1": {"state": "off", "temperature": 24},
-        "kitchen": {"state": "off", "temperature": 25},
-    },
-    "tv": {
-        "living_room": {"state": "off", "channel": 1, "volume": 20}
-    },
-    "doors": {
-        "front": "locked",
-        "back": "locked"
-    },
-    "blinds": {
-        "kitchen": "closed",
-        "room 1": "closed"
-    },
-    "coffee_machine": {
-        "kitchen": "off"
-    }
+import http_client
+import storage
+from automations import AutomationEngine, next_daily, parse_time
+from cache import TTLCache
+from device_registry import SCHEMA_LOCATION_LIMIT, STATE_CAPABILITY, registry_from_env
+from device_state import DEVICE_TYPES, DeviceStateEngine
+from journal import journal_from_env
+from state_events import ChangeHub
+
+
+# Rooms, floors, aliases and capabilities of every device; see device_registry.py.
+device_registry = registry_from_env()
+# Shared by every tool and both Flask apps; see device_state.py. With JARVIS_STORAGE set, also
+# shared by every worker process (see storage.py); otherwise persisted to JARVIS_STATE_DIR (see journal.py).
+device_states = DeviceStateEngine(device_registry.initial_states(), backend=storage.backend,
+                                  journal=journal_from_env() if storage.backend is None else None)
+# Pushes every change to subscribed UIs and controllers; see state_events.py.
+device_events = ChangeHub(device_states)
+
+_DEVICE_LABELS = {
+    "lamps": "Light",
+    "ac_units": "AC",
+    "tv": "TV",
+    "doors": "Door",
+    "blinds": "Blinds",
+    "coffee_machine": "Coffee machine",
 }
 
 
-@tool
-def toggle_light(location: str, state: str) -> str:
-    """Turns a light on or off in a specific location. Use this to control lamps.
-    Valid locations are ['kitchen', 'bathroom', 'room 1', 'room 2'].
-    Valid states are 'on' or 'off'.
+def device_tool(kind=None, **descriptions):
+    """Like @tool, with argument descriptions written from the device registry, so the schema the
+    LLM sees lists the devices that exist. `kind` describes the `location` argument."""
+    def decorate(func):
+        if kind is not None:
+            descriptions["location"] = device_registry.describe_locations(kind)
+        for name, text in descriptions.items():
+            func.__annotations__[name] = Annotated[func.__annotations__[name], text]
+        return tool(func)
+    return decorate
+
+
+def resolve_location(kind, location):
+    """Returns (location, None) for a device of `kind` called `location`, or (None, error message).
+
+    An empty location picks the only device of that type, if there is just one.
     """
-    location = location.lower()
+    if not location and len(device_registry.locations(kind)) == 1:
+        return device_registry.locations(kind)[0], None
+    resolved = device_registry.resolve(kind, location)
+    if resolved is not None:
+        return resolved, None
+    candidates = device_registry.suggest(kind, location)
+    hint = f" Did you mean {' or '.join(repr(c) for c in candidates)}?" if candidates else ""
+    locations = device_registry.locations(kind)
+    valid = (f" Valid locations are: {', '.join(locations)}." if len(locations) <= SCHEMA_LOCATION_LIMIT
+             else "")
+    return None, f"Error: {_DEVICE_LABELS[kind]} location '{location}' not found.{hint}{valid}"
+
+
+@device_tool("lamps", state="'on' or 'off'.")
+def toggle_light(location: str, state: str) -> str:
+    """Turns a light on or off in a specific location. Use this to control lamps."""
+    location, error = resolve_location("lamps", location)
+    if error:
+        return error
     state = state.lower()
-    if location not in device_states["lamps"]:
-        return f"Error: Light location '{location}' not found. Valid locations are: kitchen, bathroom, room 1, room 2."
     if state not in ["on", "off"]:
         return f"Error: Invalid state '{state}'. Must be 'on' or 'off'."
 
-    device_states["lamps"][location] = state
+    device_states.update("lamps", location, state=state)
     return f"Successfully turned the {location} light {state}."
 
 
-@tool
+@device_tool("ac_units")
 def turn_on_ac(location: str) -> str:
-    """Turns on an AC unit in a specific location.
-    Valid locations are ['room 1', 'kitchen'].
-    """
-    location = location.lower()
-    if location not in device_states["ac_units"]:
-        return f"Error: AC location '{location}' not found. Valid locations are: room 1, kitchen."
+    """Turns on an AC unit in a specific location."""
+    location, error = resolve_location("ac_units", location)
+    if error:
+        return error
 
-    if device_states["ac_units"][location]["state"] == "on":
+    change = device_states.update("ac_units", location, state="on")
+    if change.old.state == "on":
         return f"The AC in {location} is already on."
-
-    device_states["ac_units"][location]["state"] = "on"
     return f"Successfully turned the AC in {location} on."
 
 
-@tool
+@device_tool("ac_units")
 def turn_off_ac(location: str) -> str:
-    """Turns off an AC unit in a specific location.
-    Valid locations are ['room 1', 'kitchen'].
-    """
-    location = location.lower()
-    if location not in device_states["ac_units"]:
-        return f"Error: AC location '{location}' not found. Valid locations are: room 1, kitchen."
+    """Turns off an AC unit in a specific location."""
+    location, error = resolve_location("ac_units", location)
+    if error:
+        return error
 
-    if device_states["ac_units"][location]["state"] == "off":
+    change = device_states.update("ac_units", location, state="off")
+    if change.old.state == "off":
         return f"The AC in {location} is already off."
-
-    device_states["ac_units"][location]["state"] = "off"
     return f"Successfully turned the AC in {location} off."
 
 
-@tool
+@device_tool("ac_units")
 def set_ac_temperature(location: str, temperature: int) -> str:
     """Sets the temperature for an AC unit in a specific location.
-    Valid locations are ['room 1', 'kitchen'].
     This function also turns the AC on if it's off.
     """
-    location = location.lower()
-    if location not in device_states["ac_units"]:
-        return f"Error: AC location '{location}' not found. Valid locations are: room 1, kitchen."
-
-    device_states["ac_units"][location]["temperature"] = temperature
-    if device_states["ac_units"][location]["state"] == "off":
-        device_states["ac_units"][location]["state"] = "on"
+    location, error = resolve_location("ac_units", location)
+    if error:
+        return error
+    error = device_states.validate("ac_units", location, {"temperature": temperature})
+    if error:
+        return f"Error: {error}"
+
+    change = device_states.update("ac_units", location, state="on", temperature=temperature)
+    if change.old.state == "off":
         return f"Successfully set AC in {location} to {temperature}°C and turned it on."
 
     return f"Successfully set AC temperature in {location} to {temperature}°C."
 
 
-@tool
-def get_device_status(device_type: str = "all") -> str:
-    """Gets the current status of all devices or a specific type of device.
-    'device_type' can be 'all', 'lamps', 'ac_units', 'tv', 'doors', 'blinds', 'security_system', 'music_player', 'coffee_machine'.
-    """
+@device_tool(device_type=f"'all' or one of: {', '.join(device_registry.kinds())}.",
+             room=device_registry.describe_rooms())
+def get_device_status(device_type: str = "all", room: str = "") -> str:
+    """Gets the current status of all devices or a specific type of device, optionally in one room."""
+    if device_type != "all" and device_type not in device_states.kinds():
+        return f"Error: Unknown device type '{device_type}'."
+    if room:
+        room_name = device_registry.resolve_room(room)
+        if room_name is None:
+            return f"Error: Room '{room}' not found."
+        kind = None if device_type == "all" else device_type
+        status = {}
+        for device in device_registry.select(kind=kind, room=room_name):
+            status.setdefault(device.kind, {})[device.location] = device_states.get(device.kind, device.location).to_json()
+        return f"Status in {room_name}: {json.dumps(status, indent=2)}"
     if device_type == "all":
-        return json.dumps(device_states, indent=2)
-    if device_type in device_states:
-        return f"Status for {device_type}: {json.dumps(device_states[device_type], indent=2)}"
-    return f"Error: Unknown device type '{device_type}'."
+        return json.dumps(device_states.snapshot(), indent=2)
+    return f"Status for {device_type}: {json.dumps(device_states.snapshot(device_type), indent=2)}"
+
+
+@device_tool(state="'on'/'off' (lights, AC, TV, coffee machine), 'open'/'closed' (blinds) or 'locked'/'unlocked' (doors).",
+             device_type=f"'all' for every type that supports the state, or one of: {', '.join(device_registry.kinds())}.",
+             room=device_registry.describe_rooms(),
+             floor=f"Only the devices on this floor; -1 for every floor. Floors: {device_registry.floors()}.")
+def set_group_state(state: str, device_type: str = "all", room: str = "", floor: int = -1) -> str:
+    """Sets a whole group of devices at once, e.g. all lights on floor 2 or everything in the kitchen.
+    All matching devices change together or not at all.
+    """
+    state = state.lower()
+    capability = STATE_CAPABILITY.get(state)
+    if capability is None:
+        return f"Error: Invalid state '{state}'."
+    kind = None if device_type == "all" else device_type
+    if kind is not None:
+        if kind not in device_registry.kinds():
+            return f"Error: Unknown device type '{device_type}'."
+        if state not in DEVICE_TYPES[kind][1]:
+            return f"Error: {_DEVICE_LABELS[kind]} cannot be '{state}'. Valid states: {', '.join(DEVICE_TYPES[kind][1])}."
+    room_name = None
+    if room:
+        room_name = device_registry.resolve_room(room)
+        if room_name is None:
+            return f"Error: Room '{room}' not found."
+    devices = device_registry.select(kind=kind, room=room_name, floor=None if floor < 0 else floor,
+                                     capability=capability)
+    where = "".join([f" in {room_name}" if room_name else "", f" on floor {floor}" if floor >= 0 else ""])
+    if not devices:
+        return f"Error: No matching devices found{where}."
+
+    changes = device_states.apply([(device.kind, device.location, {"state": state}) for device in devices])
+    changed = sum(change.new != change.old for change in changes)
+    return f"Set {len(changes)} device(s){where} to {state}; {changed} of them changed."
+
+
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "http://api.openweathermap.org")
+NEWSAPI_BASE_URL = os.getenv("NEWSAPI_BASE_URL", "https://newsapi.org")
+
+# Weather and news change slowly, so answers are shared between users for a few minutes.
+weather_cache = TTLCache(
+    "weather",
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", 600)),
+    stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL", 1800)),
+)
+news_cache = TTLCache(
+    "news",
+    ttl=float(os.getenv("NEWS_CACHE_TTL", 900)),
+    stale_ttl=float(os.getenv("NEWS_CACHE_STALE_TTL", 3600)),
+)
+
+
+def _fetch_weather(city, api_key):
+    url = f"{OPENWEATHER_BASE_URL}/data/2.5/weather?q={city}&appid={api_key}&units=metric"
+    response = http_client.get(url)
+    response.raise_for_status()
+    data = response.json()
+    return data['weather'][0]['description'], data['main']['temp']
+
+
+def _fetch_headlines(country, api_key):
+    url = f"{NEWSAPI_BASE_URL}/v2/top-headlines?country={country}&apiKey={api_key}"
+    response = http_client.get(url)
+    response.raise_for_status()
+    data = response.json()
+    articles = data.get("articles", [])
+    return [f"- {article['title']}" for article in articles[:5]]
 
 
 @tool
@@ -120,13 +220,8 @@ def get_weather() -> str:
     if not api_key:
         return "Error: OpenWeatherMap API key not found."
 
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        weather_desc = data['weather'][0]['description']
-        temp = data['main']['temp']
+        weather_desc, temp = weather_cache.get_or_load(city, lambda: _fetch_weather(city, api_key))
         return f"The current weather in {city} is {temp}°C with {weather_desc}."
     except requests.exceptions.RequestException as e:
         return f"Error fetching weather: {e}"
@@ -139,13 +234,9 @@ def get_latest_news(country: str = "us") -> str:
     if not api_key:
         return "Error: NewsAPI key not found."
 
-    url = f"https://newsapi.org/v2/top-headlines?country={country}&apiKey={api_key}"
+    country = country.lower()
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        articles = data.get("articles", [])
-        headlines = [f"- {article['title']}" for article in articles[:5]]
+        headlines = news_cache.get_or_load(country, lambda: _fetch_headlines(country, api_key))
         if not headlines:
             return f"No news found for country code '{country}'."
         return "Here are the latest headlines:\n" + "\n".join(headlines)
@@ -160,147 +251,249 @@ def get_current_datetime() -> str:
     return f"The current date and time is {now.strftime('%Y-%m-%d %H:%M:%S')}."
 
 
-@tool
+@device_tool("tv")
 def turn_on_tv(location: str) -> str:
-    """Turns on the TV in the specified location. The only valid location is 'living_room'."""
-    location = location.lower()
-    if location != "living_room":
-        return f"Error: TV location '{location}' not found. The only valid location is 'living_room'."
+    """Turns on the TV in the specified location."""
+    location, error = resolve_location("tv", location)
+    if error:
+        return error
 
-    if device_states["tv"][location]["state"] == "on":
+    change = device_states.update("tv", location, state="on")
+    if change.old.state == "on":
         return f"The TV in {location} is already on."
-
-    device_states["tv"][location]["state"] = "on"
     return f"The TV in {location} is now turned on."
 
 
-@tool
+@device_tool("tv")
 def turn_off_tv(location: str) -> str:
-    """Turns off the TV in the specified location. The only valid location is 'living_room'."""
-    location = location.lower()
-    if location != "living_room":
-        return f"Error: TV location '{location}' not found. The only valid location is 'living_room'."
+    """Turns off the TV in the specified location."""
+    location, error = resolve_location("tv", location)
+    if error:
+        return error
 
-    if device_states["tv"][location]["state"] == "off":
+    change = device_states.update("tv", location, state="off")
+    if change.old.state == "off":
         return f"The TV in {location} is already off."
-
-    device_states["tv"][location]["state"] = "off"
     return f"The TV in {location} is now turned off."
 
 
-@tool
+@device_tool("tv")
 def change_tv_channel(location: str, channel: int) -> str:
-    """Changes the channel of the TV in the specified location. The only valid location is 'living_room'.
+    """Changes the channel of the TV in the specified location.
     This function also turns the TV on if it's currently off.
     """
-    location = location.lower()
-    if location != "living_room":
-        return f"Error: TV location '{location}' not found. The only valid location is 'living_room'."
-
-    if device_states["tv"][location]["state"] == "off":
-        device_states["tv"][location]["state"] = "on"
-
-    device_states["tv"][location]["channel"] = channel
+    location, error = resolve_location("tv", location)
+    if error:
+        return error
+    error = device_states.validate("tv", location, {"channel": channel})
+    if error:
+        return f"Error: {error}"
+
+    device_states.update("tv", location, state="on", channel=channel)
     return f"Changed the TV channel in {location} to channel {channel}."
 
 
-@tool
+@device_tool("tv")
 def set_tv_volume(location: str, volume: int) -> str:
-    """Sets the volume of the TV in a specified location. The only valid location is 'living_room'.
+    """Sets the volume of the TV in a specified location.
     Volume should be between 0 and 100.
     """
-    location = location.lower()
-    if location != "living_room":
-        return f"Error: TV location '{location}' not found. The only valid location is 'living_room'."
-    if not 0 <= volume <= 100:
-        return "Error: Volume must be between 0 and 100."
-
-    device_states["tv"][location]["volume"] = volume
+    location, error = resolve_location("tv", location)
+    if error:
+        return error
+    error = device_states.validate("tv", location, {"volume": volume})
+    if error:
+        return f"Error: {error}"
+
+    device_states.update("tv", location, volume=volume)
     return f"Successfully set TV volume in {location} to {volume}."
 
 
-@tool
+@device_tool("doors")
 def lock_door(location: str) -> str:
-    """Locks the door in the specified location. Valid locations: ['front', 'back']"""
-    location = location.lower()
-    if location not in device_states["doors"]:
-        return f"Error: Door location '{location}' not found."
-    device_states["doors"][location] = "locked"
+    """Locks the door in the specified location."""
+    location, error = resolve_location("doors", location)
+    if error:
+        return error
+    device_states.update("doors", location, state="locked")
     return f"The {location} door is now locked."
 
 
-@tool
+@device_tool("doors")
 def unlock_door(location: str) -> str:
-    """Unlocks the door in the specified location. Valid locations: ['front', 'back']"""
-    location = location.lower()
-    if location not in device_states["doors"]:
-        return f"Error: Door location '{location}' not found."
-    device_states["doors"][location] = "unlocked"
+    """Unlocks the door in the specified location."""
+    location, error = resolve_location("doors", location)
+    if error:
+        return error
+    device_states.update("doors", location, state="unlocked")
     return f"The {location} door is now unlocked."
 
 
-@tool
+@device_tool("blinds")
 def open_blinds(location: str) -> str:
-    """Opens the blinds in the specified location. Valid locations: ['kitchen', 'room 1']"""
-    location = location.lower()
-    if location not in device_states["blinds"]:
-        return f"Error: Blinds location '{location}' not found."
-    device_states["blinds"][location] = "open"
+    """Opens the blinds in the specified location."""
+    location, error = resolve_location("blinds", location)
+    if error:
+        return error
+    device_states.update("blinds", location, state="open")
     return f"The blinds in {location} are now open."
 
 
-@tool
+@device_tool("blinds")
 def close_blinds(location: str) -> str:
-    """Closes the blinds in the specified location. Valid locations: ['kitchen', 'room 1']"""
-    location = location.lower()
-    if location not in device_states["blinds"]:
-        return f"Error: Blinds location '{location}' not found."
-    device_states["blinds"][location] = "closed"
+    """Closes the blinds in the specified location."""
+    location, error = resolve_location("blinds", location)
+    if error:
+        return error
+    device_states.update("blinds", location, state="closed")
     return f"The blinds in {location} are now closed."
 
 
 @tool
 def turn_off_all_lights(confirm: bool = True) -> str:
     """Turns off all lights in the house."""
-    for light in device_states["lamps"]:
-        device_states["lamps"][light] = "off"
+    device_states.apply([("lamps", light, {"state": "off"}) for light in device_states.locations("lamps")])
     return "All lights have been turned off."
 
 
 @tool
 def turn_on_all_lights(confirm: bool = True) -> str:
-    """Turns off all lights in the house."""
-    for light in device_states["lamps"]:
-        device_states["lamps"][light] = "on"
+    """Turns on all lights in the house."""
+    device_states.apply([("lamps", light, {"state": "on"}) for light in device_states.locations("lamps")])
     return "All lights have been turned on."
 
-@tool
-def start_coffee_machine(confirm: bool = True) -> str:
-    """Starts the coffee machine in the kitchen."""
-    if device_states["coffee_machine"]["kitchen"] == "on":
+@device_tool("coffee_machine")
+def start_coffee_machine(location: str = "", confirm: bool = True) -> str:
+    """Starts the coffee machine. The location can be left empty when there is only one."""
+    location, error = resolve_location("coffee_machine", location)
+    if error:
+        return error
+    change = device_states.update("coffee_machine", location, state="on")
+    if change.old.state == "on":
         return "The coffee machine is already on."
-    device_states["coffee_machine"]["kitchen"] = "on"
     return "The coffee machine has been started. Enjoy your coffee soon!"
 
 
-@tool
-def stop_coffee_machine(confirm: bool = True) -> str:
-    """Stops the coffee machine in the kitchen."""
-    if device_states["coffee_machine"]["kitchen"] == "off":
+@device_tool("coffee_machine")
+def stop_coffee_machine(location: str = "", confirm: bool = True) -> str:
+    """Stops the coffee machine. The location can be left empty when there is only one."""
+    location, error = resolve_location("coffee_machine", location)
+    if error:
+        return error
+    change = device_states.update("coffee_machine", location, state="off")
+    if change.old.state == "off":
         return "The coffee machine is already off."
-    device_states["coffee_machine"]["kitchen"] = "off"
     return "The coffee machine has been stopped."
 
 @tool
 def activate_guest_mode(confirm: bool = True) -> str:
     """Puts the home into guest mode: turns on room 1 light and AC, opens all blinds, and unlocks the front door."""
-    if "room 1" in device_states["lamps"]:
-        device_states["lamps"]["room 1"] = "on"
-    if "room 1" in device_states["ac_units"]:
-        device_states["ac_units"]["room 1"]["state"] = "on"
-        device_states["ac_units"]["room 1"]["temperature"] = 22
-    for blind in device_states["blinds"]:
-        device_states["blinds"][blind] = "open"
-    if "front" in device_states["doors"]:
-        device_states["doors"]["front"] = "unlocked"
-    return "Guest mode activated: Room 1 light and AC are on, all blinds are open, and the front door is unlocked."
\ No newline at end of file
+    operations = []
+    if device_states.get("lamps", "room 1") is not None:
+        operations.append(("lamps", "room 1", {"state": "on"}))
+    if device_states.get("ac_units", "room 1") is not None:
+        operations.append(("ac_units", "room 1", {"state": "on", "temperature": 22}))
+    for blind in device_states.locations("blinds"):
+        operations.append(("blinds", blind, {"state": "open"}))
+    if device_states.get("doors", "front") is not None:
+        operations.append(("doors", "front", {"state": "unlocked"}))
+    device_states.apply(operations)
+    return "Guest mode activated: Room 1 light and AC are on, all blinds are open, and the front door is unlocked."
+
+
+@tool
+def schedule_tool_call(tool_name: str, arguments: dict, at: str, daily: bool = False) -> str:
+    """Runs a device tool later, e.g. "turn on the AC in room 1 at 7am" is
+    tool_name='turn_on_ac', arguments={"location": "room 1"}, at='07:00'.
+    'at' is a time of day ('07:00', '7am', '19:30') or a delay from now ('+10m', '+30s', '+2h').
+    Set daily=True to repeat it every day at that time.
+    """
+    try:
+        kind, value = parse_time(at)
+        if kind == "daily" and daily:
+            trigger = {"type": "time", "at": value, "daily": True}
+        else:
+            trigger = {"type": "time", "at_ts": value if kind == "once" else next_daily(value, time.time())}
+        rule = automations.add({"trigger": trigger, "actions": [{"tool": tool_name, "args": arguments}],
+                                "description": f"{tool_name} {arguments} at {at}{' daily' if daily else ''}"})
+    except ValueError as e:
+        return f"Error: {e}"
+    when = f"every day at {trigger['at']}" if "at" in trigger else datetime.fromtimestamp(trigger["at_ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    return f"Scheduled {tool_name} ({rule.id}) {when}."
+
+
+@device_tool(device_type=f"One of: {', '.join(device_registry.kinds())}.")
+def add_state_automation(device_type: str, location: str, state: str, tool_name: str, arguments: dict,
+                         for_minutes: float = 0) -> str:
+    """Runs a device tool when a device reaches a state, or once it has stayed in it for `for_minutes`.
+    E.g. "if the front door is unlocked for 10 minutes, lock it" is device_type='doors', location='front',
+    state='unlocked', tool_name='lock_door', arguments={"location": "front"}, for_minutes=10.
+    """
+    if device_type not in device_registry.kinds():
+        return f"Error: Unknown device type '{device_type}'."
+    location, error = resolve_location(device_type, location)
+    if error:
+        return error
+    try:
+        rule = automations.add({
+            "trigger": {"type": "state", "device": device_type, "location": location, "equals": state.lower(),
+                        "for": for_minutes * 60},
+            "actions": [{"tool": tool_name, "args": arguments}],
+            "description": f"{tool_name} {arguments} when {device_type}/{location} is {state}"
+                           + (f" for {for_minutes:g} min" if for_minutes else ""),
+        })
+    except ValueError as e:
+        return f"Error: {e}"
+    return f"Automation {rule.id} added: {rule.description}."
+
+
+@tool
+def list_automations() -> str:
+    """Lists the scheduled and state-triggered automations."""
+    rules = automations.rules()
+    if not rules:
+        return "There are no automations."
+    return "\n".join(f"- {rule['id']}: {rule['description'] or rule['trigger']}" for rule in rules)
+
+
+@tool
+def delete_automation(automation_id: str) -> str:
+    """Deletes an automation by the id list_automations shows."""
+    if automations.remove(automation_id):
+        return f"Automation {automation_id} deleted."
+    return f"Error: No automation with id '{automation_id}'."
+
+
+# Device types each tool reads or writes, used to keep calls on the same devices in order when
+# tool calls run concurrently. "*" means it depends on the `device_type` argument.
+TOOL_DEVICE_KINDS = {
+    "toggle_light": ("lamps",),
+    "turn_on_all_lights": ("lamps",),
+    "turn_off_all_lights": ("lamps",),
+    "turn_on_ac": ("ac_units",),
+    "turn_off_ac": ("ac_units",),
+    "set_ac_temperature": ("ac_units",),
+    "turn_on_tv": ("tv",),
+    "turn_off_tv": ("tv",),
+    "change_tv_channel": ("tv",),
+    "set_tv_volume": ("tv",),
+    "lock_door": ("doors",),
+    "unlock_door": ("doors",),
+    "open_blinds": ("blinds",),
+    "close_blinds": ("blinds",),
+    "start_coffee_machine": ("coffee_machine",),
+    "stop_coffee_machine": ("coffee_machine",),
+    "activate_guest_mode": ("lamps", "ac_units", "blinds", "doors"),
+    "get_device_status": "*",
+    "set_group_state": "*",
+}
+
+# Tools that change nothing. A reply is only stored in the response cache when every tool the agent
+# called for it is one of these (see core.py).
+READ_ONLY_TOOLS = frozenset({
+    "get_device_status", "get_weather", "get_latest_news", "get_current_datetime", "list_automations",
+})
+
+# Time- and state-triggered device tool calls; see automations.py.
+automations = AutomationEngine(device_states, {name: globals()[name] for name in TOOL_DEVICE_KINDS},
+                               backend=storage.backend).load()